@@ -1,11 +1,19 @@
+import atexit
+import hashlib
+import heapq
+import io
 import json
+import secrets
+import sqlite3
+import time
 import pytz  
-import random
 import string
 import asyncio
 from datetime import datetime, timedelta
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import ContextTypes
+from itertools import islice
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, MessageEntity
+from telegram.error import BadRequest, NetworkError, RetryAfter, TimedOut
+from telegram.ext import Application, ContextTypes
 
 WAITING_FOR_ACCESS_CODE = "WAITING_FOR_ACCESS_CODE"
 CHOOSING = "CHOOSING"
@@ -34,28 +42,665 @@ WAITING_GROUP_NAME = "WAITING_GROUP_NAME"
 WAITING_GROUP_USER = "WAITING_GROUP_USER"
 WAITING_CODE_NUMBER = "WAITING_CODE_NUMBER"
 
+BROADCAST_RATE = 30  # Messages par seconde, limite globale de Telegram
+BROADCAST_CHAT_INTERVAL = 1.0  # Secondes minimum entre deux messages vers un même chat
+BROADCAST_CONCURRENCY = 20  # Envois simultanés au maximum
+BROADCAST_MAX_RETRIES = 3  # Nouvelles tentatives après un RetryAfter ou une erreur réseau
+PROGRESS_UPDATE_INTERVAL = 3  # Secondes entre deux mises à jour du compteur de progression
+OUTBOX_MAX_ATTEMPTS = 5  # Tentatives par envoi de la file persistante avant abandon (hors RetryAfter)
+OUTBOX_ERROR_BACKOFF = 5  # Secondes de pause de la file d'envoi après une erreur de base
+ACCESS_CODES_CHECK_INTERVAL = 2  # Secondes entre deux vérifications des modifications externes des codes d'accès
+SAVE_DEBOUNCE_DELAY = 1.0  # Secondes d'attente pour regrouper les sauvegardes successives
+POLL_REFRESH_INTERVAL = 5  # Secondes minimum entre deux mises à jour des messages d'un même sondage
+CODE_ALPHABET = string.ascii_uppercase + string.digits
+CODE_LENGTH = 8
+MAX_CODES_PER_BATCH = 5000  # Codes générés au maximum en une seule demande
+CODES_INLINE_LIMIT = 20  # Au-delà, les codes sont envoyés dans un fichier plutôt que dans le message
+
+# Dictionnaires persistés en base : nom -> attribut d'AdminFeatures
+PERSISTED_STORES = {
+    'users': '_users',
+    'access_codes': '_access_codes',
+    'broadcasts': 'broadcasts',
+    'polls': 'polls',
+}
+
+class RateLimiter:
+    """Seau à jetons global doublé d'un intervalle minimal par chat"""
+
+    def __init__(self, rate: float = BROADCAST_RATE, chat_interval: float = BROADCAST_CHAT_INTERVAL):
+        self.rate = rate
+        self.chat_interval = chat_interval
+        self._tokens = float(rate)
+        self._updated = None
+        self._paused_until = 0.0
+        self._next_by_chat = {}
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        """Suspend tous les envois (flood control signalé par Telegram)"""
+        loop = asyncio.get_running_loop()
+        self._paused_until = max(self._paused_until, loop.time() + seconds)
+
+    async def acquire(self, chat_id=None):
+        """Attend le droit d'envoyer un message au chat donné"""
+        loop = asyncio.get_running_loop()
+
+        # Réserver un créneau pour ce chat avant de consommer un jeton global
+        if chat_id is not None:
+            now = loop.time()
+            slot = max(now, self._next_by_chat.get(chat_id, 0.0))
+            self._next_by_chat[chat_id] = slot + self.chat_interval
+            if len(self._next_by_chat) > 4096:
+                self._next_by_chat = {k: v for k, v in self._next_by_chat.items() if v > now}
+            if slot > now:
+                await asyncio.sleep(slot - now)
+
+        async with self._lock:
+            while True:
+                now = loop.time()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                if self._updated is not None:
+                    self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+async def fan_out(recipients, send, limiter: RateLimiter, skip=None, on_progress=None,
+                  concurrency: int = BROADCAST_CONCURRENCY):
+    """Appelle send(chat_id) pour chaque destinataire, en parallèle et sous le débit autorisé.
+
+    Les chats présents dans skip (déjà servis lors d'un envoi interrompu) sont ignorés.
+    on_progress(envoyés, échecs, total) est appelé au plus toutes les
+    PROGRESS_UPDATE_INTERVAL secondes puis une dernière fois à la fin.
+    Une édition refusée car le message est déjà à jour compte comme un succès (résultat None).
+    Retourne ({chat_id: résultat de send}, nombre d'échecs).
+    """
+    skip = skip or ()
+    pending = [chat_id for chat_id in recipients if chat_id not in skip]
+    total = len(pending)
+    results = {}
+    failed = 0
+    todo = asyncio.Queue()
+    for chat_id in pending:
+        todo.put_nowait(chat_id)
+
+    loop = asyncio.get_running_loop()
+    last_progress = loop.time()
+
+    async def report(force: bool = False):
+        nonlocal last_progress
+        if on_progress is None:
+            return
+        now = loop.time()
+        if not force and now - last_progress < PROGRESS_UPDATE_INTERVAL:
+            return
+        last_progress = now
+        try:
+            await on_progress(len(results), failed, total)
+        except Exception as e:
+            print(f"Erreur lors de la mise à jour de la progression : {e}")
+
+    async def worker():
+        nonlocal failed
+        while True:
+            try:
+                chat_id = todo.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            for attempt in range(BROADCAST_MAX_RETRIES + 1):
+                await limiter.acquire(chat_id)
+                try:
+                    results[chat_id] = await send(chat_id)
+                    break
+                except RetryAfter as e:
+                    delay = e.retry_after.total_seconds() if isinstance(e.retry_after, timedelta) else e.retry_after
+                    limiter.pause(delay)
+                    error = e
+                except BadRequest as e:
+                    # Édition d'un message déjà à jour : le destinataire est servi
+                    if 'not modified' in str(e).lower():
+                        results[chat_id] = None
+                    error = e
+                    break
+                except NetworkError as e:
+                    # Erreur réseau passagère (dont TimedOut) : on réessaie avec un délai croissant
+                    error = e
+                    await asyncio.sleep(2 ** attempt)
+                except Exception as e:
+                    error = e
+                    break
+            if chat_id not in results:
+                print(f"Error sending to user {chat_id}: {error}")
+                failed += 1
+            await report()
+
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, total))))
+    await report(force=True)
+    return results, failed
+
+ADMIN_DB_PATH = 'data/admin.db'
+
+class AdminDatabase:
+    """Stockage SQLite des utilisateurs, codes d'accès, annonces et sondages de l'administration.
+
+    AdminFeatures garde ses dictionnaires en mémoire ; sync n'écrit que les lignes
+    des éléments signalés comme modifiés, et seulement celles qui ont changé.
+    """
+    PRAGMAS = (
+        "PRAGMA journal_mode = WAL",
+        "PRAGMA synchronous = NORMAL",
+        "PRAGMA temp_store = MEMORY",
+    )
+
+    # Migrations versionnées (PRAGMA user_version), appliquées au démarrage dans l'ordre
+    SCHEMA_MIGRATIONS = (
+        (1, '''
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            CREATE TABLE IF NOT EXISTS users (
+                user_id TEXT PRIMARY KEY,
+                username TEXT,
+                data TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS authorized_users (
+                user_id INTEGER PRIMARY KEY
+            );
+            CREATE TABLE IF NOT EXISTS banned_users (
+                user_id INTEGER PRIMARY KEY
+            );
+            CREATE TABLE IF NOT EXISTS user_groups (
+                group_name TEXT PRIMARY KEY
+            );
+            CREATE TABLE IF NOT EXISTS group_members (
+                group_name TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                PRIMARY KEY (group_name, user_id)
+            );
+            CREATE TABLE IF NOT EXISTS access_codes (
+                code TEXT PRIMARY KEY,
+                used INTEGER NOT NULL DEFAULT 0,
+                expiration TEXT,
+                data TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS broadcasts (
+                broadcast_id TEXT PRIMARY KEY,
+                data TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS broadcast_messages (
+                broadcast_id TEXT NOT NULL,
+                user_id TEXT NOT NULL,
+                message_id INTEGER NOT NULL,
+                PRIMARY KEY (broadcast_id, user_id)
+            );
+            CREATE TABLE IF NOT EXISTS polls (
+                poll_id TEXT PRIMARY KEY,
+                data TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS poll_votes (
+                poll_id TEXT NOT NULL,
+                user_id TEXT NOT NULL,
+                option_index TEXT NOT NULL,
+                PRIMARY KEY (poll_id, user_id)
+            );
+            CREATE TABLE IF NOT EXISTS poll_messages (
+                poll_id TEXT NOT NULL,
+                user_id TEXT NOT NULL,
+                message_id INTEGER NOT NULL,
+                PRIMARY KEY (poll_id, user_id)
+            );
+        '''),
+        # File d'envoi persistante des annonces : une ligne par destinataire et par envoi
+        (2, '''
+            CREATE TABLE IF NOT EXISTS outbox (
+                delivery_id INTEGER PRIMARY KEY,
+                run_id TEXT NOT NULL,
+                broadcast_id TEXT NOT NULL,
+                user_id TEXT NOT NULL,
+                track INTEGER NOT NULL DEFAULT 0,
+                state TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_retry REAL NOT NULL DEFAULT 0,
+                last_error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(state, next_retry);
+            CREATE INDEX IF NOT EXISTS idx_outbox_run ON outbox(run_id, state);
+            CREATE INDEX IF NOT EXISTS idx_outbox_broadcast ON outbox(broadcast_id, state);
+        '''),
+    )
+
+    # Table -> (colonnes de la clé primaire, autres colonnes)
+    TABLES = {
+        'users': (('user_id',), ('username', 'data')),
+        'authorized_users': (('user_id',), ()),
+        'banned_users': (('user_id',), ()),
+        'user_groups': (('group_name',), ()),
+        'group_members': (('group_name', 'user_id'), ()),
+        'access_codes': (('code',), ('used', 'expiration', 'data')),
+        'broadcasts': (('broadcast_id',), ('data',)),
+        'broadcast_messages': (('broadcast_id', 'user_id'), ('message_id',)),
+        'polls': (('poll_id',), ('data',)),
+        'poll_votes': (('poll_id', 'user_id'), ('option_index',)),
+        'poll_messages': (('poll_id', 'user_id'), ('message_id',)),
+    }
+
+    # Tables alimentées par chacun des dictionnaires d'AdminFeatures
+    STORE_TABLES = {
+        'users': ('users',),
+        'access_codes': ('authorized_users', 'banned_users', 'user_groups', 'group_members', 'access_codes'),
+        'broadcasts': ('broadcasts', 'broadcast_messages'),
+        'polls': ('polls', 'poll_votes', 'poll_messages'),
+    }
+
+    # Liste de gestion des utilisateurs : autorisés, en attente puis bannis.
+    # Chaque segment est parcouru par clé croissante (colonne de clé, FROM ... WHERE)
+    USER_SEGMENTS = (
+        ('a.user_id', '''
+            FROM authorized_users a JOIN users u ON u.user_id = CAST(a.user_id AS TEXT)
+            WHERE 1
+        '''),
+        ('u.rowid', '''
+            FROM users u
+            WHERE NOT EXISTS (SELECT 1 FROM authorized_users WHERE user_id = CAST(u.user_id AS INTEGER))
+              AND NOT EXISTS (SELECT 1 FROM banned_users WHERE user_id = CAST(u.user_id AS INTEGER))
+        '''),
+        ('b.user_id', '''
+            FROM banned_users b JOIN users u ON u.user_id = CAST(b.user_id AS TEXT)
+            WHERE NOT EXISTS (SELECT 1 FROM authorized_users WHERE user_id = b.user_id)
+        '''),
+    )
+
+    def __init__(self, path: str = ADMIN_DB_PATH):
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.apply_pragmas()
+        self.migrate()
+        self._synced = {}  # Dictionnaire -> {clé d'élément: {table: {clé: ligne}}} tel qu'écrit en base
+
+    def apply_pragmas(self):
+        for pragma in self.PRAGMAS:
+            self.conn.execute(pragma)
+
+    def migrate(self):
+        """Applique les migrations dont la version dépasse PRAGMA user_version"""
+        current = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        for version, script in self.SCHEMA_MIGRATIONS:
+            if version > current:
+                self.conn.executescript(f"BEGIN;\n{script}\nPRAGMA user_version = {version};\nCOMMIT;")
+
+    def data_version(self) -> int:
+        """Change dès qu'une autre connexion a validé une écriture"""
+        return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def get_meta(self, key: str):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    # --- Conversion dictionnaires <-> lignes ---
+    # Chaque dictionnaire est découpé en éléments (un utilisateur, un code, un groupe,
+    # une annonce...) ; un élément donne ses lignes dans une ou plusieurs tables
+
+    @staticmethod
+    def _user_item_rows(user_id: str, user_data: dict) -> dict:
+        return {'users': {(str(user_id),): (user_data.get('username'), json.dumps(user_data, ensure_ascii=False))}}
+
+    @staticmethod
+    def _access_code_item_rows(item: tuple, value) -> dict:
+        # item : ('authorized_users' | 'banned_users', user_id), ('groups', nom) ou ('codes', code)
+        section, key = item
+        if section == 'codes':
+            return {'access_codes': {(key,): (
+                1 if value.get('used') else 0,
+                value.get('expiration'),
+                json.dumps(value, ensure_ascii=False),
+            )}}
+        if section == 'groups':
+            return {
+                'user_groups': {(key,): ()},
+                'group_members': {(key, int(user_id)): () for user_id in value},
+            }
+        return {section: {(int(key),): ()}}
+
+    @staticmethod
+    def _broadcast_item_rows(broadcast_id: str, broadcast: dict) -> dict:
+        data = {key: value for key, value in broadcast.items() if key != 'message_ids'}
+        return {
+            'broadcasts': {(broadcast_id,): (json.dumps(data, ensure_ascii=False),)},
+            'broadcast_messages': {
+                (broadcast_id, str(user_id)): (message_id,)
+                for user_id, message_id in broadcast.get('message_ids', {}).items()
+            },
+        }
+
+    @staticmethod
+    def _poll_item_rows(poll_id: str, poll: dict) -> dict:
+        data = {key: value for key, value in poll.items() if key not in ('voters', 'message_ids')}
+        return {
+            'polls': {(poll_id,): (json.dumps(data, ensure_ascii=False),)},
+            'poll_votes': {
+                (poll_id, str(user_id)): (str(option_index),)
+                for user_id, option_index in poll.get('voters', {}).items()
+            },
+            'poll_messages': {
+                (poll_id, str(user_id)): (message_id,)
+                for user_id, message_id in poll.get('message_ids', {}).items()
+            },
+        }
+
+    ITEM_ROW_BUILDERS = {
+        'users': '_user_item_rows',
+        'access_codes': '_access_code_item_rows',
+        'broadcasts': '_broadcast_item_rows',
+        'polls': '_poll_item_rows',
+    }
+
+    @staticmethod
+    def store_items(store: str, data: dict) -> list:
+        """Tous les éléments d'un dictionnaire, en couples (clé d'élément, valeur)"""
+        if store != 'access_codes':
+            return list(data.items())
+        return (
+            [(('authorized_users', int(user_id)), True) for user_id in data.get("authorized_users", [])]
+            + [(('banned_users', int(user_id)), True) for user_id in data.get("banned_users", [])]
+            + [(('groups', group_name), members) for group_name, members in data.get("groups", {}).items()]
+            + [(('codes', entry['code']), entry) for entry in data.get("codes", [])]
+        )
+
+    # --- Synchronisation incrémentale ---
+
+    def sync(self, store: str, items: dict):
+        """Écrit en une transaction les lignes des éléments modifiés.
+
+        items : {clé d'élément: valeur actuelle, None si l'élément a été supprimé}.
+        Seules les lignes de ces éléments sont comparées à ce qui est en base.
+        """
+        build = getattr(self, self.ITEM_ROW_BUILDERS[store])
+        synced = self._synced.setdefault(store, {})
+        changes = {table: ([], []) for table in self.STORE_TABLES[store]}
+        rows_by_item = {}
+        for item, value in items.items():
+            rows_by_table = build(item, value) if value is not None else {}
+            previous = synced.get(item, {})
+            for table, (upserts, deletes) in changes.items():
+                rows = rows_by_table.get(table, {})
+                previous_rows = previous.get(table, {})
+                upserts.extend(key + row for key, row in rows.items() if previous_rows.get(key) != row)
+                deletes.extend(key for key in previous_rows if key not in rows)
+            rows_by_item[item] = rows_by_table
+
+        if any(upserts or deletes for upserts, deletes in changes.values()):
+            with self.conn:
+                for table, (upserts, deletes) in changes.items():
+                    keys, columns = self.TABLES[table]
+                    if upserts:
+                        self.conn.executemany(self._upsert_sql(table, keys, columns), upserts)
+                    if deletes:
+                        where = ' AND '.join(f"{key} = ?" for key in keys)
+                        self.conn.executemany(f"DELETE FROM {table} WHERE {where}", deletes)
+
+        for item, rows_by_table in rows_by_item.items():
+            if rows_by_table:
+                synced[item] = rows_by_table
+            else:
+                synced.pop(item, None)
+
+    def sync_all(self, store: str, data: dict):
+        """Synchronise un dictionnaire complet (import) : les éléments absents sont supprimés"""
+        items = dict(self.store_items(store, data))
+        for item in self._synced.get(store, {}):
+            items.setdefault(item, None)
+        self.sync(store, items)
+
+    @staticmethod
+    def _upsert_sql(table: str, keys: tuple, columns: tuple) -> str:
+        # ON CONFLICT ... DO UPDATE conserve le rowid, donc l'ordre d'insertion au rechargement
+        all_columns = keys + columns
+        placeholders = ', '.join('?' for _ in all_columns)
+        conflict = f"DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in columns)}" if columns else "DO NOTHING"
+        return (f"INSERT INTO {table} ({', '.join(all_columns)}) VALUES ({placeholders}) "
+                f"ON CONFLICT({', '.join(keys)}) {conflict}")
+
+    def record_vote(self, poll_id: str, user_id: str, option_index: str, poll: dict):
+        """Enregistre un vote sans resynchroniser tout le sondage"""
+        data = {key: value for key, value in poll.items() if key not in ('voters', 'message_ids')}
+        poll_row = (json.dumps(data, ensure_ascii=False),)
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO poll_votes (poll_id, user_id, option_index) VALUES (?, ?, ?)",
+                (poll_id, user_id, option_index)
+            )
+            self.conn.execute("UPDATE polls SET data = ? WHERE poll_id = ?", poll_row + (poll_id,))
+        poll_rows = self._synced.setdefault('polls', {}).setdefault(poll_id, {})
+        poll_rows.setdefault('poll_votes', {})[(poll_id, user_id)] = (option_index,)
+        poll_rows['polls'] = {(poll_id,): poll_row}
+
+    # --- Chargement ---
+
+    def _remember(self, store: str, data: dict):
+        """Mémorise l'état chargé comme point de départ des synchronisations"""
+        build = getattr(self, self.ITEM_ROW_BUILDERS[store])
+        self._synced[store] = {item: build(item, value) for item, value in self.store_items(store, data)}
+
+    def load_users(self) -> dict:
+        users = {
+            row['user_id']: json.loads(row['data'])
+            for row in self.conn.execute("SELECT user_id, data FROM users ORDER BY rowid")
+        }
+        self._remember('users', users)
+        return users
+
+    def load_access_codes(self) -> dict:
+        access_codes = {
+            "authorized_users": [row[0] for row in self.conn.execute("SELECT user_id FROM authorized_users ORDER BY rowid")],
+            "banned_users": [row[0] for row in self.conn.execute("SELECT user_id FROM banned_users ORDER BY rowid")],
+            "groups": {row[0]: [] for row in self.conn.execute("SELECT group_name FROM user_groups ORDER BY rowid")},
+            "codes": [json.loads(row[0]) for row in self.conn.execute("SELECT data FROM access_codes ORDER BY rowid")],
+        }
+        for group_name, user_id in self.conn.execute("SELECT group_name, user_id FROM group_members ORDER BY rowid"):
+            access_codes["groups"].setdefault(group_name, []).append(user_id)
+        self._remember('access_codes', access_codes)
+        return access_codes
+
+    def load_broadcasts(self) -> dict:
+        broadcasts = {}
+        for row in self.conn.execute("SELECT broadcast_id, data FROM broadcasts ORDER BY rowid"):
+            broadcast = json.loads(row['data'])
+            broadcast['message_ids'] = {}
+            broadcasts[row['broadcast_id']] = broadcast
+        for row in self.conn.execute("SELECT broadcast_id, user_id, message_id FROM broadcast_messages ORDER BY rowid"):
+            if row['broadcast_id'] in broadcasts:
+                broadcasts[row['broadcast_id']]['message_ids'][row['user_id']] = row['message_id']
+        self._remember('broadcasts', broadcasts)
+        return broadcasts
+
+    def load_polls(self) -> dict:
+        polls = {}
+        for row in self.conn.execute("SELECT poll_id, data FROM polls ORDER BY rowid"):
+            poll = json.loads(row['data'])
+            poll['voters'] = {}
+            poll['message_ids'] = {}
+            polls[row['poll_id']] = poll
+        for row in self.conn.execute("SELECT poll_id, user_id, option_index FROM poll_votes ORDER BY rowid"):
+            if row['poll_id'] in polls:
+                polls[row['poll_id']]['voters'][row['user_id']] = row['option_index']
+        for row in self.conn.execute("SELECT poll_id, user_id, message_id FROM poll_messages ORDER BY rowid"):
+            if row['poll_id'] in polls:
+                polls[row['poll_id']]['message_ids'][row['user_id']] = row['message_id']
+        self._remember('polls', polls)
+        return polls
+
+    # --- File d'envoi des annonces ---
+    # États : pending -> sending -> sent | failed | unknown (interrompu pendant l'envoi, jamais renvoyé)
+
+    def enqueue_deliveries(self, run_id: str, broadcast_id: str, user_ids, track: bool):
+        """Ajoute un envoi par destinataire ; track enregistre les messages envoyés dans broadcast_messages"""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO outbox (run_id, broadcast_id, user_id, track) VALUES (?, ?, ?, ?)",
+                ((run_id, broadcast_id, str(user_id), 1 if track else 0) for user_id in user_ids)
+            )
+
+    def recover_deliveries(self) -> int:
+        """Au démarrage : les envois restés en cours ont peut-être abouti, on ne les retente pas"""
+        with self.conn:
+            return self.conn.execute(
+                "UPDATE outbox SET state = 'unknown', last_error = 'interrompu' WHERE state = 'sending'"
+            ).rowcount
+
+    def claim_deliveries(self, limit: int) -> list:
+        """Réserve jusqu'à limit envois arrivés à échéance (état sending, validé avant l'appel à Telegram)"""
+        with self.conn:
+            rows = self.conn.execute(
+                "SELECT delivery_id, broadcast_id, user_id, track, attempts FROM outbox "
+                "WHERE state = 'pending' AND next_retry <= ? ORDER BY next_retry, delivery_id LIMIT ?",
+                (time.time(), limit)
+            ).fetchall()
+            self.conn.executemany(
+                "UPDATE outbox SET state = 'sending', attempts = attempts + 1 WHERE delivery_id = ?",
+                ((row['delivery_id'],) for row in rows)
+            )
+        return rows
+
+    def next_delivery_time(self):
+        """Échéance du prochain envoi en attente, None si la file est vide"""
+        return self.conn.execute("SELECT MIN(next_retry) FROM outbox WHERE state = 'pending'").fetchone()[0]
+
+    def complete_delivery(self, delivery_id: int, broadcast_id: str, user_id: str, message_id: int, track: bool):
+        with self.conn:
+            self.conn.execute(
+                "UPDATE outbox SET state = 'sent', last_error = NULL WHERE delivery_id = ?", (delivery_id,)
+            )
+            if track:
+                self.conn.execute(
+                    self._upsert_sql('broadcast_messages', *self.TABLES['broadcast_messages']),
+                    (broadcast_id, user_id, message_id)
+                )
+        if track:
+            broadcast_rows = self._synced.setdefault('broadcasts', {}).setdefault(broadcast_id, {})
+            broadcast_rows.setdefault('broadcast_messages', {})[(broadcast_id, user_id)] = (message_id,)
+
+    def retry_delivery(self, delivery_id: int, delay: float, error: str):
+        with self.conn:
+            self.conn.execute(
+                "UPDATE outbox SET state = 'pending', next_retry = ?, last_error = ? WHERE delivery_id = ?",
+                (time.time() + delay, error, delivery_id)
+            )
+
+    def fail_delivery(self, delivery_id: int, state: str, error: str):
+        with self.conn:
+            self.conn.execute(
+                "UPDATE outbox SET state = ?, last_error = ? WHERE delivery_id = ?", (state, error, delivery_id)
+            )
+
+    def delivery_counts(self, run_id: str) -> dict:
+        """Nombre d'envois par état pour un envoi donné"""
+        return dict(self.conn.execute(
+            "SELECT state, COUNT(*) FROM outbox WHERE run_id = ? GROUP BY state", (run_id,)
+        ).fetchall())
+
+    def active_delivery_run(self, broadcast_id: str):
+        """Envoi encore en cours pour cette annonce (reprise après redémarrage), sinon None"""
+        row = self.conn.execute(
+            "SELECT run_id FROM outbox WHERE broadcast_id = ? AND state IN ('pending', 'sending') LIMIT 1",
+            (broadcast_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def delete_deliveries(self, broadcast_id: str):
+        with self.conn:
+            self.conn.execute("DELETE FROM outbox WHERE broadcast_id = ?", (broadcast_id,))
+
+    def get_users_page(self, segment: int, key, limit: int, backward: bool = False) -> list:
+        """Jusqu'à limit utilisateurs après (ou avant) la position (segment, clé), dans l'ordre d'affichage.
+
+        Retourne des tuples (segment, clé, user_id, données) ; key=None part du début du segment.
+        """
+        op, order = ('<', 'DESC') if backward else ('>', 'ASC')
+        segments = range(segment, -1, -1) if backward else range(segment, len(self.USER_SEGMENTS))
+        users = []
+        for current in segments:
+            key_column, body = self.USER_SEGMENTS[current]
+            query = f"SELECT {key_column}, u.user_id, u.data {body}"
+            params = []
+            if key is not None:
+                query += f" AND {key_column} {op} ?"
+                params.append(key)
+            query += f" ORDER BY {key_column} {order} LIMIT ?"
+            params.append(limit - len(users))
+            users.extend(
+                (current, row[0], row[1], json.loads(row[2]))
+                for row in self.conn.execute(query, params)
+            )
+            if len(users) >= limit:
+                break
+            key = None
+        if backward:
+            users.reverse()
+        return users
+
+    def close(self):
+        self.conn.close()
+
 class AdminFeatures:
     STATES = {
         'CHOOSING': 'CHOOSING',
         'WAITING_CODE_NUMBER': 'WAITING_CODE_NUMBER'
     }
-    def __init__(self, users_file: str = 'data/users.json', access_codes_file: str = 'data/access_codes.json', broadcasts_file: str = 'data/broadcasts.json', config_file: str = 'config/config.json'):
+    def __init__(self, users_file: str = 'data/users.json', access_codes_file: str = 'data/access_codes.json', broadcasts_file: str = 'data/broadcasts.json', config_file: str = 'config/config.json', database_file: str = ADMIN_DB_PATH):
         from main import CATALOG, save_catalog  
+        self._dirty = {}  # Dictionnaire -> clés des éléments modifiés en attente d'écriture en base
+        self._flush_handle = None
         self.CATALOG = CATALOG
         self.save_catalog = save_catalog
         self.users_file = users_file
         self.access_codes_file = access_codes_file
         self.broadcasts_file = broadcasts_file
         self.config_file = config_file
-        self._users = self._load_users()
-        self.admin_ids = self._load_admin_ids()
-        self._access_codes = self._load_access_codes()
-        self.broadcasts = self._load_broadcasts()
         self.polls_file = 'data/polls.json'
-        self.polls = self._load_polls()
+        self.polls_journal_file = 'data/polls.journal'
+        self.db = AdminDatabase(database_file)
+        self._import_json_stores()
+        self._users = self.db.load_users()
+        self.admin_ids = self._load_admin_ids()
+        self._access_codes_checked_at = time.monotonic()
+        self.reload_access_codes()
+        self.broadcasts = self.db.load_broadcasts()
+        self.polls = self.db.load_polls()
+        self.rate_limiter = RateLimiter()  # Partagé par tous les envois de masse
+        self._poll_refresh_tasks = {}  # poll_id -> tâche de mise à jour des messages en cours
+        self._poll_refresh_pending = set()  # Sondages ayant reçu un vote depuis le dernier rendu
+        self._broadcast_edit_tasks = {}  # broadcast_id -> tâche de propagation d'une modification
+        self.db.recover_deliveries()  # Envois interrompus par un redémarrage
+        self._outbox_task = None  # Tâche qui vide la file d'envoi des annonces
+        self._outbox_wakeup = asyncio.Event()
+        atexit.register(self.flush)
+
+    def _import_json_stores(self):
+        """Importe une seule fois les anciens fichiers data/*.json dans la base"""
+        if self.db.get_meta('json_imported'):
+            return
+        stores = {
+            'users': self._load_users(),
+            'access_codes': self._load_access_codes(),
+            'broadcasts': self._load_broadcasts(),
+            'polls': self._load_polls(),
+        }
+        for store, data in stores.items():
+            self.db.sync_all(store, data)
+        self.db.set_meta('json_imported', datetime.utcnow().isoformat())
 
     def _load_access_codes(self):
-        """Charge les codes d'accès depuis le fichier"""
+        """Charge les codes d'accès depuis l'ancien fichier JSON (import)"""
         try:
             with open(self.access_codes_file, 'r', encoding='utf-8') as f:
                 data = json.load(f)
@@ -87,33 +732,16 @@ class AdminFeatures:
                 self._access_codes["authorized_users"] = []
         
             user_id = int(user_id)
-            if user_id not in self._access_codes["authorized_users"]:
+            if user_id not in self._authorized_ids:
                 self._access_codes["authorized_users"].append(user_id)
-                self._save_access_codes()
+                self._authorized_ids.add(user_id)
+                self._save_access_codes(('authorized_users', user_id))
                 return True
             return False
         except Exception as e:
             print(f"Erreur lors de l'autorisation de l'utilisateur : {e}")
             return False
 
-    def mark_code_as_used(self, code: str, user_id: int) -> bool:
-        """Marque un code comme utilisé et autorise l'utilisateur"""
-        try:
-            if "codes" not in self._access_codes:
-                return False
-        
-            for code_entry in self._access_codes["codes"]:
-                if code_entry["code"] == code and not code_entry["used"]:
-                    code_entry["used"] = True
-                    code_entry["used_by"] = user_id
-                    self.authorize_user(user_id)
-                    self._save_access_codes()
-                    return True
-            return False
-        except Exception as e:
-            print(f"Erreur lors du marquage du code comme utilisé : {e}")
-            return False
-
     def is_user_authorized(self, user_id: int) -> bool:
         """Vérifie si un utilisateur est autorisé"""
         try:
@@ -125,109 +753,251 @@ class AdminFeatures:
                 return False
                 
             # Vérifier si l'utilisateur est dans la liste des utilisateurs autorisés
-            return user_id in self._access_codes.get("authorized_users", [])
+            return user_id in self._authorized_ids
         except Exception as e:
             print(f"Erreur lors de la vérification de l'autorisation: {e}")
             return False
 
     def generate_temp_code(self, generator_id: int, generator_username: str = None) -> tuple:
         """Génère un code d'accès temporaire"""
-        code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
+        codes, expiration = self.generate_temp_codes(1, generator_id, generator_username)
+        return codes[0], expiration
+
+    def generate_temp_codes(self, count: int, generator_id: int, generator_username: str = None) -> tuple:
+        """Génère count codes d'accès temporaires uniques et les sauvegarde en une seule écriture"""
         expiration = (datetime.utcnow() + timedelta(days=2)).isoformat()  # 48h
 
         if "codes" not in self._access_codes:
             self._access_codes["codes"] = []
 
-        # Ajouter le code dans la section "codes"
-        self._access_codes["codes"].append({
-            'code': code,
-            'expiration': expiration,
-            'created_by': generator_id,  # Utiliser le même format que les autres codes
-            'used': False
-        })
+        codes = []
+        for _ in range(count):
+            code = ''.join(secrets.choice(CODE_ALPHABET) for _ in range(CODE_LENGTH))
+            while code in self._codes_by_value:
+                code = ''.join(secrets.choice(CODE_ALPHABET) for _ in range(CODE_LENGTH))
+
+            # Ajouter le code dans la section "codes"
+            code_entry = {
+                'code': code,
+                'expiration': expiration,
+                'created_by': generator_id,  # Utiliser le même format que les autres codes
+                'used': False
+            }
+            self._access_codes["codes"].append(code_entry)
+            self._add_code_to_index(code_entry)
+            codes.append(code)
 
-        self._save_access_codes()
-        return code, expiration
+        self._save_access_codes(*(('codes', code) for code in codes))
+        return codes, expiration
 
     def list_temp_codes(self, show_used: bool = False) -> list:
         """Liste les codes temporaires"""
-        current_time = datetime.utcnow().isoformat()
-        codes = self._access_codes.get("codes", [])
-
+        self._prune_expired_codes()
         if show_used:
             # Retourner uniquement les codes marqués comme utilisés
-            return [code for code in codes if code.get("used") is True]
+            return list(self._used_codes.values())
         else:
             # Retourner les codes non utilisés et non expirés
-            return [code for code in codes 
-                    if not code.get("used") and code.get("expiration", "") > current_time]
+            return list(self._active_codes.values())
+
+    def count_temp_codes(self, show_used: bool = False) -> int:
+        """Nombre de codes actifs ou utilisés"""
+        self._prune_expired_codes()
+        return len(self._used_codes if show_used else self._active_codes)
+
+    def page_temp_codes(self, show_used: bool, page: int, per_page: int = 10) -> tuple:
+        """Retourne (codes de la page, nombre total de codes) sans copier toute la liste"""
+        self._prune_expired_codes()
+        view = self._used_codes if show_used else self._active_codes
+        start = page * per_page
+        return list(islice(view.values(), start, start + per_page)), len(view)
 
     def cleanup_expired_codes(self):
         """Supprime complètement les codes expirés"""
-        current_time = datetime.utcnow().isoformat()
-    
-        if "codes" not in self._access_codes:
+        self._prune_expired_codes()
+        if not self._expired_codes:
             return
-    
+
+        expired = []
+        for code in self._expired_codes:
+            self._codes_by_value.pop(code, None)
+            self._used_codes.pop(code, None)
+            expired.append(('codes', code))
+        self._expired_codes.clear()
+
         # Garder uniquement les codes non expirés
-        self._access_codes["codes"] = [
-            code for code in self._access_codes["codes"]
-            if code["expiration"] > current_time
-        ]
+        self._access_codes["codes"] = list(self._codes_by_value.values())
     
         # Sauvegarder les modifications
-        self._save_access_codes()
+        self._save_access_codes(*expired)
 
     def mark_code_as_used(self, code: str, user_id: int, username: str = None) -> bool:
         """Marque un code comme utilisé et autorise l'utilisateur"""
         try:
-            if "codes" not in self._access_codes:
+            self._prune_expired_codes()
+            code_entry = self._active_codes.pop(code, None)
+            if code_entry is None:
                 return False
-        
-            for code_entry in self._access_codes["codes"]:
-                if code_entry["code"] == code and not code_entry["used"]:
-                    code_entry["used"] = True
-                    code_entry["used_by"] = {
-                        "id": user_id,
-                        "username": username
-                    }
-                    # Ajouter l'utilisateur à la liste des autorisés
-                    if "authorized_users" not in self._access_codes:
-                        self._access_codes["authorized_users"] = []
-                    if user_id not in self._access_codes["authorized_users"]:
-                        self._access_codes["authorized_users"].append(user_id)
-                    self._save_access_codes()
-                    return True
-            return False
+
+            code_entry["used"] = True
+            code_entry["used_by"] = {
+                "id": user_id,
+                "username": username
+            }
+            self._used_codes[code] = code_entry
+            # Ajouter l'utilisateur à la liste des autorisés
+            if "authorized_users" not in self._access_codes:
+                self._access_codes["authorized_users"] = []
+            if user_id not in self._authorized_ids:
+                self._access_codes["authorized_users"].append(user_id)
+                self._authorized_ids.add(user_id)
+            self._save_access_codes(('codes', code), ('authorized_users', user_id))
+            return True
         except Exception as e:
             print(f"Erreur lors du marquage du code comme utilisé : {e}")
             return False
 
+    def _index_codes(self):
+        """Reconstruit l'index des codes (par valeur, actifs, utilisés) et le tas des expirations"""
+        self._codes_by_value = {}
+        self._active_codes = {}
+        self._used_codes = {}
+        self._expired_codes = set()  # Codes expirés encore présents, supprimés par cleanup_expired_codes
+        self._code_expirations = []
+        for code_entry in self._access_codes.get("codes", []):
+            self._add_code_to_index(code_entry)
+        heapq.heapify(self._code_expirations)
+
+    def _add_code_to_index(self, code_entry: dict):
+        code = code_entry["code"]
+        self._codes_by_value[code] = code_entry
+        if code_entry.get("used"):
+            self._used_codes[code] = code_entry
+        else:
+            self._active_codes[code] = code_entry
+        try:
+            expires_at = datetime.fromisoformat(code_entry.get("expiration", ""))
+        except (TypeError, ValueError):
+            expires_at = datetime.min  # Expiration illisible : considéré comme expiré
+        heapq.heappush(self._code_expirations, (expires_at, code))
+
+    def _prune_expired_codes(self):
+        """Sort des codes actifs ceux dont l'expiration est passée (sommet du tas uniquement)"""
+        now = datetime.utcnow()
+        while self._code_expirations and self._code_expirations[0][0] <= now:
+            _, code = heapq.heappop(self._code_expirations)
+            if code in self._codes_by_value:
+                self._active_codes.pop(code, None)
+                self._expired_codes.add(code)
+
     def is_user_banned(self, user_id: int) -> bool:
         """Vérifie si l'utilisateur est banni"""
-        self._access_codes = self._load_access_codes()
-        return int(user_id) in self._access_codes.get("banned_users", [])
+        self._refresh_access_codes()
+        return int(user_id) in self._banned_ids
 
     def reload_access_codes(self):
-        """Recharge les codes d'accès depuis le fichier"""
-        self._access_codes = self._load_access_codes()
+        """Recharge les codes d'accès depuis la base"""
+        if 'access_codes' in self._dirty:
+            self.flush()
+        self._data_version = self.db.data_version()
+        self._access_codes = self.db.load_access_codes()
+        self._index_access_codes()
+        self._index_codes()
         return self._access_codes.get("authorized_users", [])
 
+    def _refresh_access_codes(self):
+        """Recharge les codes d'accès seulement si un autre processus a écrit dans la base"""
+        now = time.monotonic()
+        if now - self._access_codes_checked_at < ACCESS_CODES_CHECK_INTERVAL or 'access_codes' in self._dirty:
+            return
+        self._access_codes_checked_at = now
+        if self.db.data_version() != self._data_version:
+            self.reload_access_codes()
+
+    def _index_access_codes(self):
+        """Reconstruit les ensembles utilisés par les vérifications d'accès"""
+        self._authorized_ids = {int(user_id) for user_id in self._access_codes.get("authorized_users", [])}
+        self._banned_ids = {int(user_id) for user_id in self._access_codes.get("banned_users", [])}
+        self._group_members = {
+            group_name: {int(user_id) for user_id in members}
+            for group_name, members in self._access_codes.get("groups", {}).items()
+        }
+        # Utilisateurs enregistrés autorisés ou bannis : les autres sont en attente
+        self._listed_user_ids = {
+            user_id for user_id in self._authorized_ids | self._banned_ids if str(user_id) in self._users
+        }
+
+    def _index_access_item(self, item: tuple):
+        """Met à jour les index pour un seul élément modifié des codes d'accès"""
+        section, key = item
+        if section == 'groups':
+            members = self._access_codes.get("groups", {}).get(key)
+            if members is None:
+                self._group_members.pop(key, None)
+            else:
+                self._group_members[key] = {int(user_id) for user_id in members}
+        elif section in ('authorized_users', 'banned_users'):
+            # _authorized_ids et _banned_ids sont modifiés avec les listes, par l'appelant
+            self._index_listed_user(int(key))
+
+    def _index_listed_user(self, user_id: int):
+        """Tient à jour l'ensemble des utilisateurs enregistrés autorisés ou bannis"""
+        if str(user_id) in self._users and (user_id in self._authorized_ids or user_id in self._banned_ids):
+            self._listed_user_ids.add(user_id)
+        else:
+            self._listed_user_ids.discard(user_id)
+
     def _load_users(self):
-        """Charge les utilisateurs depuis le fichier"""
+        """Charge les utilisateurs depuis l'ancien fichier JSON (import)"""
         try:
             with open(self.users_file, 'r', encoding='utf-8') as f:
                 return json.load(f)
         except FileNotFoundError:
             return {}
 
-    def _save_users(self):
-        """Sauvegarde les utilisateurs"""
+    def _save_users(self, *user_ids):
+        """Sauvegarde les utilisateurs modifiés"""
+        self._schedule_save('users', user_ids)
+
+    def _schedule_save(self, store: str, keys):
+        """Marque des éléments d'un dictionnaire comme modifiés ; les écritures rapprochées sont regroupées en une seule"""
+        self._dirty.setdefault(store, {}).update(dict.fromkeys(keys))  # Ordre des modifications conservé
         try:
-            with open(self.users_file, 'w', encoding='utf-8') as f:
-                json.dump(self._users, f, indent=4, ensure_ascii=False)
-        except Exception as e:
-            print(f"Erreur lors de la sauvegarde des utilisateurs : {e}")
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Hors de la boucle asyncio (initialisation, scripts) : écriture immédiate
+            self.flush()
+            return
+        if self._flush_handle is None:
+            self._flush_handle = loop.call_later(SAVE_DEBOUNCE_DELAY, self.flush)
+
+    def flush(self):
+        """Écrit immédiatement en base les lignes modifiées (appelé aussi à l'arrêt)"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        dirty, self._dirty = self._dirty, {}
+        for store, keys in dirty.items():
+            try:
+                self.db.sync(store, {key: self._store_item(store, key) for key in keys})
+            except Exception as e:
+                print(f"Erreur lors de la sauvegarde de {store} : {e}")
+                self._dirty.setdefault(store, {}).update(dict.fromkeys(keys))
+                continue
+            if store == 'access_codes':
+                self._data_version = self.db.data_version()
+
+    def _store_item(self, store: str, key):
+        """Valeur actuelle d'un élément d'un dictionnaire persisté, None s'il a été supprimé"""
+        if store != 'access_codes':
+            return getattr(self, PERSISTED_STORES[store]).get(key)
+        section, key = key
+        if section == 'codes':
+            return self._codes_by_value.get(key)
+        if section == 'groups':
+            return self._access_codes.get("groups", {}).get(key)
+        user_ids = self._authorized_ids if section == 'authorized_users' else self._banned_ids
+        return True if key in user_ids else None
 
     def _create_message_keyboard(self):
         """Crée le clavier standard pour les messages"""
@@ -236,7 +1006,7 @@ class AdminFeatures:
         ]])
 
     def _load_broadcasts(self):
-        """Charge les broadcasts depuis le fichier"""
+        """Charge les broadcasts depuis l'ancien fichier JSON (import)"""
         try:
             with open(self.broadcasts_file, 'r', encoding='utf-8') as f:
                 broadcasts = json.load(f)
@@ -255,43 +1025,64 @@ class AdminFeatures:
             print("Erreur de décodage JSON, création d'un nouveau fichier broadcasts")
             return {}
 
-    def _save_broadcasts(self):
-        """Sauvegarde les broadcasts"""
-        try:
-            with open(self.broadcasts_file, 'w', encoding='utf-8') as f:
-                json.dump(self.broadcasts, f, indent=4, ensure_ascii=False)
-        except Exception as e:
-            print(f"Erreur lors de la sauvegarde des broadcasts : {e}")
+    def _save_broadcasts(self, *broadcast_ids):
+        """Sauvegarde les broadcasts modifiés"""
+        self._schedule_save('broadcasts', broadcast_ids)
 
-    def _save_access_codes(self):
-        """Sauvegarde les codes d'accès"""
-        try:
-            with open(self.access_codes_file, 'w', encoding='utf-8') as f:
-                json.dump(self._access_codes, f, indent=4)
-        except Exception as e:
-            print(f"Erreur lors de la sauvegarde des codes d'accès : {e}")
+    def _save_access_codes(self, *items):
+        """Sauvegarde les codes d'accès ; items : ('authorized_users' | 'banned_users', user_id), ('groups', nom) ou ('codes', code)"""
+        # Toute modification passe par ici : on remet à jour les index des éléments modifiés
+        for item in items:
+            self._index_access_item(item)
+        self._schedule_save('access_codes', items)
 
     def is_user_in_group(self, user_id: int, group_name: str) -> bool:
         """Vérifie si l'utilisateur appartient à un groupe spécifique"""
-        self._access_codes = self._load_access_codes()
-        groups = self._access_codes.get("groups", {})
-        return int(user_id) in groups.get(group_name, [])
+        self._refresh_access_codes()
+        return int(user_id) in self._group_members.get(group_name, ())
         
     def _load_polls(self):
-        """Charge les sondages depuis le fichier"""
+        """Charge les sondages depuis l'ancien fichier JSON puis rejoue son journal des votes (import)"""
         try:
             with open(self.polls_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+                polls = json.load(f)
         except FileNotFoundError:
-            return {}
+            polls = {}
+        self._replay_poll_journal(polls)
+        return polls
 
-    def _save_polls(self):
-        """Sauvegarde les sondages"""
+    def _replay_poll_journal(self, polls: dict):
+        """Applique les votes journalisés absents du fichier des sondages"""
         try:
-            with open(self.polls_file, 'w', encoding='utf-8') as f:
-                json.dump(self.polls, f, indent=4, ensure_ascii=False)
+            f = open(self.polls_journal_file, 'r', encoding='utf-8')
+        except FileNotFoundError:
+            return
+        with f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Dernière ligne tronquée par un arrêt brutal
+                poll = polls.get(entry['poll'])
+                if poll is None or entry['user'] in poll.setdefault('voters', {}):
+                    continue
+                votes = poll.setdefault('votes', {})
+                votes[entry['option']] = votes.get(entry['option'], 0) + 1
+                poll['voters'][entry['user']] = entry['option']
+
+    def _record_vote(self, poll_id: str, user_id: str, option_index: str):
+        """Enregistre un vote en base (une ligne) au lieu de resynchroniser tous les sondages"""
+        if 'polls' in self._dirty:
+            self.flush()  # Le sondage doit exister en base avant d'y rattacher le vote
+        try:
+            self.db.record_vote(poll_id, user_id, option_index, self.polls[poll_id])
         except Exception as e:
-            print(f"Erreur lors de la sauvegarde des sondages : {e}")
+            print(f"Erreur lors de l'enregistrement du vote : {e}")
+            self._save_polls(poll_id)
+
+    def _save_polls(self, *poll_ids):
+        """Sauvegarde les sondages modifiés"""
+        self._schedule_save('polls', poll_ids)
 
     def _create_poll_message(self, poll):
         """Crée le message formaté du sondage"""
@@ -335,6 +1126,48 @@ class AdminFeatures:
     
         return active_codes
 
+    def _schedule_poll_refresh(self, poll_id: str, bot):
+        """Demande la mise à jour des messages d'un sondage ; une seule tâche par sondage à la fois"""
+        self._poll_refresh_pending.add(poll_id)
+        task = self._poll_refresh_tasks.get(poll_id)
+        if task is None or task.done():
+            self._poll_refresh_tasks[poll_id] = asyncio.create_task(self._refresh_poll_messages(poll_id, bot))
+
+    async def _refresh_poll_messages(self, poll_id: str, bot):
+        """Réédite tous les messages du sondage avec le dernier décompte, au plus une fois par intervalle"""
+        loop = asyncio.get_running_loop()
+        try:
+            while poll_id in self._poll_refresh_pending:
+                started = loop.time()
+                self._poll_refresh_pending.discard(poll_id)
+                poll = self.polls.get(poll_id)
+                if poll is None:
+                    return
+
+                # Rendu unique, partagé par tous les destinataires
+                poll_text = self._create_poll_message(poll)
+                reply_markup = InlineKeyboardMarkup(self._create_poll_keyboard(poll_id))
+                message_ids = dict(poll['message_ids'])
+
+                async def edit(chat_id):
+                    return await bot.edit_message_text(
+                        chat_id=chat_id,
+                        message_id=message_ids[str(chat_id)],
+                        text=poll_text,
+                        reply_markup=reply_markup,
+                        parse_mode='Markdown'
+                    )
+
+                await fan_out([int(chat_id) for chat_id in message_ids], edit, self.rate_limiter)
+
+                # Les votes arrivés pendant l'envoi seront rendus au prochain tour
+                if poll_id in self._poll_refresh_pending:
+                    await asyncio.sleep(max(0, started + POLL_REFRESH_INTERVAL - loop.time()))
+        except Exception as e:
+            print(f"Erreur lors de la mise à jour du sondage {poll_id} : {e}")
+        finally:
+            self._poll_refresh_tasks.pop(poll_id, None)
+
     def _create_poll_keyboard(self, poll_id):
         """Crée le clavier pour le sondage"""
         poll = self.polls[poll_id]
@@ -434,7 +1267,7 @@ class AdminFeatures:
         
             # Supprimer le sondage de la liste
             del self.polls[poll_id]
-            self._save_polls()
+            self._save_polls(poll_id)
         
             await query.edit_message_text(
                 "✅ Sondage supprimé avec succès!",
@@ -480,6 +1313,11 @@ class AdminFeatures:
         Si non autorisé : supprime les messages et retourne True
         Si autorisé : retourne False
         """
+        # Premier passage après un redémarrage : reprendre les envois restés en file,
+        # au cas où post_init n'a pas été branché sur l'application
+        if self._outbox_task is None:
+            self.start_outbox(context.bot)
+
         if self.is_access_control_enabled() and not self.is_user_authorized(update.effective_user.id):
             chat_id = update.effective_chat.id
         
@@ -534,11 +1372,49 @@ class AdminFeatures:
     
         await update.callback_query.edit_message_text(
             "🔢 Génération personnalisée\n\n"
-            "Envoyez le nombre de codes que vous souhaitez générer (maximum 20) :",
+            f"Envoyez le nombre de codes que vous souhaitez générer (maximum {MAX_CODES_PER_BATCH}) :",
             reply_markup=InlineKeyboardMarkup(keyboard)
         )
         return self.STATES['WAITING_CODE_NUMBER']
 
+    async def _send_generated_codes(self, message, codes: list, expiration: str, reply_markup, edit: bool = False):
+        """Affiche les codes générés, ou les envoie dans un fichier texte s'ils sont trop nombreux"""
+        exp_str = datetime.fromisoformat(expiration).strftime("%d/%m/%Y à %H:%M")
+
+        if len(codes) > CODES_INLINE_LIMIT:
+            document = io.BytesIO(("\n".join(codes) + "\n").encode('utf-8'))
+            await message.get_bot().send_document(
+                chat_id=message.chat_id,
+                document=document,
+                filename=f"codes_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.txt",
+                caption=(
+                    f"🎫 *{len(codes)} codes générés*\n\n"
+                    f"⚠️ Codes à usage unique\n"
+                    f"⏰ Expirent le {exp_str}"
+                ),
+                reply_markup=reply_markup,
+                parse_mode='Markdown'
+            )
+            if edit:
+                await message.delete()
+            return
+
+        parts = ["🎫 *Codes générés :*\n\n"]
+        for code in codes:
+            # Format amélioré avec titre en gras non copiable et contenu copiable
+            parts.append(
+                "*Code d'accès temporaire :*\n"
+                f"`{code}\n"
+                "⚠️ Code à usage unique\n"
+                f"⏰ Expire le {exp_str}`\n\n"
+            )
+        codes_text = ''.join(parts)
+
+        if edit:
+            await message.edit_text(codes_text, reply_markup=reply_markup, parse_mode='Markdown')
+        else:
+            await message.reply_text(codes_text, reply_markup=reply_markup, parse_mode='Markdown')
+
     async def handle_code_number_input(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Traite le nombre de codes demandé"""
         try:
@@ -549,38 +1425,32 @@ class AdminFeatures:
 
             try:
                 num = int(update.message.text)
-                if num <= 0 or num > 20:
+                if num <= 0 or num > MAX_CODES_PER_BATCH:
                     raise ValueError()
             
+                codes, expiration = self.generate_temp_codes(
+                    num,
+                    update.effective_user.id,
+                    update.effective_user.username
+                )
+        
+                keyboard = [[InlineKeyboardButton("🔙 Retour", callback_data="back_to_codes_menu")]]
+        
+                await self._send_generated_codes(
+                    update.message, codes, expiration, InlineKeyboardMarkup(keyboard)
+                )
+
                 # Supprimer le message de l'utilisateur
                 try:
                     await update.message.delete()
                 except:
                     pass
-        
-                codes_text = "🎫 *Codes générés :*\n\n"
-                for _ in range(num):
-                    code, expiration = self.generate_temp_code()
-                    exp_date = datetime.fromisoformat(expiration)
-                    exp_str = exp_date.strftime("%d/%m/%Y à %H:%M")
-                    codes_text += f"*Code d'accès temporaire :*\n"
-                    codes_text += f"`{code}\n"
-                    codes_text += f"⚠️ Code à usage unique\n"
-                    codes_text += f"⏰ Expire le {exp_str}`\n\n"
-        
-                keyboard = [[InlineKeyboardButton("🔙 Retour", callback_data="back_to_codes_menu")]]
-        
-                await update.message.reply_text(
-                    codes_text,
-                    reply_markup=InlineKeyboardMarkup(keyboard),
-                    parse_mode='Markdown'
-                )
                 return self.STATES['CHOOSING']
         
             except ValueError:
                 keyboard = [[InlineKeyboardButton("🔙 Retour", callback_data="back_to_codes_menu")]]
                 await update.message.reply_text(
-                    "❌ Erreur : Veuillez entrer un nombre valide entre 1 et 20.",
+                    f"❌ Erreur : Veuillez entrer un nombre valide entre 1 et {MAX_CODES_PER_BATCH}.",
                     reply_markup=InlineKeyboardMarkup(keyboard)
                 )
                 return self.STATES['WAITING_CODE_NUMBER']
@@ -600,27 +1470,16 @@ class AdminFeatures:
             await update.callback_query.answer("❌ Vous n'êtes pas autorisé à utiliser cette fonction.")
             return self.STATES['CHOOSING']
 
-        codes_text = "🎫 *Codes générés :*\n\n"
-        for _ in range(num_codes):
-            code, expiration = self.generate_temp_code(
-                update.effective_user.id,
-                update.effective_user.username
-            )
-            exp_date = datetime.fromisoformat(expiration)
-            exp_str = exp_date.strftime("%d/%m/%Y à %H:%M")
-        
-            # Format amélioré avec titre en gras non copiable et contenu copiable
-            codes_text += "*Code d'accès temporaire :*\n"
-            codes_text += f"`{code}\n"
-            codes_text += "⚠️ Code à usage unique\n"
-            codes_text += f"⏰ Expire le {exp_str}`\n\n"
+        codes, expiration = self.generate_temp_codes(
+            num_codes,
+            update.effective_user.id,
+            update.effective_user.username
+        )
     
         keyboard = [[InlineKeyboardButton("🔙 Retour", callback_data="generate_multiple_codes")]]
     
-        await update.callback_query.edit_message_text(
-            codes_text,
-            reply_markup=InlineKeyboardMarkup(keyboard),
-            parse_mode='Markdown'
+        await self._send_generated_codes(
+            update.callback_query.message, codes, expiration, InlineKeyboardMarkup(keyboard), edit=True
         )
         return self.STATES['CHOOSING']
 
@@ -636,7 +1495,7 @@ class AdminFeatures:
         keyboard = [
             [InlineKeyboardButton("1️⃣ Un code", callback_data="gen_code_1")],
             [InlineKeyboardButton("5️⃣ Cinq codes", callback_data="gen_code_5")],
-            [InlineKeyboardButton("🔢 Nombre personnalisé (20 maximum)", callback_data="gen_code_custom")],
+            [InlineKeyboardButton(f"🔢 Nombre personnalisé ({MAX_CODES_PER_BATCH} maximum)", callback_data="gen_code_custom")],
             [InlineKeyboardButton("🔙 Retour", callback_data="back_to_home")]
         ]
     
@@ -655,19 +1514,15 @@ class AdminFeatures:
                 return self.STATES['CHOOSING']
 
             showing_used = context.user_data.get('showing_used_codes', False)
-            all_codes = self.list_temp_codes(showing_used)
-
-            # Paginer les résultats
-            if len(all_codes) > 10:
-                current_page = context.user_data.get('codes_page', 0)
-                total_pages = (len(all_codes) + 9) // 10
-                start_idx = current_page * 10
-                end_idx = min(start_idx + 10, len(all_codes))
-                codes = all_codes[start_idx:end_idx]
-            else:
-                codes = all_codes
-                current_page = 0
-                total_pages = 1
+
+            # Paginer les résultats (seule la page affichée est extraite de l'index)
+            current_page = context.user_data.get('codes_page', 0)
+            codes, total_codes = self.page_temp_codes(showing_used, current_page)
+            total_pages = max(1, (total_codes + 9) // 10)
+            if current_page >= total_pages:
+                current_page = total_pages - 1
+                context.user_data['codes_page'] = current_page
+                codes, total_codes = self.page_temp_codes(showing_used, current_page)
 
             if not codes:
                 text = "📜 *Aucun code à afficher*"
@@ -728,7 +1583,7 @@ class AdminFeatures:
             ]
 
             # Ajouter les boutons de pagination si nécessaire
-            if len(all_codes) > 10:
+            if total_codes > 10:
                 nav_buttons = []
                 if current_page > 0:
                     nav_buttons.append(InlineKeyboardButton("◀️", callback_data="prev_codes_page"))
@@ -767,8 +1622,8 @@ class AdminFeatures:
         query = update.callback_query.data
         current_page = context.user_data.get('codes_page', 0)
     
-        codes = self.list_temp_codes(context.user_data.get('showing_used_codes', False))
-        total_pages = (len(codes) + 9) // 10
+        total_codes = self.count_temp_codes(context.user_data.get('showing_used_codes', False))
+        total_pages = (total_codes + 9) // 10
 
         if query == "prev_codes_page" and current_page > 0:
             context.user_data['codes_page'] = current_page - 1
@@ -918,7 +1773,7 @@ class AdminFeatures:
 
         # Sauvegarder le sondage
         self.polls[poll_id] = poll
-        self._save_polls()
+        self._save_polls(poll_id)
 
         # Créer le message du sondage
         poll_text = self._create_poll_message(poll)
@@ -944,7 +1799,7 @@ class AdminFeatures:
 
         # Mettre à jour les message_ids
         self.polls[poll_id] = poll
-        self._save_polls()
+        self._save_polls(poll_id)
 
         # Message de confirmation temporaire
         confirmation_message = await query.edit_message_text(
@@ -1031,25 +1886,11 @@ class AdminFeatures:
             poll['votes'][option_index] = poll['votes'].get(option_index, 0) + 1
             poll['voters'][user_id_str] = option_index
         
-            # Sauvegarder et mettre à jour
-            self.polls[poll_id] = poll
-            self._save_polls()
+            # Enregistrer le vote et mettre à jour
+            self._record_vote(poll_id, user_id_str, option_index)
 
-            # Mettre à jour tous les messages
-            poll_text = self._create_poll_message(poll)
-            keyboard = self._create_poll_keyboard(poll_id)
-
-            for chat_id, message_id in poll['message_ids'].items():
-                try:
-                    await context.bot.edit_message_text(
-                        chat_id=int(chat_id),
-                        message_id=message_id,
-                        text=poll_text,
-                        reply_markup=InlineKeyboardMarkup(keyboard),
-                        parse_mode='Markdown'
-                    )
-                except Exception as e:
-                    print(f"Erreur mise à jour pour {chat_id}: {e}")
+            # Mettre à jour tous les messages (regroupé avec les votes voisins)
+            self._schedule_poll_refresh(poll_id, context.bot)
 
             await query.answer("✅ Vote enregistré!", show_alert=True)
 
@@ -1187,7 +2028,7 @@ class AdminFeatures:
             
                 if group_name in self._access_codes.get("groups", {}) and user_id in self._access_codes["groups"][group_name]:
                     self._access_codes["groups"][group_name].remove(user_id)
-                    self._save_access_codes()
+                    self._save_access_codes(('groups', group_name))
             
                     await query.edit_message_text(
                         f"✅ Utilisateur retiré du groupe *{group_name}* avec succès!",
@@ -1310,7 +2151,7 @@ class AdminFeatures:
         if group_name in self._access_codes.get("groups", {}):
             # Supprimer le groupe des access_codes
             del self._access_codes["groups"][group_name]
-            self._save_access_codes()
+            self._save_access_codes(('groups', group_name))
             print(f"Groupe {group_name} supprimé des access_codes")
 
             # Liste des préfixes possibles pour ce groupe
@@ -1502,7 +2343,7 @@ class AdminFeatures:
             self._access_codes["groups"] = {}
     
         self._access_codes["groups"][group_name] = []
-        self._save_access_codes()
+        self._save_access_codes(('groups', group_name))
 
         # Supprimer les messages
         try:
@@ -1631,7 +2472,7 @@ class AdminFeatures:
         # Ajouter l'utilisateur au groupe
         if user_id not in self._access_codes["groups"][group_name]:
             self._access_codes["groups"][group_name].append(user_id)
-            self._save_access_codes()
+            self._save_access_codes(('groups', group_name))
 
         # Supprimer les messages
         try:
@@ -1762,7 +2603,7 @@ class AdminFeatures:
                     return
 
                 self._access_codes["groups"][group_name] = []
-                self._save_access_codes()
+                self._save_access_codes(('groups', group_name))
             
                 message = await context.bot.send_message(
                     chat_id=update.effective_chat.id,
@@ -1776,7 +2617,7 @@ class AdminFeatures:
             if action == 'delete':
                 if group_name in self._access_codes.get("groups", {}):
                     del self._access_codes["groups"][group_name]
-                    self._save_access_codes()
+                    self._save_access_codes(('groups', group_name))
                     message = await context.bot.send_message(
                         chat_id=update.effective_chat.id,
                         text=f"✅ Groupe '{group_name}' supprimé avec succès!"
@@ -1837,7 +2678,7 @@ class AdminFeatures:
             
                 if user_id not in self._access_codes["groups"][group_name]:
                     self._access_codes["groups"][group_name].append(user_id)
-                    self._save_access_codes()
+                    self._save_access_codes(('groups', group_name))
                     message = await context.bot.send_message(
                         chat_id=update.effective_chat.id,
                         text=f"✅ Utilisateur ajouté au groupe '{group_name}'!"
@@ -1851,7 +2692,7 @@ class AdminFeatures:
             elif action == 'remove':
                 if group_name in self._access_codes.get("groups", {}) and user_id in self._access_codes["groups"][group_name]:
                     self._access_codes["groups"][group_name].remove(user_id)
-                    self._save_access_codes()
+                    self._save_access_codes(('groups', group_name))
                     message = await context.bot.send_message(
                         chat_id=update.effective_chat.id,
                         text=f"✅ Utilisateur retiré du groupe '{group_name}'!"
@@ -1881,17 +2722,19 @@ class AdminFeatures:
             user_id = int(user_id)
         
             # Retirer l'utilisateur des codes d'accès s'il y est
-            if user_id in self._access_codes.get("authorized_users", []):
+            if user_id in self._authorized_ids:
                 self._access_codes["authorized_users"].remove(user_id)
-                self._save_access_codes()
+                self._authorized_ids.discard(user_id)
+                self._save_access_codes(('authorized_users', user_id))
 
             # Ajouter l'utilisateur à la liste des bannis si elle existe, sinon la créer
             if "banned_users" not in self._access_codes:
                 self._access_codes["banned_users"] = []
         
-            if user_id not in self._access_codes["banned_users"]:
+            if user_id not in self._banned_ids:
                 self._access_codes["banned_users"].append(user_id)
-                self._save_access_codes()
+                self._banned_ids.add(user_id)
+                self._save_access_codes(('banned_users', user_id))
         
             # Si on a le context, on supprime les messages précédents
             if context and hasattr(context, 'user_data'):
@@ -1930,9 +2773,10 @@ class AdminFeatures:
         """Débanni un utilisateur"""
         try:
             user_id = int(user_id)
-            if "banned_users" in self._access_codes and user_id in self._access_codes["banned_users"]:
+            if user_id in self._banned_ids:
                 self._access_codes["banned_users"].remove(user_id)
-                self._save_access_codes()
+                self._banned_ids.discard(user_id)
+                self._save_access_codes(('banned_users', user_id))
             return True
         except Exception as e:
             print(f"Erreur lors du débannissement de l'utilisateur : {e}")
@@ -2101,7 +2945,8 @@ class AdminFeatures:
             'last_name': user.last_name,
             'last_seen': paris_time.strftime("%Y-%m-%d %H:%M:%S")
         }
-        self._save_users()
+        self._index_listed_user(user.id)
+        self._save_users(user_id)
 
     async def handle_broadcast(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Démarre le processus de diffusion"""
@@ -2224,61 +3069,32 @@ class AdminFeatures:
             # Convertir les nouvelles entités
             new_entities = None
             if update.message.entities:
-                new_entities = [{'type': entity.type, 
-                               'offset': entity.offset,
-                               'length': entity.length} 
-                              for entity in update.message.entities]
+                new_entities = [entity.to_dict() for entity in update.message.entities]
             elif update.message.caption_entities:
-                new_entities = [{'type': entity.type, 
-                               'offset': entity.offset,
-                               'length': entity.length} 
-                              for entity in update.message.caption_entities]
+                new_entities = [entity.to_dict() for entity in update.message.caption_entities]
 
             broadcast = self.broadcasts[broadcast_id]
+            # Annonces antérieures au hachage : le contenu actuel est celui des copies envoyées
+            if 'content_hash' not in broadcast:
+                broadcast['content_hash'] = self._content_hash(broadcast['content'], broadcast.get('entities'))
+            previous_hash = broadcast['content_hash']
+            new_hash = self._content_hash(new_content, new_entities)
+
             broadcast['content'] = new_content
             broadcast['entities'] = new_entities
-
-            success = 0
-            failed = 0
-            messages_updated = []
-        
-            # Tenter de modifier les messages existants
-            for user_id, msg_id in broadcast['message_ids'].items():
-                if int(user_id) == admin_id:  # Skip l'admin
-                    continue
-                try:
-                    await context.bot.edit_message_text(
-                        chat_id=user_id,
-                        message_id=msg_id,
-                        text=new_content,
-                        entities=update.message.entities,
-                        reply_markup=self._create_message_keyboard()
-                    )
-                    success += 1
-                    messages_updated.append(user_id)
-                except Exception as e:
-                    print(f"Error updating message for user {user_id}: {e}")
-                    failed += 1
-
-            # Pour les utilisateurs qui n'ont pas reçu le message
-            for user_id in self._users.keys():
-                if (str(user_id) not in messages_updated and 
-                    self.is_user_authorized(int(user_id)) and 
-                    int(user_id) != admin_id):  # Skip l'admin
-                    try:
-                        sent_msg = await context.bot.send_message(
-                            chat_id=user_id,
-                            text=new_content,
-                            entities=update.message.entities,
-                            reply_markup=self._create_message_keyboard()
-                        )
-                        broadcast['message_ids'][str(user_id)] = sent_msg.message_id
-                        success += 1
-                    except Exception as e:
-                        print(f"Error sending new message to user {user_id}: {e}")
-                        failed += 1
-
-            self._save_broadcasts()
+            # Inconnu tant que la propagation n'est pas terminée
+            broadcast['content_hash'] = None
+            self._save_broadcasts(broadcast_id)
+
+            # Une modification plus récente remplace celle qui serait encore en cours
+            task = self._broadcast_edit_tasks.get(broadcast_id)
+            if task is not None and not task.done():
+                task.cancel()
+            self._broadcast_edit_tasks[broadcast_id] = asyncio.create_task(self._propagate_broadcast_edit(
+                broadcast_id, new_content, update.message.entities, new_hash,
+                unchanged=previous_hash == new_hash, admin_id=admin_id,
+                chat_id=update.effective_chat.id, bot=context.bot
+            ))
 
             # Créer la bannière de gestion des annonces
             keyboard = []
@@ -2301,29 +3117,86 @@ class AdminFeatures:
                 reply_markup=InlineKeyboardMarkup(keyboard)
             )
 
-            # Message de confirmation avec le contenu
-            confirmation_message = await context.bot.send_message(
-                chat_id=update.effective_chat.id,
-                text=f"✅ Message modifié ({success} succès, {failed} échecs)\n\n"
-                     f"📝 *Contenu de l'annonce :*\n{new_content}",
+            return "CHOOSING"
+
+        except Exception as e:
+            print(f"Error in handle_broadcast_edit: {e}")
+            return "CHOOSING"
+
+    async def _propagate_broadcast_edit(self, broadcast_id: str, new_content: str, entities, new_hash: str,
+                                        unchanged: bool, admin_id: int, chat_id: int, bot):
+        """Réédite les copies envoyées et complète les destinataires manquants, en parallèle.
+
+        Si le contenu n'a pas changé, seules les copies manquantes sont envoyées.
+        """
+        try:
+            broadcast = self.broadcasts[broadcast_id]
+            keyboard = self._create_message_keyboard()
+            sent_to = {int(user_id) for user_id in broadcast['message_ids']}
+            recipients = self._broadcast_recipients(exclude=admin_id)
+            edit_targets = set() if unchanged else sent_to - {admin_id}
+            missing = recipients - sent_to
+
+            progress_message = await bot.send_message(
+                chat_id=chat_id,
+                text="📤 *Mise à jour de l'annonce en cours...*",
                 parse_mode='Markdown'
             )
 
-            # Programmer la suppression du message après 3 secondes
-            async def delete_message():
-                await asyncio.sleep(3)
-                try:
-                    await confirmation_message.delete()
-                except Exception as e:
-                    print(f"Error deleting confirmation message: {e}")
-
-            asyncio.create_task(delete_message())
+            async def propagate(user_id):
+                if user_id in edit_targets:
+                    try:
+                        return await bot.edit_message_text(
+                            chat_id=user_id,
+                            message_id=broadcast['message_ids'][str(user_id)],
+                            text=new_content,
+                            entities=entities,
+                            reply_markup=keyboard
+                        )
+                    except BadRequest as e:
+                        if 'not modified' in str(e).lower():
+                            return None
+                        # Copie supprimée ou trop ancienne : on en renvoie une aux destinataires actuels
+                        if user_id not in recipients:
+                            raise
+                        print(f"Error updating message for user {user_id}: {e}")
+                        await self.rate_limiter.acquire(user_id)
+                sent_msg = await bot.send_message(
+                    chat_id=user_id,
+                    text=new_content,
+                    entities=entities,
+                    reply_markup=keyboard
+                )
+                broadcast['message_ids'][str(user_id)] = sent_msg.message_id
+                return sent_msg
+
+            async def on_progress(done, failed, total):
+                self._save_broadcasts(broadcast_id)
+                await progress_message.edit_text(
+                    f"📤 *Mise à jour de l'annonce en cours...*\n\n"
+                    f"• Traités : {done + failed}/{total}\n"
+                    f"• Échecs : {failed}",
+                    parse_mode='Markdown'
+                )
 
-            return "CHOOSING"
+            results, failed = await fan_out(edit_targets | missing, propagate, self.rate_limiter, on_progress=on_progress)
+            broadcast['content_hash'] = new_hash
+            self._save_broadcasts(broadcast_id)
 
+            await progress_message.edit_text(
+                f"✅ Message modifié ({len(results)} succès, {failed} échecs)\n\n"
+                f"📝 *Contenu de l'annonce :*\n{new_content}",
+                parse_mode='Markdown'
+            )
+            await asyncio.sleep(3)
+            await progress_message.delete()
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            print(f"Error in handle_broadcast_edit: {e}")
-            return "CHOOSING"
+            print(f"Error propagating broadcast edit {broadcast_id}: {e}")
+        finally:
+            if self._broadcast_edit_tasks.get(broadcast_id) is asyncio.current_task():
+                del self._broadcast_edit_tasks[broadcast_id]
 
     async def resend_broadcast(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Renvoie une annonce existante"""
@@ -2340,46 +3213,43 @@ class AdminFeatures:
             return "CHOOSING"
 
         broadcast = self.broadcasts[broadcast_id]
-        success = 0
-        failed = 0
+        # Un envoi interrompu reprend là où il s'était arrêté au lieu de tout renvoyer
+        # ('status' ne concerne que les annonces envoyées avant la file persistante)
+        active_run = self.db.active_delivery_run(broadcast_id)
+        resuming = active_run is not None or broadcast.get('status') == 'sending'
 
         progress_message = await query.edit_message_text(
-            "📤 *Renvoi de l'annonce en cours...*",
+            "📤 *Reprise de l'envoi de l'annonce...*" if resuming else "📤 *Renvoi de l'annonce en cours...*",
             parse_mode='Markdown'
         )
 
-        for user_id in self._users.keys():
-            user_id_int = int(user_id)
-            if not self.is_user_authorized(user_id_int):
-                print(f"User {user_id_int} not authorized")
-                continue
-        
-            try:
-                if broadcast['type'] == 'photo' and broadcast['file_id']:
-                    await context.bot.send_photo(
-                        chat_id=user_id,
-                        photo=broadcast['file_id'],
-                        caption=broadcast['caption'] if broadcast['caption'] else '',
-                        parse_mode='Markdown',  # Ajout du parse_mode
-                        reply_markup=self._create_message_keyboard()
-                    )
-                else:
-                    message_text = broadcast.get('content', '')
-                    if not message_text:
-                        print(f"No content found for broadcast {broadcast_id}")
-                        continue
-        
-                    await context.bot.send_message(
-                        chat_id=user_id,
-                        text=message_text,
-                        parse_mode='Markdown',  # Ajout du parse_mode
-                        reply_markup=self._create_message_keyboard()
-                    )
-                success += 1
-                print(f"Successfully sent to user {user_id}")
-            except Exception as e:
-                print(f"Error sending to user {user_id}: {e}")
-                failed += 1
+        async def on_progress(sent, failed, total):
+            await progress_message.edit_text(
+                f"📤 *Renvoi de l'annonce en cours...*\n\n"
+                f"• Traités : {sent + failed}/{total}\n"
+                f"• Échecs : {failed}",
+                parse_mode='Markdown'
+            )
+
+        if (broadcast['type'] == 'photo' and broadcast['file_id']) or broadcast.get('content', ''):
+            if active_run is not None:
+                run_id = active_run
+            else:
+                run_id = f"{broadcast_id}:{datetime.now().timestamp()}"
+                recipients = self._broadcast_recipients()
+                if resuming:
+                    # Envoi interrompu avant la file persistante : compléter les destinataires manquants
+                    recipients -= {int(uid) for uid in broadcast.get('message_ids', {})}
+                self.db.enqueue_deliveries(run_id, broadcast_id, recipients, track=resuming)
+            self.start_outbox(context.bot)
+            success, failed = await self._track_deliveries(run_id, on_progress)
+        else:
+            print(f"No content found for broadcast {broadcast_id}")
+            success, failed = 0, 0
+
+        if resuming:
+            broadcast['status'] = 'sent'
+            self._save_broadcasts(broadcast_id)
 
         keyboard = [
             [InlineKeyboardButton("📢 Retour aux annonces", callback_data="manage_broadcasts")],
@@ -2405,7 +3275,8 @@ class AdminFeatures:
         
         if broadcast_id in self.broadcasts:
             del self.broadcasts[broadcast_id]
-            self._save_broadcasts()  # Sauvegarder après suppression
+            self._save_broadcasts(broadcast_id)  # Sauvegarder après suppression
+            self.db.delete_deliveries(broadcast_id)
         await query.edit_message_text(
             "✅ *L'annonce a été supprimée avec succès !*",
             parse_mode='Markdown',
@@ -2416,12 +3287,157 @@ class AdminFeatures:
         
         return "CHOOSING"
 
+    def _broadcast_recipients(self, exclude: int = None) -> set:
+        """Utilisateurs connus, autorisés et non bannis, à qui envoyer les annonces"""
+        self._refresh_access_codes()
+        recipients = {
+            user_id for user_id in self._authorized_ids - self._banned_ids
+            if str(user_id) in self._users
+        }
+        recipients.discard(exclude)
+        return recipients
+
+    @staticmethod
+    def _content_hash(content: str, entities) -> str:
+        """Empreinte du rendu d'une annonce (texte et mise en forme)"""
+        payload = json.dumps([content, entities], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    async def post_init(self, application: Application):
+        """Reprend au démarrage les envois laissés en attente avant le redémarrage.
+
+        À passer à Application.builder().post_init() ; à défaut, la file démarre
+        au premier passage dans check_and_clean_unauthorized_access.
+        """
+        self.start_outbox(application.bot)
+
+    def start_outbox(self, bot):
+        """Démarre (ou réveille) la tâche qui vide la file d'envoi"""
+        self._outbox_wakeup.set()
+        if self._outbox_task is None or self._outbox_task.done():
+            self._outbox_task = asyncio.create_task(self._run_outbox(bot))
+
+    async def _run_outbox(self, bot):
+        """Traite les envois arrivés à échéance par lots, jusqu'à ce que la file soit vide.
+
+        Une erreur de base (verrou, disque plein...) ne termine pas la tâche :
+        elle fait une pause puis reprend là où elle en était.
+        """
+        while True:
+            try:
+                self._outbox_wakeup.clear()
+                deliveries = self.db.claim_deliveries(BROADCAST_CONCURRENCY)
+                if deliveries:
+                    await asyncio.gather(*(self._deliver(delivery, bot) for delivery in deliveries))
+                    continue
+                next_retry = self.db.next_delivery_time()
+                if next_retry is None:
+                    # Plus rien en cours : un envoi resté 'sending' n'a pas pu être enregistré
+                    self.db.recover_deliveries()
+                    return
+                delay = max(0.0, next_retry - time.time())
+            except Exception as e:
+                print(f"Erreur dans la file d'envoi des annonces : {e}")
+                delay = OUTBOX_ERROR_BACKOFF
+            # Attendre la prochaine échéance, ou de nouveaux envois
+            try:
+                await asyncio.wait_for(self._outbox_wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _deliver(self, delivery, bot):
+        """Traite un envoi ; une erreur d'enregistrement n'interrompt pas le reste du lot"""
+        try:
+            await self._attempt_delivery(delivery, bot)
+        except Exception as e:
+            print(f"Erreur lors de l'enregistrement de l'envoi {delivery['delivery_id']} : {e}")
+            try:
+                # Le message a pu partir : ne pas le retenter
+                self.db.fail_delivery(delivery['delivery_id'], 'unknown', str(e))
+            except Exception as e:
+                print(f"Erreur lors de l'enregistrement de l'envoi {delivery['delivery_id']} : {e}")
+
+    async def _attempt_delivery(self, delivery, bot):
+        """Envoie une copie d'annonce et enregistre le résultat de la tentative"""
+        delivery_id = delivery['delivery_id']
+        broadcast = self.broadcasts.get(delivery['broadcast_id'])
+        if broadcast is None:
+            self.db.fail_delivery(delivery_id, 'failed', "annonce supprimée")
+            return
+
+        user_id = int(delivery['user_id'])
+        await self.rate_limiter.acquire(user_id)
+        try:
+            sent_msg = await self._send_broadcast_copy(broadcast, user_id, bot)
+        except RetryAfter as e:
+            delay = e.retry_after.total_seconds() if isinstance(e.retry_after, timedelta) else e.retry_after
+            self.rate_limiter.pause(delay)
+            self.db.retry_delivery(delivery_id, delay, str(e))
+        except BadRequest as e:
+            print(f"Error sending to user {user_id}: {e}")
+            self.db.fail_delivery(delivery_id, 'failed', str(e))
+        except TimedOut as e:
+            # Le message a pu partir : ne pas risquer un doublon
+            print(f"Error sending to user {user_id}: {e}")
+            self.db.fail_delivery(delivery_id, 'unknown', str(e))
+        except NetworkError as e:
+            if delivery['attempts'] + 1 < OUTBOX_MAX_ATTEMPTS:
+                self.db.retry_delivery(delivery_id, 2 ** delivery['attempts'], str(e))
+            else:
+                print(f"Error sending to user {user_id}: {e}")
+                self.db.fail_delivery(delivery_id, 'failed', str(e))
+        except Exception as e:
+            print(f"Error sending to user {user_id}: {e}")
+            self.db.fail_delivery(delivery_id, 'failed', str(e))
+        else:
+            track = bool(delivery['track'])
+            if track:
+                broadcast['message_ids'][str(user_id)] = sent_msg.message_id
+            self.db.complete_delivery(
+                delivery_id, delivery['broadcast_id'], str(user_id), sent_msg.message_id, track
+            )
+
+    async def _send_broadcast_copy(self, broadcast: dict, user_id: int, bot):
+        """Rend une annonce enregistrée pour un destinataire"""
+        entities = [MessageEntity.de_json(entity, bot) for entity in broadcast['entities']] if broadcast.get('entities') else None
+        if broadcast['type'] == 'photo' and broadcast['file_id']:
+            return await bot.send_photo(
+                chat_id=user_id,
+                photo=broadcast['file_id'],
+                caption=broadcast['caption'] if broadcast['caption'] else '',
+                caption_entities=entities,
+                reply_markup=self._create_message_keyboard()
+            )
+        return await bot.send_message(
+            chat_id=user_id,
+            text=broadcast.get('content', ''),
+            entities=entities,
+            reply_markup=self._create_message_keyboard()
+        )
+
+    async def _track_deliveries(self, run_id: str, on_progress) -> tuple:
+        """Suit un envoi jusqu'à ce qu'il ne reste plus rien en attente ; retourne (réussis, échecs)"""
+        while True:
+            # Lu avant les compteurs : la file a pu se vider juste avant de s'arrêter
+            outbox_stopped = self._outbox_task is None or self._outbox_task.done()
+            counts = self.db.delivery_counts(run_id)
+            sent = counts.get('sent', 0)
+            failed = counts.get('failed', 0) + counts.get('unknown', 0)
+            if not counts.get('pending') and not counts.get('sending'):
+                return sent, failed
+            if outbox_stopped:
+                raise RuntimeError(
+                    f"La file d'envoi s'est arrêtée avec {counts.get('pending', 0) + counts.get('sending', 0)} envois en attente"
+                )
+            try:
+                await on_progress(sent, failed, sum(counts.values()))
+            except Exception as e:
+                print(f"Erreur lors de la mise à jour de la progression : {e}")
+            await asyncio.sleep(PROGRESS_UPDATE_INTERVAL)
+
     async def send_broadcast_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Envoie le message aux utilisateurs autorisés"""
-        success = 0
-        failed = 0
         chat_id = update.effective_chat.id
-        message_ids = {}  # Pour stocker les IDs des messages envoyés
 
         try:
             # Supprimer les messages précédents
@@ -2442,15 +3458,9 @@ class AdminFeatures:
             # Convertir les entités en format sérialisable
             entities = None
             if update.message.entities:
-                entities = [{'type': entity.type, 
-                            'offset': entity.offset,
-                            'length': entity.length} 
-                           for entity in update.message.entities]
+                entities = [entity.to_dict() for entity in update.message.entities]
             elif update.message.caption_entities:
-                entities = [{'type': entity.type, 
-                            'offset': entity.offset,
-                            'length': entity.length} 
-                           for entity in update.message.caption_entities]
+                entities = [entity.to_dict() for entity in update.message.caption_entities]
     
             self.broadcasts[broadcast_id] = {
                 'content': message_content,
@@ -2461,6 +3471,9 @@ class AdminFeatures:
                 'message_ids': {},
                 'parse_mode': None  # On n'utilise plus parse_mode car on utilise les entités
             }
+            # L'annonce doit être en base avant que la file d'envoi ne la référence
+            self._save_broadcasts(broadcast_id)
+            self.flush()
 
             # Message de progression
             progress_message = await context.bot.send_message(
@@ -2469,37 +3482,23 @@ class AdminFeatures:
                 parse_mode='HTML'
             )
 
-            # Envoi aux utilisateurs autorisés
-            for user_id in self._users.keys():
-                user_id_int = int(user_id)
-                if not self.is_user_authorized(user_id_int) or user_id_int == update.effective_user.id:  # Skip non-autorisés et admin
-                    print(f"User {user_id_int} skipped")
-                    continue
-            
-                try:
-                    if update.message.photo:
-                        sent_msg = await context.bot.send_photo(
-                            chat_id=user_id,
-                            photo=update.message.photo[-1].file_id,
-                            caption=update.message.caption if update.message.caption else '',
-                            caption_entities=update.message.caption_entities,
-                            reply_markup=self._create_message_keyboard()
-                        )
-                    else:
-                        sent_msg = await context.bot.send_message(
-                            chat_id=user_id,
-                            text=message_content,
-                            entities=update.message.entities,
-                            reply_markup=self._create_message_keyboard()
-                        )
-                    self.broadcasts[broadcast_id]['message_ids'][str(user_id)] = sent_msg.message_id  # Assurer que user_id est un string
-                    success += 1
-                except Exception as e:
-                    print(f"Error sending to user {user_id}: {e}")
-                    failed += 1
+            async def on_progress(sent, failed, total):
+                await progress_message.edit_text(
+                    f"📤 <b>Envoi du message en cours...</b>\n\n"
+                    f"• Traités : {sent + failed}/{total}\n"
+                    f"• Échecs : {failed}",
+                    parse_mode='HTML'
+                )
+
+            # Un envoi par utilisateur autorisé (sauf l'admin qui envoie), écrit en base avant le premier message
+            self.db.enqueue_deliveries(
+                broadcast_id, broadcast_id, self._broadcast_recipients(exclude=update.effective_user.id), track=True
+            )
+            self.start_outbox(context.bot)
+            success, failed = await self._track_deliveries(broadcast_id, on_progress)
 
             # Sauvegarder les broadcasts
-            self._save_broadcasts()
+            self._save_broadcasts(broadcast_id)
 
             # Rapport final
             keyboard = [
@@ -2526,59 +3525,52 @@ class AdminFeatures:
     async def handle_user_management(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Gère l'affichage des statistiques utilisateurs"""
         try:
-            # Récupérer la page actuelle depuis le callback_data ou initialiser à 0
+            # Position dans la liste portée par le callback_data : user_page_<n|p><segment>_<clé>
             query = update.callback_query
-            current_page = 0
+            backward = False
+            segment, key = 0, None
             if query and query.data.startswith("user_page_"):
-                current_page = int(query.data.replace("user_page_", ""))
+                cursor = query.data.replace("user_page_", "")
+                if cursor[:1] in ("n", "p"):
+                    backward = cursor[0] == "p"
+                    segment, key = cursor[1:].split("_")
+                    segment, key = int(segment), int(key)
 
             # Nombre d'utilisateurs par page
             users_per_page = 10
         
             # Récupérer les listes d'utilisateurs autorisés et bannis
-            authorized_users = set(self._access_codes.get("authorized_users", []))
-            banned_users = set(self._access_codes.get("banned_users", []))
-        
-            # Créer des listes séparées pour chaque catégorie
-            authorized_list = []
-            banned_list = []
-            pending_list = []
-
-            for user_id, user_data in self._users.items():
-                user_id_int = int(user_id)
-                if user_id_int in authorized_users:
-                    authorized_list.append((user_id, user_data))
-                elif user_id_int in banned_users:
-                    banned_list.append((user_id, user_data))
-                else:
-                    pending_list.append((user_id, user_data))
-
-            # Combiner les listes dans l'ordre : autorisés, en attente, bannis
-            relevant_users = authorized_list + pending_list + banned_list
-
-            total_pages = (len(relevant_users) + users_per_page - 1) // users_per_page
-
-            # Calculer les indices de début et de fin pour la page actuelle
-            start_idx = current_page * users_per_page
-            end_idx = min(start_idx + users_per_page, len(relevant_users))
+            self._refresh_access_codes()
+            authorized_users = self._authorized_ids
+            banned_users = self._banned_ids
+            pending_count = len(self._users) - len(self._listed_user_ids)
+
+            # La page est lue en base : écrire d'abord les modifications en attente
+            self.flush()
+            page_users = self.db.get_users_page(segment, key, users_per_page + 1, backward)
+            if backward:
+                has_previous = len(page_users) > users_per_page
+                has_next = True
+                page_users = page_users[-users_per_page:]
+            else:
+                has_previous = key is not None
+                has_next = len(page_users) > users_per_page
+                page_users = page_users[:users_per_page]
 
             # Construire le texte
             text = "👥 *Gestion des utilisateurs*\n\n"
             text += f"✅ Utilisateurs autorisés : {len(authorized_users)}\n"
-            text += f"⏳ Utilisateurs en attente : {len(pending_list)}\n"
+            text += f"⏳ Utilisateurs en attente : {pending_count}\n"
             text += f"🚫 Utilisateurs bannis : {len(banned_users)}\n"
 
             # Ajouter l'information sur les groupes
             groups = self._access_codes.get("groups", {})
             for group_name, group_users in groups.items():
                 text += f"👥 Groupe {group_name} : {len(group_users)}\n"
-            if total_pages > 1:
-                text += f"Page {current_page + 1}/{total_pages}\n"
             text += "\n"
 
-            if relevant_users:
-                for user_id, user_data in relevant_users[start_idx:end_idx]:
-                    user_id_int = int(user_id)
+            if page_users:
+                for user_segment, _, user_id, user_data in page_users:
                     # Format de la date
                     last_seen = user_data.get('last_seen', 'Jamais')
                     try:
@@ -2606,13 +3598,8 @@ class AdminFeatures:
                     # Échapper les caractères spéciaux Markdown
                     display_name = display_name.replace('_', '\\_').replace('*', '\\*')
                 
-                    # Déterminer le statut
-                    if user_id_int in banned_users:
-                        status = "🚫"
-                    elif user_id_int in authorized_users:
-                        status = "✅"
-                    else:
-                        status = "⏳"
+                    # Le segment donne le statut ; un utilisateur autorisé puis banni reste affiché banni
+                    status = "🚫" if int(user_id) in banned_users else ("✅", "⏳", "🚫")[user_segment]
                 
                     text += f"{status} {display_name} (`{user_id}`)\n"
                     text += f"  └ Dernière activité : {last_seen}\n"
@@ -2622,24 +3609,17 @@ class AdminFeatures:
             # Construire le clavier avec la pagination
             keyboard = []
         
-            # Boutons de pagination
-            if total_pages > 1:
-                nav_buttons = []
-            
-                # Bouton page précédente
-                if current_page > 0:
-                    nav_buttons.append(InlineKeyboardButton(
-                        "◀️", callback_data=f"user_page_{current_page - 1}"))
-            
-                # Bouton page actuelle
+            # Boutons de pagination : chacun porte la clé du premier ou du dernier utilisateur affiché
+            nav_buttons = []
+            if page_users and has_previous:
+                first_segment, first_key = page_users[0][:2]
                 nav_buttons.append(InlineKeyboardButton(
-                    f"{current_page + 1}/{total_pages}", callback_data="current_page"))
-            
-                # Bouton page suivante
-                if current_page < total_pages - 1:
-                    nav_buttons.append(InlineKeyboardButton(
-                        "▶️", callback_data=f"user_page_{current_page + 1}"))
-            
+                    "◀️", callback_data=f"user_page_p{first_segment}_{first_key}"))
+            if page_users and has_next:
+                last_segment, last_key = page_users[-1][:2]
+                nav_buttons.append(InlineKeyboardButton(
+                    "▶️", callback_data=f"user_page_n{last_segment}_{last_key}"))
+            if nav_buttons:
                 keyboard.append(nav_buttons)
 
             # Autres boutons
@@ -0,0 +1,96 @@
+"""Mesure des points chauds du moteur, pour comparer les versions entre elles
+
+Exemple : python benchmark.py --label "$(git rev-parse --short HEAD)" --output bench.jsonl
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime
+
+from blackjack import CARDS, Hand, MultiPlayerGame, Shoe
+from simulation import InMemoryLedger
+
+def measure(func, repeat: int) -> float:
+    """Retourne le nombre d'appels par seconde de func"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    elapsed = time.perf_counter() - start
+    return repeat / elapsed if elapsed else 0.0
+
+def make_game(players: int, shoe: Shoe) -> MultiPlayerGame:
+    game = MultiPlayerGame(1, shoe=shoe)
+    for player_id in range(1, players + 1):
+        game.add_player(player_id, 10)
+    return game
+
+def run_benchmarks(players: int, repeat: int) -> dict:
+    shoe = Shoe()
+    game = make_game(players, shoe)
+    game.start_game()
+    ledger = InMemoryLedger()
+
+    hands = [Hand(random.sample(CARDS, random.randint(2, 5))) for _ in range(1000)]
+    raw_hands = [list(hand) for hand in hands]
+
+    def calculate_hand():
+        for hand in hands:
+            game.calculate_hand(hand)
+
+    def calculate_raw_hand():
+        for hand in raw_hands:
+            game.calculate_hand(hand)
+
+    def deal_initial_cards():
+        if shoe.needs_shuffle():
+            shoe.shuffle()
+        game.deal_initial_cards()
+
+    def resolve_dealer():
+        if shoe.needs_shuffle():
+            shoe.shuffle()
+        game.dealer_hand = Hand((shoe.deal(), shoe.deal()))
+        game.resolve_dealer()
+
+    def settlement():
+        game.determine_winners()
+        ledger.settle_game(game.settlement)
+
+    return {
+        # Les deux premières mesures portent sur 1000 mains par appel
+        'calculate_hand': measure(calculate_hand, max(repeat // 1000, 1)) * 1000,
+        'calculate_hand_list': measure(calculate_raw_hand, max(repeat // 1000, 1)) * 1000,
+        'deal_initial_cards': measure(deal_initial_cards, repeat),
+        'resolve_dealer': measure(resolve_dealer, repeat),
+        'settlement': measure(settlement, repeat),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark du moteur de blackjack")
+    parser.add_argument('--players', type=int, default=7)
+    parser.add_argument('--repeat', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--label', default='local', help="Version mesurée (commit, tag...)")
+    parser.add_argument('--output', help="Fichier JSON Lines auquel ajouter les résultats")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    results = run_benchmarks(args.players, args.repeat)
+
+    print(f"📊 Benchmark '{args.label}' ({args.players} joueurs)")
+    for name, ops in results.items():
+        print(f"├ {name:<20} {ops:>14,.0f} op/s  {1e6 / ops:8.2f} µs/op")
+
+    if args.output:
+        record = {
+            'label': args.label,
+            'date': datetime.utcnow().isoformat(),
+            'players': args.players,
+            'results': results,
+        }
+        with open(args.output, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + '\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,346 @@
+"""Moteur de blackjack multijoueur, indépendant de Telegram et de la base de données"""
+import random
+from datetime import datetime
+from typing import Optional
+
+MAX_PLAYERS = 20
+SHOE_DECKS = 6  # Nombre de jeux de 52 cartes dans le sabot
+SHOE_PENETRATION = 0.75  # Position de la carte de coupe (fraction du sabot distribuée)
+PAYOUT_MULTIPLIERS = {'win': 2, 'blackjack': 2.5, 'lose': 0, 'push': 1}
+
+RANKS = ('2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K', 'A')
+SUITS = ('♠', '♥', '♦', '♣')
+SUIT_EMOJIS = {'♠': '♠️', '♥': '♥️', '♦': '♦️', '♣': '♣️'}
+RANK_VALUES = (2, 3, 4, 5, 6, 7, 8, 9, 10, 10, 10, 10, 1)  # L'as compte 1, +10 si la main le permet
+
+class Card:
+    """Carte encodée sur un entier (rang * 4 + couleur), avec valeur et libellé précalculés"""
+    __slots__ = ('code', 'rank', 'suit', 'value', 'is_ace', 'label')
+
+    def __init__(self, code: int):
+        self.code = code
+        self.rank = RANKS[code // 4]
+        self.suit = SUITS[code % 4]
+        self.value = RANK_VALUES[code // 4]
+        self.is_ace = self.rank == 'A'
+        self.label = f"{self.rank}{SUIT_EMOJIS[self.suit]}"
+        
+    def __str__(self):
+        return self.label
+
+# Les 52 cartes sont créées une seule fois et partagées par tous les decks
+CARDS = tuple(Card(code) for code in range(52))
+
+class Hand(list):
+    """Main de cartes qui tient à jour son total dur et son nombre d'as à chaque ajout"""
+    __slots__ = ('hard_total', 'aces')
+
+    def __init__(self, cards=()):
+        super().__init__(cards)
+        self.hard_total = sum(card.value for card in self)
+        self.aces = sum(1 for card in self if card.is_ace)
+
+    def append(self, card: Card):
+        super().append(card)
+        self.hard_total += card.value
+        self.aces += card.is_ace
+
+    def pop(self, index: int = -1) -> Card:
+        card = super().pop(index)
+        self.hard_total -= card.value
+        self.aces -= card.is_ace
+        return card
+
+    @property
+    def total(self) -> int:
+        """Meilleur total : un as compte 11 tant que la main ne dépasse pas 21"""
+        if self.aces and self.hard_total + 10 <= 21:
+            return self.hard_total + 10
+        return self.hard_total
+
+class Shoe:
+    """Sabot de plusieurs jeux : tableau préalloué parcouru par un index, avec carte de coupe"""
+    __slots__ = ('cards', 'position', 'cut_position')
+
+    def __init__(self, decks: int = SHOE_DECKS, penetration: float = SHOE_PENETRATION):
+        self.cards = list(CARDS) * decks
+        self.cut_position = int(len(self.cards) * penetration)
+        self.shuffle()
+
+    def shuffle(self):
+        """Mélange le sabot sur place et revient au début"""
+        random.shuffle(self.cards)
+        self.position = 0
+
+    def needs_shuffle(self) -> bool:
+        """La carte de coupe est sortie : il faut mélanger avant la prochaine manche"""
+        return self.position >= self.cut_position
+
+    def remaining(self) -> int:
+        return len(self.cards) - self.position
+
+    def deal(self) -> Card:
+        if self.position >= len(self.cards):
+            # Sabot épuisé en cours de manche (très grande table) : mélange de secours
+            self.shuffle()
+        card = self.cards[self.position]
+        self.position += 1
+        return card
+
+class MultiPlayerGame:
+    def __init__(self, host_id, host_name=None, shoe: Optional[Shoe] = None):  # Ajout du paramètre host_name avec une valeur par défaut
+        self.host_id = host_id
+        self.host_name = host_name  # Stockage du nom de l'hôte
+        self.players = {}
+        self.dealer_hand = Hand()
+        self.deck = shoe if shoe is not None else Shoe()
+        self.game_status = 'waiting'
+        self.bet_amount = None  # Pour stocker la mise initiale
+        self.created_at = datetime.utcnow()  # Pour tracker le temps de création
+        self.settlement = []  # Résultats (user_id, mise, résultat) à régler en base
+        self.turn_job = None  # Job d'expiration du tour en cours
+
+    def cancel_turn_timer(self):
+        """Annule l'expiration programmée du tour en cours"""
+        if self.turn_job is not None:
+            self.turn_job.schedule_removal()
+            self.turn_job = None
+
+    def can_split(self, player_id, current_balance: int):
+        player_data = self.players[player_id]
+        return (len(player_data['hand']) == 2 and 
+                player_data['hand'][0].rank == player_data['hand'][1].rank and
+                current_balance >= player_data['bet'] * 2)  
+
+    def split_hand(self, player_id, current_balance: int):
+        """Sépare la main du joueur (la mise supplémentaire est prélevée par l'appelant)"""
+        player_data = self.players[player_id]
+    
+        if self.can_split(player_id, current_balance):
+            split_card = player_data['hand'].pop()
+            player_data['hand'] = Hand((player_data['hand'][0], self.deck.deal()))
+            player_data['second_hand'] = Hand((split_card, self.deck.deal()))
+            player_data['status'] = 'playing'
+            return True
+        return False
+
+    def hit(self, player_id):
+        """Tire une carte pour la main en cours du joueur.
+
+        Retourne (issue, total, partie_terminée) où issue vaut 'continue',
+        'bust', 'blackjack', 'first_bust' ou 'first_blackjack' (première main
+        d'un split terminée, on passe à la seconde).
+        """
+        player_data = self.players[player_id]
+        current_hand = player_data.setdefault('current_hand', 'hand')
+        player_data[current_hand].append(self.deck.deal())
+        total = self.calculate_hand(player_data[current_hand])
+
+        if total < 21:
+            return 'continue', total, False
+
+        outcome = 'bust' if total > 21 else 'blackjack'
+        if current_hand == 'hand' and 'second_hand' in player_data:
+            # La première main est terminée, on passe à la seconde
+            player_data['first_status'] = outcome
+            player_data['current_hand'] = 'second_hand'
+            player_data['status'] = 'playing'
+            return 'first_' + outcome, total, False
+
+        if current_hand == 'second_hand':
+            player_data['second_status'] = outcome
+        player_data['status'] = outcome
+        return outcome, total, self.next_player()
+
+    def stand(self, player_id):
+        """Le joueur reste sur sa main en cours.
+
+        Retourne (issue, partie_terminée) où issue vaut 'first_stand' si le
+        joueur passe à la seconde main d'un split, 'stand' sinon.
+        """
+        player_data = self.players[player_id]
+        current_hand = player_data.setdefault('current_hand', 'hand')
+
+        if current_hand == 'hand' and 'second_hand' in player_data:
+            player_data['current_hand'] = 'second_hand'
+            player_data['first_status'] = 'stand'  # Stocker le statut de la première main séparément
+            player_data['status'] = 'playing'  # Garder le statut principal comme 'playing'
+            return 'first_stand', False
+
+        if current_hand == 'second_hand':
+            player_data['second_status'] = 'stand'
+        player_data['status'] = 'stand'
+        return 'stand', self.next_player()
+
+    def get_host_name(self) -> str:
+        """Retourne le nom de l'hôte de la partie"""
+        return self.host_name if self.host_name else "Inconnu"
+        
+    def get_bet(self) -> int:
+        """Retourne la mise de la partie"""
+        if self.players and self.host_id in self.players:
+            return self.players[self.host_id]['bet']
+        return 0
+
+    def is_expired(self) -> bool:
+        """Vérifie si la partie a expiré (plus de 5 minutes)"""
+        if self.game_status != 'waiting':
+            return False
+        time_diff = datetime.utcnow() - self.created_at
+        return time_diff.total_seconds() >= 300  # 5 minutes
+
+    def add_player(self, player_id, bet):
+        if len(self.players) < MAX_PLAYERS and player_id not in self.players:
+            self.players[player_id] = {
+                'hand': Hand(),
+                'bet': bet,
+                'status': 'playing'
+            }
+            if player_id == self.host_id:  # Si c'est l'hôte, on stocke la mise initiale
+                self.bet_amount = bet
+            return True
+        return False
+
+    def calculate_hand(self, hand):
+        """Calcule la valeur d'une main"""
+        if isinstance(hand, Hand):
+            return hand.total
+        return Hand(hand).total
+
+    def get_current_player_id(self):
+        for player_id, player_data in self.players.items():
+            if player_data['status'] == 'playing':
+                return player_id
+        return None
+
+    def next_player(self):
+        """Passe au joueur suivant"""
+        current_player_id = self.get_current_player_id()
+        has_next_player = False
+        
+        # Créer une liste ordonnée des joueurs
+        player_ids = list(self.players.keys())
+        if current_player_id in player_ids:
+            current_index = player_ids.index(current_player_id)
+            # Chercher le prochain joueur à partir du joueur actuel
+            for i in range(current_index + 1, len(player_ids)):
+                next_player_id = player_ids[i]
+                if self.players[next_player_id]['status'] == 'playing':
+                    has_next_player = True
+                    break
+        
+        # Si aucun prochain joueur n'est trouvé
+        if not has_next_player:
+            # Vérifier si tous les joueurs ont terminé
+            all_finished = True
+            for player_data in self.players.values():
+                if player_data['status'] == 'playing':
+                    all_finished = False
+                    break
+            
+            if all_finished:
+                self.game_status = 'finished'
+                self.resolve_dealer()
+                self.determine_winners()
+                return True  # Indique que la partie est terminée
+        return False  # La partie continue
+
+    def start_game(self):
+        """Démarre la partie"""
+        if len(self.players) < 1:
+            return False
+    
+        self.game_status = 'playing'
+        # Le mélange n'a lieu qu'entre deux manches, une fois la carte de coupe atteinte
+        if self.deck.needs_shuffle():
+            self.deck.shuffle()
+        self.deal_initial_cards()
+        self.last_action_time = datetime.utcnow()
+        # Compter combien de joueurs sont encore actifs
+        active_players = 0
+        for player_id, player_data in self.players.items():
+            if self.calculate_hand(player_data['hand']) == 21:
+                player_data['status'] = 'blackjack'
+            else:
+                active_players += 1
+                player_data['status'] = 'playing'
+    
+        # Ne terminer la partie que si TOUS les joueurs ont un blackjack
+        if active_players == 0:
+            self.game_status = 'finished'
+            self.resolve_dealer()
+            self.determine_winners()
+    
+        return True
+
+    def deal_initial_cards(self):
+        """Distribution initiale des cartes"""
+        # Distribuer aux joueurs
+        for player_id in self.players:
+            self.players[player_id]['hand'] = Hand((self.deck.deal(), self.deck.deal()))
+            if self.calculate_hand(self.players[player_id]['hand']) == 21:
+                self.players[player_id]['status'] = 'blackjack'
+        
+        # Distribuer au croupier
+        self.dealer_hand = Hand((self.deck.deal(), self.deck.deal()))
+        self.last_action_time = datetime.utcnow() 
+    def resolve_dealer(self):
+        """Tour du croupier"""
+        while self.calculate_hand(self.dealer_hand) < 17:
+            self.dealer_hand.append(self.deck.deal())
+            
+    def determine_winners(self):
+        """Détermine les gagnants et prépare le règlement de tous les gains"""
+        dealer_total = self.calculate_hand(self.dealer_hand)
+        dealer_bust = dealer_total > 21
+        results = []
+
+        for player_id, player_data in self.players.items():
+            bet = player_data['bet']
+
+            # Traiter la main principale
+            if 'first_status' in player_data:
+                status = player_data['first_status']
+            else:
+                status = player_data['status']
+
+            if status == 'bust':
+                player_data['first_status'] = 'bust'
+                results.append((player_id, bet, 'lose'))
+            elif status == 'blackjack':
+                player_data['first_status'] = 'blackjack'
+                results.append((player_id, bet, 'blackjack'))
+            else:  # 'stand'
+                player_total = self.calculate_hand(player_data['hand'])
+                if dealer_bust or player_total > dealer_total:
+                    player_data['first_status'] = 'win'
+                    results.append((player_id, bet, 'win'))
+                elif player_total < dealer_total:
+                    player_data['first_status'] = 'lose'
+                    results.append((player_id, bet, 'lose'))
+                else:
+                    player_data['first_status'] = 'push'
+                    results.append((player_id, bet, 'push'))
+
+            # Traiter la seconde main si elle existe
+            if 'second_hand' in player_data:
+                second_total = self.calculate_hand(player_data['second_hand'])
+                second_status = player_data.get('second_status', 'playing')
+
+                if second_status == 'bust' or second_total > 21:
+                    player_data['second_status'] = 'bust'
+                    results.append((player_id, bet, 'lose'))
+                elif second_total == 21 and len(player_data['second_hand']) == 2:
+                    player_data['second_status'] = 'blackjack'
+                    results.append((player_id, bet, 'blackjack'))
+                elif dealer_bust or second_total > dealer_total:
+                    player_data['second_status'] = 'win'
+                    results.append((player_id, bet, 'win'))
+                elif second_total < dealer_total:
+                    player_data['second_status'] = 'lose'
+                    results.append((player_id, bet, 'lose'))
+                else:
+                    player_data['second_status'] = 'push'
+                    results.append((player_id, bet, 'push'))
+
+        self.settlement = results
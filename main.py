@@ -1,21 +1,30 @@
 import logging
-import random
 import asyncio
+import bisect
+import queue
 import sqlite3
 import pytz
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from command_delete_handler import CommandDeleteHandler
+from blackjack import MAX_PLAYERS, PAYOUT_MULTIPLIERS, MultiPlayerGame, Shoe
+from rendering import (
+    RANK_TIERS, get_player_rank, progress_bar, render_bank, render_game, render_leaderboard,
+    render_stats, render_top_page, render_welcome,
+)
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Set
+from typing import Dict, List, Optional
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, Message
 from telegram.constants import ParseMode
+from telegram.error import BadRequest
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ContextTypes, Defaults, filters
 
 # Variables globales
-active_games = {}
-waiting_games = set()
 game_messages = {}
 CLASSEMENT_MESSAGE_ID = None  # Ajoutez cette ligne
 CLASSEMENT_CHAT_ID = None     # Ajoutez cette ligne
+CLASSEMENT_LAST_HASH = None   # Empreinte du dernier top 50 affiché
 last_game_message = {}  # {chat_id: message_id}
 last_end_game_message = {}  # {chat_id: message_id}
 
@@ -32,279 +41,74 @@ logging.getLogger('telegram').setLevel(logging.WARNING)
 GAME_THREAD_ID = 13
 FORBIDDEN_THREADS = [133, 136]
 INITIAL_BALANCE = 1500
-MAX_PLAYERS = 20
+TURN_TIMEOUT = 30  # Secondes accordées à un joueur pour jouer son tour
+DB_PATH = 'blackjack.db'
+DB_READ_POOL_SIZE = 3  # Connexions de lecture dédiées (hors boucle asyncio)
+DB_WRITE_BEHIND = False  # Regroupe les règlements de plusieurs parties dans un seul commit
+WRITE_BEHIND_INTERVAL = 2  # Secondes entre deux vidages de la file d'écriture
 game_messages = {}  # Pour stocker l'ID du message de la partie en cours
 
-class Card:
-    def __init__(self, rank, suit):
-        self.rank = rank
-        self.suit = suit
-        
-    def __str__(self):
-        suits = {'♠': '♠️', '♥': '♥️', '♦': '♦️', '♣': '♣️'}
-        return f"{self.rank}{suits[self.suit]}"
-
-class Deck:
-    def __init__(self):
-        ranks = ['2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K', 'A']
-        suits = ['♠', '♥', '♦', '♣']
-        self.cards = [Card(rank, suit) for rank in ranks for suit in suits]
-        random.shuffle(self.cards)
-    
-    def deal(self):
-        if not self.cards:
-            # Recréer un deck si vide
-            self.__init__()
-        return self.cards.pop()
-
-class MultiPlayerGame:
-    def __init__(self, host_id, host_name=None):  # Ajout du paramètre host_name avec une valeur par défaut
-        self.host_id = host_id
-        self.host_name = host_name  # Stockage du nom de l'hôte
-        self.players = {}
-        self.dealer_hand = []
-        self.deck = Deck()
-        self.game_status = 'waiting'
-        self.bet_amount = None  # Pour stocker la mise initiale
-        self.created_at = datetime.utcnow()  # Pour tracker le temps de création
-
-    def add_player(self, player_id, bet):
-        if len(self.players) < MAX_PLAYERS and player_id not in self.players:
-            self.players[player_id] = {
-                'hand': [],
-                'bet': bet,
-                'status': 'playing'
-            }
-            return True
-        return False
-
-    def check_timeout(self):
-            """Vérifie si le joueur actuel a dépassé le temps imparti"""
-            if hasattr(self, 'last_action_time'):
-                current_time = datetime.utcnow()
-                time_difference = (current_time - self.last_action_time).total_seconds()
-                return time_difference > 30
-            return False
-
-    def can_split(self, player_id):
-        player_data = self.players[player_id]
-        current_balance = db.get_balance(player_id)
-        return (len(player_data['hand']) == 2 and 
-                player_data['hand'][0].rank == player_data['hand'][1].rank and
-                current_balance >= player_data['bet'] * 2)  
-
-    def split_hand(self, player_id):
-        player_data = self.players[player_id]
-        current_balance = db.get_balance(player_id)
-    
-        if self.can_split(player_id):
-            # Prélever la mise supplémentaire
-            db.set_balance(player_id, current_balance - player_data['bet'])
-        
-            new_hand = [player_data['hand'].pop()]
-            player_data['hand'] = [player_data['hand'][0], self.deck.deal()]
-            player_data['second_hand'] = [new_hand[0], self.deck.deal()]
-            player_data['status'] = 'playing'
-            return True
-        return False
-
-    def get_host_name(self) -> str:
-        """Retourne le nom de l'hôte de la partie"""
-        return self.host_name if self.host_name else "Inconnu"
-        
-    def get_bet(self) -> int:
-        """Retourne la mise de la partie"""
-        if self.players and self.host_id in self.players:
-            return self.players[self.host_id]['bet']
-        return 0
-
-    def is_expired(self) -> bool:
-        """Vérifie si la partie a expiré (plus de 5 minutes)"""
-        if self.game_status != 'waiting':
-            return False
-        time_diff = datetime.utcnow() - self.created_at
-        return time_diff.total_seconds() >= 300  # 5 minutes
-
-    def add_player(self, player_id, bet):
-        if len(self.players) < MAX_PLAYERS and player_id not in self.players:
-            self.players[player_id] = {
-                'hand': [],
-                'bet': bet,
-                'status': 'playing'
-            }
-            if player_id == self.host_id:  # Si c'est l'hôte, on stocke la mise initiale
-                self.bet_amount = bet
-            return True
-        return False
-
-    def calculate_hand(self, hand):
-        """Calcule la valeur d'une main"""
-        if not hand:
-            return 0
-            
-        value = 0
-        aces = 0
-        
-        for card in hand:
-            if card.rank in ['J', 'Q', 'K']:
-                value += 10
-            elif card.rank == 'A':
-                aces += 1
-            else:
-                value += int(card.rank)
-        
-        # Ajouter les as avec la meilleure valeur possible
-        for _ in range(aces):
-            if value + 11 <= 21:
-                value += 11
-            else:
-                value += 1
-                
-        return value
-
-    def get_current_player_id(self):
-        for player_id, player_data in self.players.items():
-            if player_data['status'] == 'playing':
-                return player_id
-        return None
-
-    def next_player(self):
-        """Passe au joueur suivant"""
-        current_player_id = self.get_current_player_id()
-        found_current = False
-        has_next_player = False
-        
-        # Créer une liste ordonnée des joueurs
-        player_ids = list(self.players.keys())
-        if current_player_id in player_ids:
-            current_index = player_ids.index(current_player_id)
-            # Chercher le prochain joueur à partir du joueur actuel
-            for i in range(current_index + 1, len(player_ids)):
-                next_player_id = player_ids[i]
-                if self.players[next_player_id]['status'] == 'playing':
-                    has_next_player = True
-                    break
-        
-        # Si aucun prochain joueur n'est trouvé
-        if not has_next_player:
-            # Vérifier si tous les joueurs ont terminé
-            all_finished = True
-            for player_data in self.players.values():
-                if player_data['status'] == 'playing':
-                    all_finished = False
-                    break
-            
-            if all_finished:
-                self.game_status = 'finished'
-                self.resolve_dealer()
-                self.determine_winners()
-                return True  # Indique que la partie est terminée
-        return False  # La partie continue
-
-    def start_game(self):
-        """Démarre la partie"""
-        if len(self.players) < 1:
-            return False
-    
-        self.game_status = 'playing'
-        self.deal_initial_cards()
-        self.last_action_time = datetime.utcnow()
-        # Compter combien de joueurs sont encore actifs
-        active_players = 0
-        for player_id, player_data in self.players.items():
-            if self.calculate_hand(player_data['hand']) == 21:
-                player_data['status'] = 'blackjack'
-            else:
-                active_players += 1
-                player_data['status'] = 'playing'
-    
-        # Ne terminer la partie que si TOUS les joueurs ont un blackjack
-        if active_players == 0:
-            self.game_status = 'finished'
-            self.resolve_dealer()
-            self.determine_winners()
-    
-        return True
+class DatabaseManager:
+    # Réglages appliqués à chaque connexion
+    PRAGMAS = (
+        "PRAGMA journal_mode = WAL",
+        "PRAGMA synchronous = NORMAL",
+        "PRAGMA cache_size = -16000",    # ~16 Mo
+        "PRAGMA mmap_size = 268435456",  # 256 Mo
+        "PRAGMA temp_store = MEMORY",
+    )
 
-    def deal_initial_cards(self):
-        """Distribution initiale des cartes"""
-        # Distribuer aux joueurs
-        for player_id in self.players:
-            self.players[player_id]['hand'] = [self.deck.deal(), self.deck.deal()]
-            if self.calculate_hand(self.players[player_id]['hand']) == 21:
-                self.players[player_id]['status'] = 'blackjack'
-        
-        # Distribuer au croupier
-        self.dealer_hand = [self.deck.deal(), self.deck.deal()]
-        self.last_action_time = datetime.utcnow() 
-    def resolve_dealer(self):
-        """Tour du croupier"""
-        while self.calculate_hand(self.dealer_hand) < 17:
-            self.dealer_hand.append(self.deck.deal())
-            
-    def determine_winners(self):
-        """Détermine les gagnants et les gains"""
-        dealer_total = self.calculate_hand(self.dealer_hand)
-        dealer_bust = dealer_total > 21
-
-        for player_id, player_data in self.players.items():
-            # Traiter la main principale
-            if 'first_status' in player_data:
-                status = player_data['first_status']
-            else:
-                status = player_data['status']
-
-            if status == 'bust':
-                player_data['first_status'] = 'bust'
-                db.update_game_result(player_id, player_data['bet'], 'lose')
-            elif status == 'blackjack':
-                player_data['first_status'] = 'blackjack'
-                db.update_game_result(player_id, player_data['bet'], 'blackjack')
-            else:  # 'stand'
-                player_total = self.calculate_hand(player_data['hand'])
-                if dealer_bust:
-                    player_data['first_status'] = 'win'
-                    db.update_game_result(player_id, player_data['bet'], 'win')
-                elif player_total > dealer_total:
-                    player_data['first_status'] = 'win'
-                    db.update_game_result(player_id, player_data['bet'], 'win')
-                elif player_total < dealer_total:
-                    player_data['first_status'] = 'lose'
-                    db.update_game_result(player_id, player_data['bet'], 'lose')
-                else:
-                    player_data['first_status'] = 'push'
-                    db.update_game_result(player_id, player_data['bet'], 'push')
-
-            # Traiter la seconde main si elle existe
-            if 'second_hand' in player_data:
-                second_total = self.calculate_hand(player_data['second_hand'])
-                second_status = player_data.get('second_status', 'playing')
-
-                if second_status == 'bust' or second_total > 21:
-                    player_data['second_status'] = 'bust'
-                    db.update_game_result(player_id, player_data['bet'], 'lose')
-                elif second_total == 21 and len(player_data['second_hand']) == 2:
-                    player_data['second_status'] = 'blackjack'
-                    db.update_game_result(player_id, player_data['bet'], 'blackjack')
-                else:
-                    if dealer_bust:
-                        player_data['second_status'] = 'win'
-                        db.update_game_result(player_id, player_data['bet'], 'win')
-                    elif second_total > dealer_total:
-                        player_data['second_status'] = 'win'
-                        db.update_game_result(player_id, player_data['bet'], 'win')
-                    elif second_total < dealer_total:
-                        player_data['second_status'] = 'lose'
-                        db.update_game_result(player_id, player_data['bet'], 'lose')
-                    else:
-                        player_data['second_status'] = 'push'
-                        db.update_game_result(player_id, player_data['bet'], 'push')
+    # Migrations versionnées (PRAGMA user_version), appliquées au démarrage dans l'ordre
+    SCHEMA_MIGRATIONS = [
+        (1, '''
+            CREATE INDEX IF NOT EXISTS idx_game_history_user_ts ON game_history (user_id, timestamp);
+            CREATE INDEX IF NOT EXISTS idx_users_balance ON users (balance DESC, user_id);
+        '''),
+        # Solde avant/après et variation enregistrés au règlement ; pour les anciennes
+        # parties seule la variation peut être reconstituée, les soldes restent NULL
+        (2, '''
+            ALTER TABLE game_history ADD COLUMN balance_before INTEGER;
+            ALTER TABLE game_history ADD COLUMN balance_after INTEGER;
+            ALTER TABLE game_history ADD COLUMN delta INTEGER;
+            UPDATE game_history SET delta = CASE
+                WHEN result = 'win' THEN bet_amount
+                WHEN result = 'blackjack' THEN CAST(bet_amount * 2.5 AS INTEGER) - bet_amount
+                WHEN result = 'lose' THEN -bet_amount
+                ELSE 0
+            END;
+        '''),
+        # Pagination par clé de l'historique (game_id croissant avec le temps)
+        (3, '''
+            CREATE INDEX IF NOT EXISTS idx_game_history_user_game ON game_history (user_id, game_id);
+        '''),
+    ]
 
-class DatabaseManager:
-    def __init__(self):
-        self.conn = sqlite3.connect('blackjack.db', check_same_thread=False)
+    def __init__(self, path: str = DB_PATH, write_behind: bool = False, setup: bool = True):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
         self.cursor = self.conn.cursor()
-        self.setup_database()
+        self.write_behind = write_behind
+        self._pending_results: List[tuple] = []  # File d'écriture différée des règlements
+        self.apply_pragmas()
+        if setup:
+            self.setup_database()
+
+    def apply_pragmas(self):
+        """Active le WAL et les réglages de performance sur la connexion"""
+        for pragma in self.PRAGMAS:
+            self.conn.execute(pragma)
+
+    def migrate(self):
+        """Applique les migrations de schéma manquantes"""
+        current_version = self.conn.execute('PRAGMA user_version').fetchone()[0]
+        for version, script in self.SCHEMA_MIGRATIONS:
+            if version <= current_version:
+                continue
+            try:
+                self.conn.executescript(f"BEGIN;\n{script}\nPRAGMA user_version = {version};\nCOMMIT;")
+            except Exception as e:
+                print(f"Erreur dans la migration {version}: {e}")
+                self.conn.rollback()
+                raise
     
     def setup_database(self):
         self.cursor.executescript('''
@@ -329,6 +133,7 @@ class DatabaseManager:
             );
         ''')
         self.conn.commit()
+        self.migrate()
 
     def register_user(self, user_id: int, username: str) -> bool:
         """Inscrit un nouvel utilisateur dans la base de données"""
@@ -377,61 +182,9 @@ class DatabaseManager:
             self.conn.rollback()
             return False
 
-    def get_player_rank(self, balance: int) -> tuple[str, str, float, Optional[str]]:
-        """
-        Retourne le rang du joueur basé sur son solde
-        Returns: (emoji, titre, progression, prochain_rang)
-        """
-        ranks = [
-            (0, "🤡 Clochard du Casino"),
-            (500, "🎲 Joueur Amateur"),
-            (1000, "🎰 Joueur Lambda"),
-            (2500, "💰 Petit Parieur"),
-            (5000, "💎 Parieur Régulier"),
-            (10000, "🎩 High Roller"),
-            (25000, "👑 Roi du Casino"),
-            (50000, "🌟 VIP Diamond"),
-            (100000, "🔥 Parieur Fou"),
-            (250000, "🌈 Légende du Casino"),
-            (500000, "⚡ Master des Tables"),
-            (1000000, "🌌 Empereur du Gambling"),
-            (1500000, "🎭 Maître du Destin"),
-            (2000000, "🏆 Champion Suprême"),
-            (2500000, "💫 Star du Casino"),
-            (3000000, "🌠 Célébrité des Tables"),
-            (4000000, "👻 Fantôme des Casinos"),
-            (5000000, "⚜️ Noble du Gambling"),
-            (6000000, "🎪 Maître du Cirque"),
-            (7000000, "🎇 Étoile Filante"),
-            (8000000, "💎 Diamond Master"),
-            (9000000, "🌋 Volcan du Gambling"),
-            (10000000, "🔱 Dieu du Casino")
-        ]
-    
-        current_rank = ranks[0]
-        for threshold, rank in ranks:
-            if balance >= threshold:
-                current_rank = (threshold, rank)
-            else:
-                break
-            
-        current_index = ranks.index(current_rank)
-        next_rank = ranks[current_index + 1] if current_index < len(ranks) - 1 else None
-    
-        emoji, title = current_rank[1].split(" ", 1)
-    
-        if next_rank:
-            current_threshold = current_rank[0]
-            next_threshold = next_rank[0]
-            progress = ((balance - current_threshold) / (next_threshold - current_threshold)) * 100
-            progress = min(100, max(0, progress))
-        else:
-            progress = 100
-
-        return emoji, title, progress, next_rank[1] if next_rank else None
-
     def get_balance(self, user_id: int) -> int:
         """Récupère le solde d'un utilisateur"""
+        self.flush_results()
         try:
             cursor = self.conn.cursor()
             cursor.execute('SELECT balance FROM users WHERE user_id = ?', (user_id,))
@@ -444,6 +197,8 @@ class DatabaseManager:
 
     def set_balance(self, user_id: int, amount: int) -> None:
         """Met à jour le solde d'un utilisateur"""
+        # Un règlement encore en file s'appliquerait sinon par-dessus le nouveau solde
+        self.flush_results()
         try:
             cursor = self.conn.cursor()
             cursor.execute('UPDATE users SET balance = ? WHERE user_id = ?', (amount, user_id))
@@ -453,6 +208,25 @@ class DatabaseManager:
             print(f"Erreur dans set_balance: {e}")
             self.conn.rollback()
 
+    def adjust_balance(self, user_id: int, delta: int, min_balance: int = 0) -> Optional[int]:
+        """
+        Ajoute delta au solde en une seule requête, sans lecture préalable
+        Returns: le nouveau solde, ou None si le solde passerait sous min_balance
+        """
+        self.flush_results()
+        try:
+            with self.conn:
+                cursor = self.conn.execute(
+                    'UPDATE users SET balance = balance + ? WHERE user_id = ? AND balance + ? >= ?',
+                    (delta, user_id, delta, min_balance)
+                )
+                if cursor.rowcount == 0:
+                    return None
+                return self.conn.execute('SELECT balance FROM users WHERE user_id = ?', (user_id,)).fetchone()[0]
+        except Exception as e:
+            print(f"Erreur dans adjust_balance: {e}")
+            return None
+
     def user_exists(self, user_id: int) -> bool:
         """Vérifie si un utilisateur existe dans la base de données"""
         cursor = self.conn.cursor()
@@ -463,6 +237,7 @@ class DatabaseManager:
 
     def get_games_played(self, user_id: int) -> int:
         """Récupère le nombre total de parties jouées"""
+        self.flush_results()
         try:
             cursor = self.conn.cursor()
             cursor.execute('SELECT games_played FROM users WHERE user_id = ?', (user_id,))
@@ -475,6 +250,7 @@ class DatabaseManager:
 
     def get_wins(self, user_id: int) -> int:
         """Récupère le nombre total de victoires"""
+        self.flush_results()
         try:
             cursor = self.conn.cursor()
             cursor.execute('SELECT games_won FROM users WHERE user_id = ?', (user_id,))
@@ -487,6 +263,7 @@ class DatabaseManager:
 
     def get_stats(self, user_id: int) -> dict:
         """Récupère toutes les statistiques d'un joueur"""
+        self.flush_results()
         try:
             cursor = self.conn.cursor()
             cursor.execute('''
@@ -517,34 +294,77 @@ class DatabaseManager:
 
     def update_game_result(self, user_id: int, bet_amount: int, result: str):
         """Met à jour les statistiques après une partie"""
-        multiplier = {
-            'win': 2,
-            'blackjack': 2.5,
-            'lose': 0,
-            'push': 1
-        }.get(result, 0)
-        
-        winnings = int(bet_amount * multiplier)
-        
-        self.cursor.execute('''
-            UPDATE users 
-            SET balance = balance + ?,
-                games_played = games_played + 1,
-                games_won = games_won + CASE WHEN ? IN ('win', 'blackjack') THEN 1 ELSE 0 END,
-                total_bets = total_bets + ?,
-                biggest_win = CASE 
-                    WHEN ? > biggest_win AND ? IN ('win', 'blackjack')
-                    THEN ? ELSE biggest_win 
-                END
-            WHERE user_id = ?
-        ''', (winnings - bet_amount, result, bet_amount, winnings, result, winnings, user_id))
-        
-        self.cursor.execute('''
-            INSERT INTO game_history (user_id, bet_amount, result, timestamp)
-            VALUES (?, ?, ?, ?)
-        ''', (user_id, bet_amount, result, datetime.utcnow()))
-        
-        self.conn.commit()
+        self.settle_game([(user_id, bet_amount, result)])
+
+    def settle_game(self, results: List[tuple]) -> bool:
+        """
+        Règle tous les résultats d'une partie terminée
+        results: liste de (user_id, mise, résultat)
+        """
+        if not results:
+            return True
+        if self.write_behind:
+            self._pending_results.extend(results)
+            return True
+        return self._apply_results(results)
+
+    def has_pending_results(self) -> bool:
+        return bool(self._pending_results)
+
+    def flush_results(self) -> bool:
+        """Écrit les règlements en attente en une seule transaction"""
+        if not self._pending_results:
+            return True
+        results, self._pending_results = self._pending_results, []
+        if self._apply_results(results):
+            return True
+        # Remettre en file pour le prochain essai
+        self._pending_results[:0] = results
+        return False
+
+    def _apply_results(self, results: List[tuple]) -> bool:
+        """Applique une liste de résultats (UPDATE + historique) dans une transaction"""
+        now = datetime.utcnow()
+        user_ids = list({user_id for user_id, _, _ in results})
+        try:
+            with self.conn:
+                # Soldes lus une seule fois, puis suivis en mémoire résultat par résultat
+                placeholders = ','.join('?' * len(user_ids))
+                balances = dict(self.conn.execute(
+                    f'SELECT user_id, balance FROM users WHERE user_id IN ({placeholders})', user_ids
+                ).fetchall())
+
+                user_rows = []
+                history_rows = []
+                for user_id, bet_amount, result in results:
+                    winnings = int(bet_amount * PAYOUT_MULTIPLIERS.get(result, 0))
+                    delta = winnings - bet_amount
+                    balance_before = balances.get(user_id)
+                    balance_after = None if balance_before is None else balance_before + delta
+                    balances[user_id] = balance_after
+                    user_rows.append((delta, result, bet_amount, winnings, result, winnings, user_id))
+                    history_rows.append((user_id, bet_amount, result, now, balance_before, balance_after, delta))
+
+                self.conn.executemany('''
+                    UPDATE users 
+                    SET balance = balance + ?,
+                        games_played = games_played + 1,
+                        games_won = games_won + CASE WHEN ? IN ('win', 'blackjack') THEN 1 ELSE 0 END,
+                        total_bets = total_bets + ?,
+                        biggest_win = CASE 
+                            WHEN ? > biggest_win AND ? IN ('win', 'blackjack')
+                            THEN ? ELSE biggest_win 
+                        END
+                    WHERE user_id = ?
+                ''', user_rows)
+                self.conn.executemany('''
+                    INSERT INTO game_history (user_id, bet_amount, result, timestamp, balance_before, balance_after, delta)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', history_rows)
+            return True
+        except Exception as e:
+            print(f"Erreur dans _apply_results: {e}")
+            return False
 
     def can_claim_daily(self, user_id: int) -> tuple[bool, Optional[timedelta]]:
         """Vérifie si l'utilisateur peut réclamer sa récompense journalière"""
@@ -573,6 +393,7 @@ class DatabaseManager:
 
     def claim_daily(self, user_id: int, amount: int) -> bool:
         """Donne la récompense journalière à l'utilisateur"""
+        self.flush_results()
         try:
             cursor = self.conn.cursor()
             cursor.execute('''
@@ -589,18 +410,398 @@ class DatabaseManager:
             self.conn.rollback()
             return False
 
+    def get_last_daily(self, user_id: int) -> Optional[str]:
+        """Récupère la date du dernier bonus quotidien"""
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT last_daily FROM users WHERE user_id = ?', (user_id,))
+        result = cursor.fetchone()
+        cursor.close()
+        return result[0] if result else None
+
+    def get_top_players(self, limit: int = 50) -> List[tuple]:
+        """Récupère les meilleurs joueurs (username, balance)"""
+        self.flush_results()
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT username, balance 
+            FROM users 
+            ORDER BY balance DESC 
+            LIMIT ?
+        """, (limit,))
+        rankings = cursor.fetchall()
+        cursor.close()
+        return rankings
+
+    def get_all_balances(self) -> List[tuple]:
+        """Récupère (user_id, username, balance) de tous les joueurs"""
+        self.flush_results()
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT user_id, username, balance FROM users')
+        rows = cursor.fetchall()
+        cursor.close()
+        return rows
+
+    def get_balances(self, user_ids: List[int]) -> List[tuple]:
+        """Récupère (user_id, username, balance) pour une liste de joueurs"""
+        if not user_ids:
+            return []
+        self.flush_results()
+        cursor = self.conn.cursor()
+        placeholders = ','.join('?' * len(user_ids))
+        cursor.execute(f'SELECT user_id, username, balance FROM users WHERE user_id IN ({placeholders})', list(user_ids))
+        rows = cursor.fetchall()
+        cursor.close()
+        return rows
+
+    def reset_all_balances(self, amount: int) -> int:
+        """Réinitialise le solde de tous les joueurs et retourne le nombre de joueurs"""
+        self.flush_results()
+        with self.conn:
+            self.conn.execute('UPDATE users SET balance = ?', (amount,))
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT COUNT(*) FROM users')
+        count = cursor.fetchone()[0]
+        cursor.close()
+        return count
+
+    def find_user_id_by_username(self, username: str) -> Optional[int]:
+        """Recherche l'ID d'un joueur à partir de son nom (recherche souple)"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT user_id FROM users 
+            WHERE LOWER(REPLACE(username, '_', '')) = LOWER(REPLACE(?, '_', ''))
+            OR username LIKE ?
+        ''', (username, f"%{username}%"))
+        result = cursor.fetchone()
+        cursor.close()
+        return result[0] if result else None
+
+    def get_history_page(self, user_id: int, limit: int, cursor: Optional[int] = None,
+                         backward: bool = False) -> List[tuple]:
+        """
+        Récupère une page d'historique, de la plus récente à la plus ancienne partie
+        (game_id, mise, résultat, date, variation, solde avant, solde après).
+        cursor: game_id à partir duquel lire les parties plus anciennes,
+        ou plus récentes si backward
+        """
+        self.flush_results()
+        query = '''
+            SELECT game_id, bet_amount, result, timestamp, delta, balance_before, balance_after
+            FROM game_history
+            WHERE user_id = ?
+        '''
+        params = [user_id]
+        if cursor is not None:
+            query += ' AND game_id > ?' if backward else ' AND game_id < ?'
+            params.append(cursor)
+        query += ' ORDER BY game_id ASC LIMIT ?' if backward else ' ORDER BY game_id DESC LIMIT ?'
+        params.append(limit)
+
+        db_cursor = self.conn.cursor()
+        db_cursor.execute(query, params)
+        history = db_cursor.fetchall()
+        db_cursor.close()
+        if backward:
+            history.reverse()
+        return history
+
     def close(self):
         """Ferme la connexion à la base de données"""
         self.conn.close()
 
+class AsyncDatabase:
+    """
+    Accès asynchrone à la base : les écritures passent par un thread dédié
+    (une seule connexion, ordre préservé), les lectures par un petit pool de connexions.
+    Chaque méthode de DatabaseManager est exposée sous forme de coroutine.
+    """
+    READ_METHODS = {
+        'get_username', 'get_balance', 'user_exists', 'get_games_played', 'get_wins',
+        'get_stats', 'can_claim_daily', 'get_last_daily', 'get_top_players',
+        'find_user_id_by_username', 'get_history_page',
+        'get_all_balances', 'get_balances'
+    }
+
+    def __init__(self, path: str = DB_PATH, read_pool_size: int = DB_READ_POOL_SIZE, write_behind: bool = False):
+        self._writer = DatabaseManager(path, write_behind=write_behind)
+        self._write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+        self._readers = queue.SimpleQueue()
+        self._reader_conns = []
+        for _ in range(read_pool_size):
+            reader = DatabaseManager(path, setup=False)
+            self._reader_conns.append(reader)
+            self._readers.put(reader)
+        self._read_executor = ThreadPoolExecutor(max_workers=read_pool_size, thread_name_prefix='db-reader')
+
+    @property
+    def write_behind(self) -> bool:
+        return self._writer.write_behind
+
+    async def _write(self, name: str, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._write_executor, partial(getattr(self._writer, name), *args))
+
+    def _run_read(self, name: str, args: tuple):
+        reader = self._readers.get()
+        try:
+            return getattr(reader, name)(*args)
+        finally:
+            self._readers.put(reader)
+
+    async def _read(self, name: str, *args):
+        # Les lectures doivent voir les règlements encore en file d'attente
+        if self._writer.has_pending_results():
+            await self._write('flush_results')
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._read_executor, self._run_read, name, args)
+
+    def __getattr__(self, name: str):
+        if name.startswith('_') or not callable(getattr(DatabaseManager, name, None)):
+            raise AttributeError(name)
+        runner = self._read if name in self.READ_METHODS else self._write
+
+        async def call(*args):
+            return await runner(name, *args)
+        return call
 
     def close(self):
-        """Ferme la connexion à la base de données"""
-        self.conn.close()
+        """Vide la file d'écriture et ferme toutes les connexions"""
+        self._write_executor.submit(self._writer.flush_results).result()
+        self._write_executor.shutdown(wait=True)
+        self._read_executor.shutdown(wait=True)
+        self._writer.close()
+        for reader in self._reader_conns:
+            reader.close()
+
+class NameCache:
+    """Cache LRU avec expiration des prénoms des joueurs (évite un get_chat par rendu)"""
+
+    def __init__(self, max_size: int = 2048, ttl_seconds: int = 3600):
+        self.max_size = max_size
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self._entries: OrderedDict[int, tuple[str, datetime]] = OrderedDict()
+
+    def set(self, user_id: int, name: Optional[str]) -> None:
+        """Enregistre (ou rafraîchit) le nom d'un joueur"""
+        if not name:
+            return
+        self._entries[user_id] = (name, datetime.utcnow())
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def get(self, user_id: int) -> Optional[str]:
+        """Retourne le nom en cache s'il n'a pas expiré"""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        name, stored_at = entry
+        if datetime.utcnow() - stored_at > self.ttl:
+            del self._entries[user_id]
+            return None
+        self._entries.move_to_end(user_id)
+        return name
+
+    async def resolve(self, bot, user_id: int) -> str:
+        """Retourne le nom du joueur, en interrogeant Telegram seulement si absent du cache"""
+        name = self.get(user_id)
+        if name is not None:
+            return name
+        try:
+            name = (await bot.get_chat(user_id)).first_name
+        except Exception as e:
+            print(f"Erreur get_chat pour {user_id}: {e}")
+            name = await db.get_username(user_id) or str(user_id)
+        self.set(user_id, name)
+        return name
+
+    async def resolve_many(self, bot, user_ids) -> Dict[int, str]:
+        """Résout les noms de plusieurs joueurs en une fois"""
+        return {user_id: await self.resolve(bot, user_id) for user_id in user_ids}
+
+class RenderedMessages:
+    """Empreinte du dernier rendu envoyé pour chaque message (LRU), pour ne pas rééditer un message identique"""
 
-db = DatabaseManager()
-active_games: Dict[int, MultiPlayerGame] = {}  # {host_id: game}
-waiting_games: Set[int] = set()  # host_ids of games waiting for players
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self._hashes: OrderedDict[tuple[int, int], int] = OrderedDict()  # {(chat_id, message_id): empreinte}
+
+    @staticmethod
+    def fingerprint(text: str, reply_markup=None) -> int:
+        return hash((text, reply_markup.to_json() if reply_markup is not None else None))
+
+    def is_current(self, chat_id: int, message_id: int, fingerprint: int) -> bool:
+        return self._hashes.get((chat_id, message_id)) == fingerprint
+
+    def set(self, chat_id: int, message_id: int, fingerprint: int) -> None:
+        key = (chat_id, message_id)
+        self._hashes[key] = fingerprint
+        self._hashes.move_to_end(key)
+        while len(self._hashes) > self.max_size:
+            self._hashes.popitem(last=False)
+
+    def forget(self, chat_id: int, message_id: int) -> None:
+        self._hashes.pop((chat_id, message_id), None)
+
+class Leaderboard:
+    """Classement en mémoire trié par solde décroissant, mis à jour à chaque changement de solde"""
+
+    def __init__(self):
+        self._entries: Dict[int, tuple[int, str]] = {}  # {user_id: (balance, username)}
+        self._order: List[tuple[int, int]] = []         # [(-balance, user_id)] trié
+
+    def load(self, rows) -> None:
+        """Reconstruit le classement à partir de (user_id, username, balance)"""
+        self._entries = {user_id: (balance, username) for user_id, username, balance in rows}
+        self._order = sorted((-balance, user_id) for user_id, (balance, _) in self._entries.items())
+
+    def update(self, user_id: int, username: str, balance: int) -> None:
+        """Met à jour la position d'un joueur après un changement de solde"""
+        old = self._entries.get(user_id)
+        if old == (balance, username):
+            return
+        if old is not None:
+            index = bisect.bisect_left(self._order, (-old[0], user_id))
+            if index < len(self._order) and self._order[index] == (-old[0], user_id):
+                del self._order[index]
+        bisect.insort(self._order, (-balance, user_id))
+        self._entries[user_id] = (balance, username)
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def top(self, limit: int = 50) -> List[tuple[str, int]]:
+        """Retourne les meilleurs joueurs (username, balance)"""
+        return [
+            (self._entries[user_id][1], -neg_balance)
+            for neg_balance, user_id in self._order[:limit]
+        ]
+
+    def page(self, after: Optional[tuple[int, int]] = None, limit: int = 10,
+             backward: bool = False) -> tuple[int, List[tuple[int, str, int]]]:
+        """
+        Page du classement à partir d'une clé (balance, user_id) :
+        les joueurs qui suivent la clé, ou qui la précèdent si backward.
+        Retourne (position du premier joueur, [(user_id, username, balance)])
+        """
+        if after is None:
+            start = 0
+        else:
+            key = (-after[0], after[1])
+            if backward:
+                start = max(bisect.bisect_left(self._order, key) - limit, 0)
+            else:
+                start = bisect.bisect_right(self._order, key)
+        return start + 1, [
+            (user_id, self._entries[user_id][1], -neg_balance)
+            for neg_balance, user_id in self._order[start:start + limit]
+        ]
+
+    def position(self, user_id: int) -> Optional[int]:
+        """Position d'un joueur dans le classement (1 = premier), None s'il n'y figure pas"""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        return bisect.bisect_left(self._order, (-entry[0], user_id)) + 1
+
+    def at(self, position: int) -> tuple[int, str, int]:
+        """Joueur (user_id, username, balance) à une position donnée"""
+        neg_balance, user_id = self._order[position - 1]
+        return user_id, self._entries[user_id][1], -neg_balance
+
+class GameRegistry:
+    """Registre des parties actives, indexé par hôte, par joueur et par chat"""
+
+    def __init__(self):
+        self._games: Dict[int, MultiPlayerGame] = {}      # {host_id: game}
+        self._by_player: Dict[int, MultiPlayerGame] = {}  # {player_id: game}
+        self._by_chat: Dict[int, MultiPlayerGame] = {}    # {chat_id: game}
+        self._waiting: Dict[int, MultiPlayerGame] = {}    # {host_id: game} dans l'ordre de création
+
+    def __contains__(self, host_id: int) -> bool:
+        return host_id in self._games
+
+    def __getitem__(self, host_id: int) -> MultiPlayerGame:
+        return self._games[host_id]
+
+    def __len__(self) -> int:
+        return len(self._games)
+
+    def get(self, host_id: int) -> Optional[MultiPlayerGame]:
+        return self._games.get(host_id)
+
+    def items(self):
+        return self._games.items()
+
+    def values(self):
+        return self._games.values()
+
+    def add(self, game: MultiPlayerGame, chat_id: Optional[int] = None) -> None:
+        """Enregistre une nouvelle partie (en attente) et indexe ses joueurs"""
+        self.remove(game.host_id)
+        self._games[game.host_id] = game
+        if game.game_status == 'waiting':
+            self._waiting[game.host_id] = game
+        if chat_id is not None:
+            self._by_chat[chat_id] = game
+        for player_id in game.players:
+            self._by_player[player_id] = game
+
+    def add_player(self, game: MultiPlayerGame, player_id: int, bet: int) -> bool:
+        """Ajoute un joueur à une partie en maintenant l'index des joueurs"""
+        if not game.add_player(player_id, bet):
+            return False
+        if self._games.get(game.host_id) is game:
+            self._by_player[player_id] = game
+        return True
+
+    def for_player(self, player_id: int) -> Optional[MultiPlayerGame]:
+        """Partie à laquelle participe un joueur"""
+        return self._by_player.get(player_id)
+
+    def for_chat(self, chat_id: int) -> Optional[MultiPlayerGame]:
+        """Dernière partie créée dans un chat"""
+        return self._by_chat.get(chat_id)
+
+    def waiting_game(self) -> Optional[MultiPlayerGame]:
+        """Première partie encore en attente de joueurs"""
+        return next(iter(self._waiting.values()), None)
+
+    def is_waiting(self, host_id: int) -> bool:
+        return host_id in self._waiting
+
+    def mark_started(self, host_id: int) -> None:
+        """Retire une partie de l'index des parties en attente"""
+        self._waiting.pop(host_id, None)
+
+    def remove(self, host_id: int) -> Optional[MultiPlayerGame]:
+        """Supprime une partie et toutes ses entrées d'index"""
+        game = self._games.pop(host_id, None)
+        if game is None:
+            return None
+        game.cancel_turn_timer()
+        self._waiting.pop(host_id, None)
+        for player_id in game.players:
+            if self._by_player.get(player_id) is game:
+                del self._by_player[player_id]
+        chat_id = getattr(game, 'initial_chat_id', None)
+        if chat_id is not None and self._by_chat.get(chat_id) is game:
+            del self._by_chat[chat_id]
+        return game
+
+db = AsyncDatabase(DB_PATH, write_behind=DB_WRITE_BEHIND)
+name_cache = NameCache()
+rendered_messages = RenderedMessages()
+active_games = GameRegistry()
+leaderboard = Leaderboard()
+table_shoes: Dict[int, Shoe] = {}  # Un sabot par chat, conservé d'une partie à l'autre
+
+def get_table_shoe(chat_id: int) -> Shoe:
+    """Retourne le sabot de la table, créé au premier besoin"""
+    shoe = table_shoes.get(chat_id)
+    if shoe is None:
+        shoe = table_shoes[chat_id] = Shoe()
+    return shoe
 
 def is_admin(user_id: int):
     """Vérifie si l'utilisateur est administrateur"""
@@ -608,69 +809,49 @@ def is_admin(user_id: int):
 
 def cleanup_player_games(player_id):
     """Nettoie toutes les références à un joueur dans les parties actives"""
-    for game_id in list(active_games.keys()):
-        if player_id in active_games[game_id].players:
-            del active_games[game_id]
-    if player_id in waiting_games:
-        waiting_games.remove(player_id)
+    game = active_games.for_player(player_id)
+    if game is not None:
+        active_games.remove(game.host_id)
+    active_games.remove(player_id)
 
-def get_player_rank(balance: int) -> tuple[str, str]:
+async def edit_message_if_changed(bot, chat_id: int, message_id: int, text: str, reply_markup=None, **kwargs) -> bool:
     """
-    Retourne le rang du joueur basé sur son solde
-    Returns: (emoji, titre)
+    Édite un message seulement si son texte ou son clavier a changé depuis le dernier rendu
+    Retourne True si l'édition a été envoyée à Telegram
     """
-    ranks = [
-        (0, "🤡 Clochard du Casino"),
-        (500, "🎲 Joueur Amateur"),
-        (1000, "🎰 Joueur Lambda"),
-        (2500, "💰 Petit Parieur"),
-        (5000, "💎 Parieur Régulier"),
-        (10000, "🎩 High Roller"),
-        (25000, "👑 Roi du Casino"),
-        (50000, "🌟 VIP Diamond"),
-        (100000, "🔥 Parieur Fou"),
-        (250000, "🌈 Légende du Casino"),
-        (500000, "⚡ Master des Tables"),
-        (1000000, "🌌 Empereur du Gambling")
-    ]
-    
-    current_rank = ranks[0]  # Rang par défaut
-    for threshold, rank in ranks:
-        if balance >= threshold:
-            current_rank = (threshold, rank)
-        else:
-            break
-            
-    # Trouve le prochain rang
-    current_index = ranks.index(current_rank)
-    next_rank = ranks[current_index + 1] if current_index < len(ranks) - 1 else None
-    
-    # Sépare l'emoji du titre
-    emoji, title = current_rank[1].split(" ", 1)
-    
-    # Calcule la progression vers le prochain rang
-    if next_rank:
-        current_threshold = current_rank[0]
-        next_threshold = next_rank[0]
-        progress = ((balance - current_threshold) / (next_threshold - current_threshold)) * 100
-        progress = min(100, max(0, progress))  # Garde entre 0 et 100
-    else:
-        progress = 100
-
-    return emoji, title, progress, next_rank[1] if next_rank else None
-    
-def get_status_emoji(status: str) -> str:
-    emojis = {
-        'waiting': '⏳',
-        'playing': '🎮',
-        'bust': '💥',
-        'stand': '⏹',
-        'blackjack': '🌟',
-        'win': '🎉',
-        'lose': '💀',
-        'push': '🤝'
-    }
-    return f"{emojis.get(status, '❓')} {status.upper()}"
+    fingerprint = rendered_messages.fingerprint(text, reply_markup)
+    if rendered_messages.is_current(chat_id, message_id, fingerprint):
+        return False
+    try:
+        await bot.edit_message_text(
+            chat_id=chat_id,
+            message_id=message_id,
+            text=text,
+            reply_markup=reply_markup,
+            **kwargs
+        )
+    except BadRequest as e:
+        # Contenu déjà à jour (rendu envoyé par un autre chemin) : rien à faire
+        if 'not modified' not in str(e).lower():
+            raise
+    rendered_messages.set(chat_id, message_id, fingerprint)
+    return True
+
+async def refresh_leaderboard(*user_ids: int):
+    """Répercute dans le classement en mémoire les soldes modifiés"""
+    for user_id, username, balance in await db.get_balances(list(user_ids)):
+        leaderboard.update(user_id, username, balance)
+
+async def load_leaderboard(application: Application):
+    """Charge le classement complet au démarrage"""
+    leaderboard.load(await db.get_all_balances())
+
+async def settle_finished_game(game: MultiPlayerGame):
+    """Enregistre en base les résultats d'une partie terminée (une seule fois)"""
+    results, game.settlement = game.settlement, []
+    if results:
+        await db.settle_game(results)
+        await refresh_leaderboard(*{user_id for user_id, _, _ in results})
 
 def is_forbidden_thread(message):
     """Vérifie si le message est dans un thread interdit"""
@@ -694,52 +875,25 @@ async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if is_forbidden_thread(update.message): return
 
     # Vérifier si l'utilisateur existe déjà dans la base de données
-    if not db.user_exists(user.id):
+    if not await db.user_exists(user.id):
         # Inscrire l'utilisateur avec les valeurs par défaut
-        if db.register_user(user.id, user.first_name):
-            welcome_message = (
-                f"👋 Bienvenue {user.first_name} !\n\n"
-                f"💰 Je vous offre 1000 coins pour commencer !\n\n"
-                f"Commandes disponibles :\n"
-                f"/bank - Voir votre solde\n"
-                f"/daily - Réclamer votre bonus quotidien\n"
-                f"/stats - Voir vos statistiques"
-            )
+        if await db.register_user(user.id, user.first_name):
+            await refresh_leaderboard(user.id)
+            welcome_message = render_welcome(user.first_name)
         else:
             welcome_message = "❌ Une erreur s'est produite lors de votre inscription. Réessayez plus tard."
     else:
         # Obtenir les statistiques du joueur existant
-        stats = db.get_stats(user.id)
-        emoji, title, progress, next_rank = db.get_player_rank(stats['balance'])
-        
-        welcome_message = (
-            f"👋 Re-bonjour {user.first_name} !\n\n"
-            f"💰 Votre solde : {stats['balance']} coins\n"
-            f"{emoji} Rang : {title}\n"
-        )
-        
-        if next_rank:
-            welcome_message += f"📈 Progression : {progress:.1f}% vers {next_rank}\n"
-        
-        welcome_message += (
-            f"\nCommandes disponibles :\n"
-            f"/bank - Voir votre solde\n"
-            f"/daily - Réclamer votre bonus quotidien\n"
-            f"/stats - Voir vos statistiques"
-        )
+        stats = await db.get_stats(user.id)
+        welcome_message = render_welcome(user.first_name, stats['balance'])
 
     await update.message.reply_text(welcome_message)
 
 async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
-    stats = db.get_stats(user.id)
-    
-    emoji, rank_title, progress, next_rank = db.get_player_rank(stats['balance'])
+    stats = await db.get_stats(user.id)
     
-    # Barre de progression
-    progress_bar_length = 10
-    filled_length = int(progress_bar_length * progress / 100)
-    progress_bar = "█" * filled_length + "░" * (progress_bar_length - filled_length)
+    emoji, rank_title, progress, next_rank = get_player_rank(stats['balance'])
     
     win_rate = (stats['games_won'] / stats['games_played'] * 100) if stats['games_played'] > 0 else 0
     
@@ -753,7 +907,7 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if next_rank:
         stats_text += (
             f"\n*Progression vers {next_rank}*\n"
-            f"[{progress_bar}] {progress:.1f}%\n"
+            f"[{progress_bar(progress)}] {progress:.1f}%\n"
         )
     else:
         stats_text += "\n🏆 *Rang Maximum Atteint !*\n"
@@ -802,11 +956,12 @@ async def set_credits(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
             
         # Vérifier si l'utilisateur existe
-        if not db.user_exists(target_id):
+        if not await db.user_exists(target_id):
             await update.message.reply_text("❌ Utilisateur non trouvé.")
             return
             
-        db.set_balance(target_id, amount)
+        await db.set_balance(target_id, amount)
+        await refresh_leaderboard(target_id)
         
         await update.message.reply_text(
             f"✅ *Crédits modifiés*\n"
@@ -846,18 +1001,17 @@ async def add_credits(update: Update, context: ContextTypes.DEFAULT_TYPE):
         amount = int(context.args[1])
         
         # Vérifier si l'utilisateur existe
-        if not db.user_exists(target_id):
+        if not await db.user_exists(target_id):
             await update.message.reply_text("❌ Utilisateur non trouvé.")
             return
             
-        current_balance = db.get_balance(target_id)
-        new_balance = current_balance + amount
+        # Ajout relatif : un règlement ou un bonus validé entre-temps n'est pas écrasé
+        new_balance = await db.adjust_balance(target_id, amount)
         
-        if new_balance < 0:
+        if new_balance is None:
             await update.message.reply_text("❌ Le solde ne peut pas être négatif.")
             return
-            
-        db.set_balance(target_id, new_balance)
+        await refresh_leaderboard(target_id)
         
         # Emoji en fonction si on ajoute ou retire des crédits
         operation_emoji = "➕" if amount >= 0 else "➖"
@@ -881,13 +1035,12 @@ async def daily(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     current_time = datetime.utcnow()
     
-    db.cursor.execute('SELECT last_daily FROM users WHERE user_id = ?', (user.id,))
-    result = db.cursor.fetchone()
-    
     if await handle_forbidden_thread(update.message): return
 
-    if result and result[0]:
-        last_daily = datetime.fromisoformat(result[0])
+    last_daily_value = await db.get_last_daily(user.id)
+
+    if last_daily_value:
+        last_daily = datetime.fromisoformat(last_daily_value)
         if current_time - last_daily < timedelta(days=1):
             next_daily = last_daily + timedelta(days=1)
             time_remaining = next_daily - current_time
@@ -903,18 +1056,14 @@ async def daily(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
 
     bonus = 1000
-    db.cursor.execute('''
-        UPDATE users 
-        SET balance = balance + ?, 
-            last_daily = ?
-        WHERE user_id = ?
-    ''', (bonus, current_time, user.id))
-    db.conn.commit()
+    await db.claim_daily(user.id, bonus)
+    await refresh_leaderboard(user.id)
+    new_balance = await db.get_balance(user.id)
     
     await update.message.reply_text(
         f"🎁 *BONUS QUOTIDIEN !*\n\n"
         f"💰 +{bonus} coins ajoutés à votre compte\n"
-        f"💳 Nouveau solde: {db.get_balance(user.id)} coins",
+        f"💳 Nouveau solde: {new_balance} coins",
         parse_mode=ParseMode.MARKDOWN
     )
 
@@ -927,17 +1076,17 @@ async def create_game(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message_thread_id = GAME_THREAD_ID
     if await handle_forbidden_thread(update.message): return
     # Vérifier s'il y a déjà une partie en cours dans ce chat
-    for g in active_games.values():
-        if hasattr(g, 'initial_chat_id') and g.initial_chat_id == chat_id and g.game_status == 'playing':
-            error_msg = await context.bot.send_message(
-                chat_id=chat_id,
-                message_thread_id=message_thread_id,
-                text="❌ Une partie est déjà en cours dans ce chat!"
-            )
-            await message.delete()
-            await asyncio.sleep(3)
-            await error_msg.delete()
-            return
+    chat_game = active_games.for_chat(chat_id)
+    if chat_game is not None and chat_game.game_status == 'playing':
+        error_msg = await context.bot.send_message(
+            chat_id=chat_id,
+            message_thread_id=message_thread_id,
+            text="❌ Une partie est déjà en cours dans ce chat!"
+        )
+        await message.delete()
+        await asyncio.sleep(3)
+        await error_msg.delete()
+        return
 
     # Supprimer UNIQUEMENT le message "partie terminée" s'il existe
     if chat_id in last_end_game_message:
@@ -973,7 +1122,7 @@ async def create_game(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     # Vérifier le solde
-    balance = db.get_balance(user.id)
+    balance = await db.get_balance(user.id)
     if balance < bet_amount:
         error_msg = await context.bot.send_message(
             chat_id=chat_id,
@@ -987,11 +1136,7 @@ async def create_game(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     # Vérifier s'il y a une partie en attente
-    existing_game = None
-    for g in active_games.values():
-        if g.game_status == 'waiting':
-            existing_game = g
-            break
+    existing_game = active_games.waiting_game()
 
     if existing_game:
         # Rejoindre la partie existante
@@ -1006,7 +1151,8 @@ async def create_game(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await error_msg.delete()
             return
 
-        if existing_game.add_player(user.id, bet_amount):
+        if active_games.add_player(existing_game, user.id, bet_amount):
+            name_cache.set(user.id, user.first_name)
             await message.delete()
             
             # Préparer le texte des joueurs
@@ -1014,13 +1160,13 @@ async def create_game(update: Update, context: ContextTypes.DEFAULT_TYPE):
             total_bets = 0
 
             for player_id, player_data in existing_game.players.items():
-                player = await context.bot.get_chat(player_id)
-                emoji, rank_title, _, _ = db.get_player_rank(db.get_balance(player_id))
+                player_name = await name_cache.resolve(context.bot, player_id)
+                emoji, rank_title, _, _ = get_player_rank(await db.get_balance(player_id))
                 bet = player_data['bet']
                 total_bets += bet
                 
                 players_text += (
-                    f"└ {emoji} {player.first_name} ➜ {bet} 💵\n"
+                    f"└ {emoji} {player_name} ➜ {bet} 💵\n"
                     f"   ├ Rang: {rank_title}\n"
                     f"   └ Gains possibles:\n"
                     f"      ├ Blackjack: +{int(bet * 2.5)} 💵\n"
@@ -1073,14 +1219,14 @@ async def create_game(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Créer une nouvelle partie
     cleanup_player_games(user.id)
     
-    game = MultiPlayerGame(user.id, user.first_name)
+    game = MultiPlayerGame(user.id, user.first_name, shoe=get_table_shoe(chat_id))
+    name_cache.set(user.id, user.first_name)
     game.initial_chat_id = chat_id
     game.add_player(user.id, bet_amount)
-    active_games[user.id] = game
-    waiting_games.add(user.id)
+    active_games.add(game, chat_id)
     
     # Obtenir le rang du créateur
-    emoji, rank_title, _, _ = db.get_player_rank(balance)
+    emoji, rank_title, _, _ = get_player_rank(balance)
     
     # Créer le keyboard markup pour le créateur
     keyboard = InlineKeyboardMarkup([[
@@ -1142,9 +1288,9 @@ async def start_game(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Démarrer la partie
     if game.start_game():
-        if user.id in waiting_games:
-            waiting_games.remove(user.id)
+        active_games.mark_started(user.id)
         await display_game(update, context, game)
+        schedule_turn_timeout(context, game)
     else:
         await update.message.reply_text("❌ Impossible de démarrer la partie!")
 
@@ -1170,106 +1316,15 @@ async def display_game(update: Update, context: ContextTypes.DEFAULT_TYPE, game:
             game.resolve_dealer()
             game.determine_winners()
 
-    current_time = (datetime.utcnow() + timedelta(hours=1)).strftime("%H:%M")
-
-    game_text = (
-        "═══『 BLACKJACK 』═══\n\n"
-    )
-    
-    # Croupier
-    dealer_cards = ' '.join(str(card) for card in game.dealer_hand)
-    dealer_total = game.calculate_hand(game.dealer_hand)
-    if game.game_status == 'playing':
-        dealer_cards = f"{str(game.dealer_hand[0])} 🎴"
-        dealer_total = "?"
-    
-    game_text += (
-        f"👨‍💼 *DEALER* │ {dealer_cards}\n"
-        f"├ Total: {dealer_total}\n"
-        "──────────────\n\n"
-    )
-    
-    # Joueurs
-    for player_id, player_data in game.players.items():
-        user = await context.bot.get_chat(player_id)
-        hands = [player_data['hand']]
-        if 'second_hand' in player_data:
-            hands.append(player_data['second_hand'])
-        
-        for index, hand in enumerate(hands):
-            total = game.calculate_hand(hand)
-            # Utiliser le bon statut selon la main
-            if index == 0:
-                status = player_data.get('first_status', player_data['status'])
-            else:
-                status = player_data.get('second_status', 'playing')
-            
-            result_text = ""
-            status_icon = get_status_emoji(status)
-
-            if status == 'blackjack':
-                winnings = int(player_data['bet'] * 2.5)
-                result_text = f"+{winnings}"
-            elif status == 'win':
-                winnings = player_data['bet'] * 2
-                result_text = f"+{winnings}"
-            elif status == 'lose':
-                result_text = f"-{player_data['bet']}"
-            elif status == 'push':
-                result_text = "±0"
-            elif status == 'bust':
-                result_text = f"-{player_data['bet']}"
-
-            game_text += (
-                f"{status_icon} *{user.first_name}* │ {' '.join(str(card) for card in hand)}\n"
-                f"├ Total: {total}\n"
-                f"├ Mise: {player_data['bet']} 💵"
-            )
-            if index == 1:
-                game_text += " (Seconde main)"
-            if result_text and game.game_status == 'finished':
-                game_text += f" │ {result_text}"
-            game_text += "\n──────────────\n\n"
-
-    # Résultats finaux
+    # Régler les gains en base (hors boucle asyncio) dès que la partie est terminée
     if game.game_status == 'finished':
-        game_text += "*RÉSULTATS*\n"
-        for player_id, player_data in game.players.items():
-            user = await context.bot.get_chat(player_id)
-            first_status = player_data.get('first_status', player_data['status'])
-            second_status = player_data.get('second_status', None)
-            total_result = 0
-
-            # Calculer le résultat de la première main
-            if first_status == 'blackjack':
-                total_result += int(player_data['bet'] * 2.5)
-            elif first_status == 'win':
-                total_result += player_data['bet'] * 2
-            elif first_status in ['lose', 'bust']:
-                total_result -= player_data['bet']
-
-            # Calculer le résultat de la seconde main
-            if second_status:
-                if second_status == 'win':
-                    total_result += player_data['bet'] * 2
-                elif second_status in ['lose', 'bust']:
-                    total_result -= player_data['bet']
-
-            # Afficher le résultat total
-            if total_result > 0:
-                game_text += f"💰 {user.first_name}: *+{total_result}*\n"
-            elif total_result < 0:
-                game_text += f"💸 {user.first_name}: *{total_result}*\n"
-            else:
-                game_text += f"🤝 {user.first_name}: *±0*\n"
+        await settle_finished_game(game)
 
-        game_text += "\n🎮 */bj [mise]* pour rejouer"
-    elif current_player_id := game.get_current_player_id():
-        player_name = (await context.bot.get_chat(current_player_id)).first_name
-        game_text += f"👉 C'est à *{player_name}* de jouer"
+    current_time = (datetime.utcnow() + timedelta(hours=1)).strftime("%H:%M")
 
-    # Footer
-    game_text += f"\n\n⌚️ {current_time}"
+    # Noms des joueurs (depuis le cache, sans appel réseau dans le cas courant)
+    player_names = await name_cache.resolve_many(context.bot, game.players)
+    game_text = render_game(game, player_names, current_time)
 
     # Boutons de jeu
     keyboard = None
@@ -1281,8 +1336,8 @@ async def display_game(update: Update, context: ContextTypes.DEFAULT_TYPE, game:
             ]
         ]
         
-        if game.can_split(current_player_id):
-            current_balance = db.get_balance(current_player_id)
+        current_balance = await db.get_balance(current_player_id)
+        if game.can_split(current_player_id, current_balance):
             bet_amount = game.players[current_player_id]['bet']
             if current_balance >= bet_amount:  # Vérifier si le joueur a assez pour splitter
                 buttons.append([
@@ -1294,11 +1349,14 @@ async def display_game(update: Update, context: ContextTypes.DEFAULT_TYPE, game:
     try:
         if game.game_status == 'finished':
             if update.callback_query:
+                message = update.callback_query.message
+                rendered_messages.forget(message.chat_id, message.message_id)
                 try:
-                    await update.callback_query.message.delete()
+                    await message.delete()
                 except Exception:
                     pass
             elif chat_id in game_messages:
+                rendered_messages.forget(chat_id, game_messages[chat_id])
                 try:
                     await context.bot.delete_message(
                         chat_id=chat_id,
@@ -1314,11 +1372,7 @@ async def display_game(update: Update, context: ContextTypes.DEFAULT_TYPE, game:
                 parse_mode=ParseMode.MARKDOWN
             )
 
-            host_id = game.host_id
-            if host_id in active_games:
-                del active_games[host_id]
-            if host_id in waiting_games:
-                waiting_games.remove(host_id)
+            active_games.remove(game.host_id)
             if chat_id in game_messages:
                 del game_messages[chat_id]
 
@@ -1332,18 +1386,15 @@ async def display_game(update: Update, context: ContextTypes.DEFAULT_TYPE, game:
             last_end_game_message[chat_id] = end_message.message_id
         else:
             if update.callback_query:
-                await update.callback_query.message.edit_text(
-                    text=game_text,
-                    reply_markup=keyboard,
-                    parse_mode=ParseMode.MARKDOWN
+                message = update.callback_query.message
+                await edit_message_if_changed(
+                    context.bot, message.chat_id, message.message_id, game_text,
+                    reply_markup=keyboard, parse_mode=ParseMode.MARKDOWN
                 )
             elif chat_id in game_messages:
-                await context.bot.edit_message_text(
-                    chat_id=chat_id,
-                    message_id=game_messages[chat_id],
-                    text=game_text,
-                    reply_markup=keyboard,
-                    parse_mode=ParseMode.MARKDOWN
+                await edit_message_if_changed(
+                    context.bot, chat_id, game_messages[chat_id], game_text,
+                    reply_markup=keyboard, parse_mode=ParseMode.MARKDOWN
                 )
             else:
                 message = await context.bot.send_message(
@@ -1354,6 +1405,7 @@ async def display_game(update: Update, context: ContextTypes.DEFAULT_TYPE, game:
                     parse_mode=ParseMode.MARKDOWN
                 )
                 game_messages[chat_id] = message.message_id
+                rendered_messages.set(chat_id, message.message_id, rendered_messages.fingerprint(game_text, keyboard))
 
     except Exception as e:
         print(f"Error in display_game: {e}")
@@ -1366,6 +1418,8 @@ async def cmds(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "└─ `/join [mise]` - Rejoindre la partie\n"
         "📊 *Informations:*\n"
         "└─ `/stats` - Voir vos statistiques\n"
+        "└─ `/top` - Classement complet\n"
+        "└─ `/position` - Votre position au classement\n"
         "└─ `/infos` - Règles du jeu\n"
         "└─ `/cmds` - Liste des commandes\n\n"
         "💰 *Économie:*\n"
@@ -1375,10 +1429,23 @@ async def cmds(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     await update.message.reply_text(commands_text, parse_mode=ParseMode.MARKDOWN)
 
+# Réponses affichées selon l'issue renvoyée par le moteur
+HIT_MESSAGES = {
+    'first_bust': "💥 Première main bust! Passons à la seconde main.",
+    'bust': "💥 Vous avez dépassé 21!",
+    'first_blackjack': "🌟 Blackjack sur la première main! Passons à la seconde.",
+    'blackjack': "🌟 Blackjack!",
+}
+STAND_MESSAGES = {
+    'first_stand': "⏹ Vous restez sur la première main, à la seconde",
+    'stand': "⏹ Vous restez",
+}
+
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     user = query.from_user
     chat_id = update.effective_chat.id
+    name_cache.set(user.id, user.first_name)  # Rafraîchit le cache gratuitement
 
     if query.data.startswith("admin_"):
         if not is_admin(user.id):
@@ -1397,9 +1464,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Ajouter cette partie pour gérer l'action "cancel"
         if action == "cancel":
             # Supprimer la partie des jeux actifs
-            del active_games[host_id]
-            if host_id in waiting_games:
-                waiting_games.remove(host_id)
+            active_games.remove(host_id)
                 
             # Mettre à jour le message
             await query.message.edit_text(
@@ -1412,11 +1477,9 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     if query.data == "start_game":
         # Vérifier si l'utilisateur est le créateur de la partie
-        game = None
-        for g in active_games.values():
-            if g.host_id == user.id and g.game_status == 'waiting':
-                game = g
-                break
+        game = active_games.get(user.id)
+        if game is None or game.game_status != 'waiting':
+            game = None
         
         if not game:
             await query.answer("❌ Vous n'êtes pas le créateur de cette partie!")
@@ -1428,20 +1491,16 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             
         # Démarrer la partie
         if game.start_game():
-            if user.id in waiting_games:
-                waiting_games.remove(user.id)
+            active_games.mark_started(user.id)
             await display_game(update, context, game)
+            schedule_turn_timeout(context, game)
             await query.answer("✅ La partie commence!")
         else:
             await query.answer("❌ Impossible de démarrer la partie!")
         return
     
     # Trouver la partie active
-    game = None
-    for g in active_games.values():
-        if user.id in g.players:
-            game = g
-            break
+    game = active_games.for_player(user.id)
     
     if not game:
         await query.answer("❌ Aucune partie trouvée!")
@@ -1458,81 +1517,42 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
 
         if query.data == "split":
-            current_balance = db.get_balance(user.id)
+            current_balance = await db.get_balance(user.id)
             bet_amount = game.players[user.id]['bet']
     
             if current_balance < bet_amount:
                 await query.answer("❌ Solde insuffisant pour splitter!")
                 return
         
-            if game.split_hand(user.id):
+            if not game.can_split(user.id, current_balance):
+                await query.answer("❌ Impossible de splitter la main!")
+            # Prélever la mise supplémentaire d'un seul UPDATE relatif
+            elif await db.adjust_balance(user.id, -bet_amount) is None:
+                await query.answer("❌ Solde insuffisant pour splitter!")
+            elif game.split_hand(user.id, current_balance):
+                await refresh_leaderboard(user.id)
                 player_data = game.players[user.id]
                 player_data['current_hand'] = 'hand'
                 player_data['status'] = 'playing'
                 await query.answer("✂️ Vous avez splitté votre main!")
             else:
+                # La main a changé pendant le prélèvement : rembourser la mise
+                await db.adjust_balance(user.id, bet_amount)
                 await query.answer("❌ Impossible de splitter la main!")
 
         if query.data == "hit":
-            if 'current_hand' not in player_data:
-                player_data['current_hand'] = 'hand'
-            current_hand = player_data['current_hand']
-            new_card = game.deck.deal()
-            player_data[current_hand].append(new_card)
-            total = game.calculate_hand(player_data[current_hand])
-
-            if total > 21:
-                if current_hand == 'hand' and 'second_hand' in player_data:
-                    # Si c'est la première main qui bust et qu'il y a une seconde main
-                    player_data['first_status'] = 'bust'  # Marquer la première main comme bust
-                    player_data['current_hand'] = 'second_hand'  # Passer à la seconde main
-                    player_data['status'] = 'playing'  # Maintenir le statut de jeu
-                    await query.answer("💥 Première main bust! Passons à la seconde main.")
-                else:
-                    # Si c'est la seconde main ou s'il n'y a pas de seconde main
-                    if current_hand == 'second_hand':
-                        player_data['second_status'] = 'bust'
-                    player_data['status'] = 'bust'
-                    game_ended = game.next_player()
-                    await query.answer("💥 Vous avez dépassé 21!")
-            elif total == 21:
-                if current_hand == 'hand' and 'second_hand' in player_data:
-                    # Si c'est la première main qui fait 21 et qu'il y a une seconde main
-                    player_data['first_status'] = 'blackjack'
-                    player_data['current_hand'] = 'second_hand'
-                    player_data['status'] = 'playing'
-                    await query.answer("🌟 Blackjack sur la première main! Passons à la seconde.")
-                else:
-                    # Si c'est la seconde main ou s'il n'y a pas de seconde main
-                    if current_hand == 'second_hand':
-                        player_data['second_status'] = 'blackjack'
-                    player_data['status'] = 'blackjack'
-                    game_ended = game.next_player()
-                    await query.answer("🌟 Blackjack!")
-            else:
-                await query.answer(f"🎯 Total: {total}")
+            outcome, total, game_ended = game.hit(user.id)
+            await query.answer(HIT_MESSAGES.get(outcome, f"🎯 Total: {total}"))
         
         elif query.data == "stand":
-            if 'current_hand' not in player_data:
-                player_data['current_hand'] = 'hand'
-            current_hand = player_data['current_hand']
-    
-            if current_hand == 'hand' and 'second_hand' in player_data:
-                player_data['current_hand'] = 'second_hand'
-                player_data['first_status'] = 'stand'  # Stocker le statut de la première main séparément
-                player_data['status'] = 'playing'  # Garder le statut principal comme 'playing'
-                await query.answer("⏹ Vous restez sur la première main, à la seconde")
-            else:
-                if current_hand == 'second_hand':
-                    player_data['second_status'] = 'stand'
-                    player_data['status'] = 'stand'  # Maintenant on peut mettre stand car c'est fini
-                else:
-                    player_data['status'] = 'stand'
-                game_ended = game.next_player()
-                await query.answer("⏹ Vous restez")
+            outcome, game_ended = game.stand(user.id)
+            await query.answer(STAND_MESSAGES[outcome])
         
         # Mise à jour de l'affichage
         await display_game(update, context, game)
+
+        # Nouveau délai pour le joueur dont c'est le tour
+        schedule_turn_timeout(context, game)
         
         # Si la partie est terminée
         if game_ended:
@@ -1541,18 +1561,13 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             host_id = game.host_id
             
             # Nettoyer toutes les références à la partie
-            if host_id in active_games:
-                del active_games[host_id]
-            if host_id in waiting_games:
-                waiting_games.remove(host_id)
+            active_games.remove(host_id)
             if chat_id in game_messages:
                 del game_messages[chat_id]
             
             # Nettoyer chaque joueur des parties actives
             for player_id in players_in_game:
-                for game_id in list(active_games.keys()):  # Utiliser une copie de la liste des clés
-                    if player_id in active_games[game_id].players:
-                        del active_games[game_id]
+                cleanup_player_games(player_id)
     
     except Exception as e:
         print(f"Error in button_handler: {e}")
@@ -1569,11 +1584,9 @@ async def delete_and_update_game(message, game, context, delay_seconds: int = 30
         
         # Vérifier si la partie est toujours en attente
         host_id = game.host_id
-        if host_id in waiting_games:
+        if active_games.is_waiting(host_id) and active_games.get(host_id) is game:
             # Supprimer la partie des jeux actifs
-            if host_id in active_games:
-                del active_games[host_id]
-            waiting_games.remove(host_id)
+            active_games.remove(host_id)
             
             # Préparer le message d'expiration
             expired_message = (
@@ -1635,42 +1648,10 @@ async def infos(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Affiche les statistiques du joueur"""
     user = update.effective_user
-    balance = db.get_balance(user.id)
-    
-    emoji, rank_title, progress, next_rank = get_player_rank(balance)
-    
-    # Crée une barre de progression
-    progress_bar_length = 10
-    filled_length = int(progress_bar_length * progress / 100)
-    progress_bar = "█" * filled_length + "░" * (progress_bar_length - filled_length)
-    
-    stats_text = (
-        f"*STATISTIQUES DE {user.first_name}*\n"
-        f"━━━━━━━━━━━━━━━\n\n"
-        f"💵 *Solde:* {balance:,} $\n"
-        f"🎖️ *Rang:* {emoji} {rank_title}\n"
-    )
-    
-    if next_rank:
-        stats_text += (
-            f"\n*Progression vers {next_rank}*\n"
-            f"[{progress_bar}] {progress:.1f}%\n"
-        )
-    else:
-        stats_text += "\n🏆 *Rang Maximum Atteint !*\n"
-    
-    # Ajoute des statistiques de jeu si tu en as
-    games_played = db.get_games_played(user.id)  # Tu devras créer cette fonction
-    wins = db.get_wins(user.id)  # Tu devras créer cette fonction
-    
-    if games_played:
-        win_rate = (wins / games_played) * 100
-        stats_text += (
-            f"\n📊 *Statistiques de Jeu*\n"
-            f"├ Parties jouées: {games_played}\n"
-            f"├ Victoires: {wins}\n"
-            f"└ Taux de victoire: {win_rate:.1f}%\n"
-        )
+    balance = await db.get_balance(user.id)
+    games_played = await db.get_games_played(user.id)
+    wins = await db.get_wins(user.id)
+    stats_text = render_stats(user.first_name, balance, games_played, wins)
     
     await update.message.reply_text(
         stats_text,
@@ -1735,41 +1716,15 @@ async def admin_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def rangs(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Affiche tous les rangs disponibles"""
-    ranks = [
-        (0, "🤡 Clochard du Casino"),
-        (500, "🎲 Joueur Amateur"),
-        (1000, "🎰 Joueur Lambda"),
-        (2500, "💰 Petit Parieur"),
-        (5000, "💎 Parieur Régulier"),
-        (10000, "🎩 High Roller"),
-        (25000, "👑 Roi du Casino"),
-        (50000, "🌟 VIP Diamond"),
-        (100000, "🔥 Parieur Fou"),
-        (250000, "🌈 Légende du Casino"),
-        (500000, "⚡ Master des Tables"),
-        (1000000, "🌌 Empereur du Gambling"),
-        (1500000, "🎭 Maître du Destin"),
-        (2000000, "🏆 Champion Suprême"),
-        (2500000, "💫 Star du Casino"),
-        (3000000, "🌠 Célébrité des Tables"),
-        (4000000, "👻 Fantôme des Casinos"),
-        (5000000, "⚜️ Noble du Gambling"),
-        (6000000, "🎪 Maître du Cirque"),
-        (7000000, "🎇 Étoile Filante"),
-        (8000000, "💎 Diamond Master"),
-        (9000000, "🌋 Volcan du Gambling"),
-        (10000000, "🔱 Dieu du Casino")
-    ]
-    
     text = "*📊 RANGS DU CASINO 📊*\n━━━━━━━━━━━━━━━\n\n"
     
     # Afficher tous les rangs
-    for threshold, rank in ranks:
+    for threshold, rank in RANK_TIERS:
         text += f"*{rank}*\n└ Requis: {threshold:,} $\n\n"
     
     # Ajouter le rang actuel du joueur
-    user_balance = db.get_balance(update.effective_user.id)
-    emoji, rank_title, progress, next_rank = db.get_player_rank(user_balance)
+    user_balance = await db.get_balance(update.effective_user.id)
+    emoji, rank_title, progress, next_rank = get_player_rank(user_balance)
     
     text += (
         f"\n*Votre rang actuel:*\n"
@@ -1777,14 +1732,9 @@ async def rangs(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     
     if next_rank:
-        # Créer une barre de progression
-        progress_bar_length = 10
-        filled_length = int(progress_bar_length * progress / 100)
-        progress_bar = "█" * filled_length + "░" * (progress_bar_length - filled_length)
-        
         text += (
             f"\n*Progression vers {next_rank}*\n"
-            f"[{progress_bar}] {progress:.1f}%\n"
+            f"[{progress_bar(progress)}] {progress:.1f}%\n"
         )
     else:
         text += "\n🏆 *Rang Maximum Atteint !*"
@@ -1798,106 +1748,78 @@ async def cmd_bank(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if await handle_forbidden_thread(update.message): return
     
     # Vérifier si l'utilisateur existe
-    if not db.user_exists(user.id):
+    if not await db.user_exists(user.id):
         await update.message.reply_text("❌ Vous devez d'abord utiliser /start pour vous inscrire !")
         return
     
     # Récupérer les stats du joueur
-    stats = db.get_stats(user.id)
-    emoji, title, progress, next_rank = db.get_player_rank(stats['balance'])
-    
-    # Créer le message avec les informations bancaires
-    bank_message = (
-        f"🏦 Informations bancaires de {user.first_name}\n\n"
-        f"💰 Solde : {stats['balance']} coins\n"
-        f"{emoji} Rang : {title}\n"
-    )
-    
-    # Ajouter la progression vers le prochain rang si disponible
-    if next_rank:
-        bank_message += f"📈 Progression : {progress:.1f}% vers {next_rank}"
+    stats = await db.get_stats(user.id)
+    bank_message = render_bank(user.first_name, stats['balance'])
 
     await update.message.reply_text(bank_message)
 
-async def check_game_timeouts(context: ContextTypes.DEFAULT_TYPE):
-    games_to_check = list(active_games.items())  # Créer une copie
-    for game_id, game in games_to_check:
-        if game.game_status == 'playing':
-            current_player_id = game.get_current_player_id()
-            if current_player_id and game.check_timeout():
-                try:
-                    player_data = game.players[current_player_id]
-                    if player_data['status'] == 'playing':
-                        player_data['status'] = 'stand'
-                        game_ended = game.next_player()
-                        game.last_action_time = datetime.utcnow()
-
-                        if game_ended:
-                            game.game_status = 'finished'
-                            game.resolve_dealer()
-                            game.determine_winners()
-                        
-                        # Créer un faux update pour display_game
-                        dummy_update = Update(0, None)
-                        await display_game(dummy_update, context, game)
-
-                except Exception as e:
-                    print(f"Erreur dans check_game_timeouts: {e}")
+def schedule_turn_timeout(context: ContextTypes.DEFAULT_TYPE, game: MultiPlayerGame):
+    """Programme l'expiration du tour du joueur actuel (un seul job par partie)"""
+    game.cancel_turn_timer()
+    if game.game_status != 'playing':
+        return
+    current_player_id = game.get_current_player_id()
+    if current_player_id is None:
+        return
+    game.turn_job = context.job_queue.run_once(
+        turn_timeout_job,
+        TURN_TIMEOUT,
+        data=(game.host_id, current_player_id),
+        name=f"turn_timeout_{game.host_id}"
+    )
+
+async def turn_timeout_job(context: ContextTypes.DEFAULT_TYPE):
+    """Fait rester automatiquement le joueur qui n'a pas joué à temps"""
+    host_id, player_id = context.job.data
+    game = active_games.get(host_id)
+    if game is None or game.game_status != 'playing':
+        return
+    game.turn_job = None
+    if game.get_current_player_id() != player_id:
+        return
+
+    try:
+        player_data = game.players[player_id]
+        player_data['status'] = 'stand'
+        game.last_action_time = datetime.utcnow()
+        game.next_player()
+
+        # Créer un faux update pour display_game
+        dummy_update = Update(0, None)
+        await display_game(dummy_update, context, game)
+        schedule_turn_timeout(context, game)
+
+    except Exception as e:
+        print(f"Erreur dans turn_timeout_job: {e}")
+
+async def flush_results_job(context: ContextTypes.DEFAULT_TYPE):
+    """Vide périodiquement la file d'écriture différée des règlements"""
+    await db.flush_results()
+
+TOP_PAGE_SIZE = 10  # Joueurs par page de /top
 
 async def update_classement_job(context: ContextTypes.DEFAULT_TYPE):
-    """Met à jour automatiquement le classement"""
+    """Met à jour automatiquement le classement, seulement si le top 50 a changé"""
+    global CLASSEMENT_LAST_HASH
+
     if CLASSEMENT_MESSAGE_ID is not None and CLASSEMENT_CHAT_ID is not None:
-        cursor = db.conn.cursor()
-        cursor.execute("""
-            SELECT username, balance 
-            FROM users 
-            ORDER BY balance DESC 
-            LIMIT 50
-        """)
-        
-        rankings = cursor.fetchall()
+        rankings = leaderboard.top(50)
+        rankings_hash = hash(tuple(rankings))
+        if rankings_hash == CLASSEMENT_LAST_HASH:
+            return
         current_time = (datetime.utcnow() + timedelta(hours=2)).strftime("%H:%M")
-
-        
-        message = (
-            "🎯 *CLASSEMENT* 🎯\n"
-            "━━━━━━━━━━━━━━━\n\n"
-        )
-        
-        for i, (username, balance) in enumerate(rankings, 1):
-            emoji, rank_title, _, _ = db.get_player_rank(balance)
-            
-            if i == 1:
-                medal = "👑"
-            elif i == 2:
-                medal = "🥈"
-            elif i == 3:
-                medal = "🥉"
-            elif i <= 10:
-                medal = "⭐"
-            else:
-                medal = "•"
-                
-            message += (
-                f"{medal} *#{i}* {emoji} *{username}*\n"
-                f"├ {rank_title}\n"
-                f"└ {balance:,} 💵\n"
-            )
-            
-            if i in [3, 10]:
-                message += "━━━━━━━━━━━━━━━\n"
-            else:
-                message += "\n"
-                
-        message += f"\n⌚️ Mis à jour: {current_time}"
+        message = render_leaderboard(rankings, current_time)
         
         try:
-            await context.bot.edit_message_text(
-                chat_id=CLASSEMENT_CHAT_ID,
-                message_id=CLASSEMENT_MESSAGE_ID,
-                text=message,
-                parse_mode=ParseMode.MARKDOWN
+            await edit_message_if_changed(
+                context.bot, CLASSEMENT_CHAT_ID, CLASSEMENT_MESSAGE_ID, message, parse_mode=ParseMode.MARKDOWN
             )
+            CLASSEMENT_LAST_HASH = rankings_hash
         except Exception as e:
             logger.error(f"Erreur mise à jour classement: {e}")
 
@@ -1906,7 +1828,7 @@ async def classement(update: Update, context: ContextTypes.DEFAULT_TYPE):
     Affiche un classement des 50 meilleurs joueurs
     Se met à jour automatiquement toutes les 5 minutes
     """
-    global CLASSEMENT_MESSAGE_ID, CLASSEMENT_CHAT_ID
+    global CLASSEMENT_MESSAGE_ID, CLASSEMENT_CHAT_ID, CLASSEMENT_LAST_HASH
     
     # Vérifier si le classement existe déjà
     if CLASSEMENT_MESSAGE_ID is not None:
@@ -1919,56 +1841,11 @@ async def classement(update: Update, context: ContextTypes.DEFAULT_TYPE):
             pass
         return
     
-    cursor = db.conn.cursor()
-    cursor.execute("""
-        SELECT username, balance 
-        FROM users 
-        ORDER BY balance DESC 
-        LIMIT 50
-    """)
-    
-    rankings = cursor.fetchall()
+    rankings = leaderboard.top(50)
     
     # Corriger l'heure pour qu'elle soit à l'heure française
     current_time = (datetime.utcnow() + timedelta(hours=2)).strftime("%H:%M")
-
-    
-    message = (
-        "🎯 *CLASSEMENT* 🎯\n"
-        "━━━━━━━━━━━━━━━\n\n"
-    )
-    
-    for i, (username, balance) in enumerate(rankings, 1):
-        # Obtenir le rang du joueur avec son emoji et son titre
-        emoji, rank_title, _, _ = db.get_player_rank(balance)
-        
-        # Médailles pour le podium
-        if i == 1:
-            medal = "👑"
-        elif i == 2:
-            medal = "🥈"
-        elif i == 3:
-            medal = "🥉"
-        elif i <= 10:
-            medal = "⭐"
-        else:
-            medal = "•"
-            
-        # Formater chaque entrée avec le nom du rang
-        message += (
-            f"{medal} *#{i}* {emoji} *{username}*\n"
-            f"├ {rank_title}\n"
-            f"└ {balance:,} 💵\n"
-        )
-        
-        # Ajouter un séparateur après le podium et top 10
-        if i in [3, 10]:
-            message += "━━━━━━━━━━━━━━━\n"
-        else:
-            message += "\n"
-            
-    # Ajouter le timestamp de mise à jour
-    message += f"\n⌚️ Mis à jour: {current_time}"
+    message = render_leaderboard(rankings, current_time)
     
     try:
         # Si c'est une nouvelle commande (pas une mise à jour automatique)
@@ -1982,24 +1859,86 @@ async def classement(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 )
                 CLASSEMENT_MESSAGE_ID = sent_message.message_id
                 CLASSEMENT_CHAT_ID = update.effective_chat.id
+                CLASSEMENT_LAST_HASH = hash(tuple(rankings))
+                rendered_messages.set(
+                    CLASSEMENT_CHAT_ID, CLASSEMENT_MESSAGE_ID, rendered_messages.fingerprint(message)
+                )
             else:
                 await update.message.reply_text(
                     "❌ Cette commande doit être utilisée dans un supergroupe pour fonctionner correctement."
                 )
         # Si c'est une mise à jour automatique
         elif CLASSEMENT_MESSAGE_ID and CLASSEMENT_CHAT_ID:
-            await context.bot.edit_message_text(
-                chat_id=CLASSEMENT_CHAT_ID,
-                message_id=CLASSEMENT_MESSAGE_ID,
-                text=message,
-                parse_mode=ParseMode.MARKDOWN
+            await edit_message_if_changed(
+                context.bot, CLASSEMENT_CHAT_ID, CLASSEMENT_MESSAGE_ID, message, parse_mode=ParseMode.MARKDOWN
             )
     except Exception as e:
         logger.error(f"Erreur mise à jour classement: {e}")
 
+async def top(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Classement complet, page par page
+    Les boutons portent la clé du premier ou du dernier joueur affiché : top_<n|p><solde>_<user_id>
+    """
+    query = update.callback_query
+    after = None
+    backward = False
+    if query:
+        cursor = query.data.split('_', 1)[1]
+        backward = cursor.startswith('p')
+        balance, user_id = cursor[1:].rsplit('_', 1)
+        after = (int(balance), int(user_id))
+
+    start, entries = leaderboard.page(after, TOP_PAGE_SIZE, backward)
+    if not entries:
+        text = "❌ Aucun joueur classé pour le moment."
+        if query:
+            await query.answer(text)
+        else:
+            await update.message.reply_text(text)
+        return
+
+    message = render_top_page([(username, balance) for _, username, balance in entries], start, len(leaderboard))
+
+    buttons = []
+    if start > 1:
+        first_id, _, first_balance = entries[0]
+        buttons.append(InlineKeyboardButton("◀️", callback_data=f"top_p{first_balance}_{first_id}"))
+    if start + len(entries) <= len(leaderboard):
+        last_id, _, last_balance = entries[-1]
+        buttons.append(InlineKeyboardButton("▶️", callback_data=f"top_n{last_balance}_{last_id}"))
+    reply_markup = InlineKeyboardMarkup([buttons]) if buttons else None
+
+    if query:
+        await query.edit_message_text(message, parse_mode=ParseMode.MARKDOWN, reply_markup=reply_markup)
+        await query.answer()
+    else:
+        await update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN, reply_markup=reply_markup)
+
+async def position(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Affiche la position du joueur dans le classement"""
+    user = update.effective_user
+    rank = leaderboard.position(user.id)
+    if rank is None:
+        await update.message.reply_text("❌ Vous n'êtes pas encore classé. Jouez une partie pour apparaître au classement!")
+        return
+
+    _, _, balance = leaderboard.at(rank)
+    emoji, rank_title, _, _ = get_player_rank(balance)
+    message = (
+        f"📍 *Position de {user.first_name}*\n\n"
+        f"🏆 #{rank} sur {len(leaderboard)} joueurs\n"
+        f"{emoji} {rank_title}\n"
+        f"💰 {balance:,} 💵\n"
+    )
+    if rank > 1:
+        _, ahead_name, ahead_balance = leaderboard.at(rank - 1)
+        message += f"\n⬆️ {ahead_balance - balance:,} 💵 derrière *{ahead_name}* (#{rank - 1})"
+    await update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
+
 async def reset_classement(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Commande admin pour réinitialiser le classement"""
-    global CLASSEMENT_MESSAGE_ID, CLASSEMENT_CHAT_ID
+    global CLASSEMENT_MESSAGE_ID, CLASSEMENT_CHAT_ID, CLASSEMENT_LAST_HASH
     
     if not is_admin(update.effective_user.id):
         await update.message.reply_text("❌ Cette commande est réservée aux administrateurs.")
@@ -2007,6 +1946,7 @@ async def reset_classement(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
     CLASSEMENT_MESSAGE_ID = None
     CLASSEMENT_CHAT_ID = None
+    CLASSEMENT_LAST_HASH = None
     await update.message.reply_text("✅ Le classement a été réinitialisé.")
 
 async def reset_all_credits(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -2021,12 +1961,8 @@ async def reset_all_credits(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
     try:
         # Réinitialiser les crédits de tous les joueurs à 1000
-        db.cursor.execute('UPDATE users SET balance = 1000')
-        db.conn.commit()
-        
-        # Compter le nombre de joueurs affectés
-        db.cursor.execute('SELECT COUNT(*) FROM users')
-        affected_players = db.cursor.fetchone()[0]
+        affected_players = await db.reset_all_balances(1000)
+        leaderboard.load(await db.get_all_balances())
         
         await update.message.reply_text(
             f"✅ *Crédits réinitialisés*\n"
@@ -2052,9 +1988,11 @@ async def view_player_history(update: Update, context: ContextTypes.DEFAULT_TYPE
         if data[0] != 'history':
             return
             
-        command, user_id, page = data
+        # history_<user_id>_<n|p><game_id> : parties plus anciennes (n) ou plus récentes (p) que game_id
+        command, user_id, position = data
         user_id = int(user_id)
-        page = int(page)
+        backward = position.startswith('p')
+        cursor = int(position[1:]) if position[:1] in ('n', 'p') else None
         
         if not is_admin(query.from_user.id):
             await query.answer("❌ Accès non autorisé", show_alert=True)
@@ -2080,21 +2018,16 @@ async def view_player_history(update: Update, context: ContextTypes.DEFAULT_TYPE
                 return
                 
             user_input = context.args[0]
-            page = 0  # Page initiale
+            # Page initiale : les parties les plus récentes
+            cursor = None
+            backward = False
             
             # Vérifier si c'est un @ username
             if user_input.startswith('@'):
                 username = user_input[1:]  # Enlever le @
                 # Rechercher l'ID avec une recherche plus flexible
-                db.cursor.execute('''
-                    SELECT user_id FROM users 
-                    WHERE LOWER(REPLACE(username, '_', '')) = LOWER(REPLACE(?, '_', ''))
-                    OR username LIKE ?
-                ''', (username, f"%{username}%"))
-                result = db.cursor.fetchone()
-                if result:
-                    user_id = result[0]
-                else:
+                user_id = await db.find_user_id_by_username(username)
+                if user_id is None:
                     await message.reply_text("❌ Utilisateur non trouvé avec ce nom d'utilisateur.")
                     return
             else:
@@ -2114,7 +2047,7 @@ async def view_player_history(update: Update, context: ContextTypes.DEFAULT_TYPE
     
     try:
         # Vérifier si l'utilisateur existe
-        if not db.user_exists(user_id):
+        if not await db.user_exists(user_id):
             text = "❌ Utilisateur non trouvé."
             if query:
                 await query.edit_message_text(text)
@@ -2122,57 +2055,22 @@ async def view_player_history(update: Update, context: ContextTypes.DEFAULT_TYPE
                 await message.reply_text(text)
             return
         
-        # Récupérer le nom d'utilisateur et le solde actuel
-        username = db.get_username(user_id)
-        current_balance = db.get_balance(user_id)
+        # Récupérer le nom d'utilisateur, le solde actuel et le nombre de parties
+        username = await db.get_username(user_id)
+        stats = await db.get_stats(user_id)
+        current_balance = stats.get('balance', 0)
         
-        # Obtenir le nombre total de parties
-        db.cursor.execute('SELECT COUNT(*) FROM game_history WHERE user_id = ?', (user_id,))
-        total_games = db.cursor.fetchone()[0]
-        
-        # Paramètres de pagination
+        # Une partie de plus que la page pour savoir s'il en reste au-delà
         items_per_page = 10
-        total_pages = (total_games + items_per_page - 1) // items_per_page
-        
-        # Vérifier si la page demandée est valide
-        if page >= total_pages:
-            page = total_pages - 1
-        if page < 0:
-            page = 0
-        
-        # Récupérer les parties pour la page actuelle
-        offset = page * items_per_page
-        db.cursor.execute('''
-            WITH BalanceChanges AS (
-                SELECT 
-                    rowid,
-                    game_history.bet_amount,
-                    game_history.result,
-                    game_history.timestamp,
-                    CASE 
-                        WHEN result = 'win' THEN bet_amount
-                        WHEN result = 'blackjack' THEN CAST(bet_amount * 1.5 AS INTEGER)
-                        WHEN result = 'lose' THEN -bet_amount
-                        ELSE 0
-                    END as balance_change
-                FROM game_history
-                WHERE user_id = ?
-                ORDER BY timestamp DESC
-                LIMIT ? OFFSET ?
-            )
-            SELECT 
-                bet_amount,
-                result,
-                timestamp,
-                balance_change,
-                (SELECT ? - SUM(b2.balance_change)
-                 FROM BalanceChanges b2
-                 WHERE b2.rowid <= b1.rowid) as balance_before
-            FROM BalanceChanges b1
-            ORDER BY timestamp DESC
-        ''', (user_id, items_per_page, offset, current_balance))
-        
-        history = db.cursor.fetchall()
+        history = await db.get_history_page(user_id, items_per_page + 1, cursor, backward)
+        if backward:
+            has_newer = len(history) > items_per_page
+            has_older = True
+            history = history[-items_per_page:]
+        else:
+            has_newer = cursor is not None
+            has_older = len(history) > items_per_page
+            history = history[:items_per_page]
         
         if not history:
             text = (
@@ -2189,11 +2087,13 @@ async def view_player_history(update: Update, context: ContextTypes.DEFAULT_TYPE
         # Créer le message d'historique
         history_text = f"📊 *Historique de {username}*\n"
         history_text += f"💳 Solde actuel: {current_balance} 💵\n"
-        history_text += f"📝 Page {page + 1}/{total_pages}\n\n"
+        history_text += f"🎮 Parties jouées: {stats.get('games_played', 0)}\n\n"
         
-        for bet, result, timestamp, balance_change, balance_before in history:
+        for game_id, bet, result, timestamp, balance_change, balance_before, balance_after in history:
             game_time = datetime.fromisoformat(timestamp)
-            balance_after = balance_before + balance_change
+            # Parties antérieures à l'enregistrement des soldes
+            if balance_before is None:
+                balance_before = balance_after = '?'
             
             if result == 'win':
                 emoji = '🟢'
@@ -2215,12 +2115,12 @@ async def view_player_history(update: Update, context: ContextTypes.DEFAULT_TYPE
         
         # Créer les boutons de pagination
         keyboard = []
-        if total_pages > 1:
-            buttons = []
-            if page > 0:  # Bouton page précédente
-                buttons.append(InlineKeyboardButton("◀️", callback_data=f"history_{user_id}_{page-1}"))
-            if page < total_pages - 1:  # Bouton page suivante
-                buttons.append(InlineKeyboardButton("▶️", callback_data=f"history_{user_id}_{page+1}"))
+        buttons = []
+        if has_newer:  # Parties plus récentes
+            buttons.append(InlineKeyboardButton("◀️", callback_data=f"history_{user_id}_p{history[0][0]}"))
+        if has_older:  # Parties plus anciennes
+            buttons.append(InlineKeyboardButton("▶️", callback_data=f"history_{user_id}_n{history[-1][0]}"))
+        if buttons:
             keyboard = [buttons]
         
         reply_markup = InlineKeyboardMarkup(keyboard) if keyboard else None
@@ -2255,10 +2155,13 @@ def main():
             Application.builder()
             .token(TOKEN)
             .defaults(defaults)
+            .post_init(load_leaderboard)
             .build()
         )
 
         application.add_handler(CommandHandler("classement", classement))
+        application.add_handler(CommandHandler("top", top))
+        application.add_handler(CommandHandler("position", position))
         application.add_handler(CommandHandler("admin", admin_menu))
         application.add_handler(CommandHandler('bank', cmd_bank))
         application.add_handler(CommandHandler("start", cmd_start))
@@ -2273,10 +2176,12 @@ def main():
         application.add_handler(CommandHandler("reset_classement", reset_classement))
         application.add_handler(CommandHandler("history", view_player_history))
         application.add_handler(CallbackQueryHandler(view_player_history, pattern="^history_"))
+        application.add_handler(CallbackQueryHandler(top, pattern="^top_"))
         application.add_handler(CallbackQueryHandler(button_handler))
         application.add_error_handler(error_handler)
-        application.job_queue.run_repeating(check_game_timeouts, interval=5)  # Vérifie toutes les 5 secondes
         application.job_queue.run_repeating(update_classement_job, interval=300)  # 300 secondes = 5 minutes
+        if db.write_behind:
+            application.job_queue.run_repeating(flush_results_job, interval=WRITE_BEHIND_INTERVAL)
    
         print("🎲 Blackjack Bot démarré !")
         application.run_polling(allowed_updates=Update.ALL_TYPES)
@@ -2285,7 +2190,7 @@ def main():
         logger.error(f"Erreur critique: {e}")
         raise
     finally:
-        db.conn.close()
+        db.close()
 
 if __name__ == '__main__':
     main()
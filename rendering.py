@@ -0,0 +1,283 @@
+"""Rendu Markdown des messages du bot (partie, classement, statistiques)
+
+Les parties fixes sont des modèles précompilés, les blocs propres à un joueur sont
+mis en cache sur ce qui les détermine (cartes, statut, mise), et chaque message est
+assemblé par un seul ''.join : après l'action d'un joueur, seul son bloc est reconstruit.
+"""
+import bisect
+from functools import lru_cache
+from typing import Optional
+
+from blackjack import Hand, MultiPlayerGame
+
+# Paliers de rang : (solde minimum, "emoji titre"), par seuil croissant
+RANK_TIERS = (
+    (0, "🤡 Clochard du Casino"),
+    (500, "🎲 Joueur Amateur"),
+    (1000, "🎰 Joueur Lambda"),
+    (2500, "💰 Petit Parieur"),
+    (5000, "💎 Parieur Régulier"),
+    (10000, "🎩 High Roller"),
+    (25000, "👑 Roi du Casino"),
+    (50000, "🌟 VIP Diamond"),
+    (100000, "🔥 Parieur Fou"),
+    (250000, "🌈 Légende du Casino"),
+    (500000, "⚡ Master des Tables"),
+    (1000000, "🌌 Empereur du Gambling"),
+    (1500000, "🎭 Maître du Destin"),
+    (2000000, "🏆 Champion Suprême"),
+    (2500000, "💫 Star du Casino"),
+    (3000000, "🌠 Célébrité des Tables"),
+    (4000000, "👻 Fantôme des Casinos"),
+    (5000000, "⚜️ Noble du Gambling"),
+    (6000000, "🎪 Maître du Cirque"),
+    (7000000, "🎇 Étoile Filante"),
+    (8000000, "💎 Diamond Master"),
+    (9000000, "🌋 Volcan du Gambling"),
+    (10000000, "🔱 Dieu du Casino"),
+)
+RANK_THRESHOLDS = tuple(threshold for threshold, _ in RANK_TIERS)
+RANK_LABELS = tuple(tuple(label.split(" ", 1)) for _, label in RANK_TIERS)  # (emoji, titre) déjà séparés
+
+STATUS_EMOJIS = {
+    'waiting': '⏳',
+    'playing': '🎮',
+    'bust': '💥',
+    'stand': '⏹',
+    'blackjack': '🌟',
+    'win': '🎉',
+    'lose': '💀',
+    'push': '🤝'
+}
+
+# --- Modèles ---
+
+GAME_HEADER = "═══『 BLACKJACK 』═══\n\n"
+DEALER_TEMPLATE = "👨‍💼 *DEALER* │ {cards}\n├ Total: {total}\n──────────────\n\n"
+HAND_TEMPLATE = "{status} *{name}* │ {cards}\n├ Total: {total}\n├ Mise: {bet} 💵{second}{result}\n──────────────\n\n"
+RESULTS_HEADER = "*RÉSULTATS*\n"
+REPLAY_FOOTER = "\n🎮 */bj [mise]* pour rejouer"
+TURN_TEMPLATE = "👉 C'est à *{name}* de jouer"
+TIME_FOOTER = "\n\n⌚️ {time}"
+
+SEPARATOR = "━━━━━━━━━━━━━━━\n"
+LEADERBOARD_HEADER = "🎯 *CLASSEMENT* 🎯\n" + SEPARATOR + "\n"
+TOP_HEADER = "🏆 *TOP JOUEURS* 🏆\n" + SEPARATOR + "\n"
+RANKING_ENTRY_TEMPLATE = "{medal} *#{position}* {emoji} *{username}*\n├ {title}\n└ {balance:,} 💵\n"
+LEADERBOARD_FOOTER = "\n⌚️ Mis à jour: {time}"
+TOP_FOOTER = "\n👥 {count} joueurs classés"
+
+STATS_TEMPLATE = "*STATISTIQUES DE {name}*\n" + SEPARATOR + "\n💵 *Solde:* {balance:,} $\n🎖️ *Rang:* {emoji} {title}\n"
+PROGRESS_TEMPLATE = "\n*Progression vers {next_rank}*\n[{bar}] {progress:.1f}%\n"
+MAX_RANK_LINE = "\n🏆 *Rang Maximum Atteint !*\n"
+GAME_STATS_TEMPLATE = (
+    "\n📊 *Statistiques de Jeu*\n"
+    "├ Parties jouées: {games_played}\n"
+    "├ Victoires: {wins}\n"
+    "└ Taux de victoire: {win_rate:.1f}%\n"
+)
+
+BANK_TEMPLATE = "🏦 Informations bancaires de {name}\n\n💰 Solde : {balance} coins\n{emoji} Rang : {title}\n"
+WELCOME_NEW_TEMPLATE = "👋 Bienvenue {name} !\n\n💰 Je vous offre 1000 coins pour commencer !\n\n"
+WELCOME_BACK_TEMPLATE = "👋 Re-bonjour {name} !\n\n💰 Votre solde : {balance} coins\n{emoji} Rang : {title}\n"
+RANK_PROGRESS_LINE = "📈 Progression : {progress:.1f}% vers {next_rank}"
+COMMANDS_FOOTER = (
+    "Commandes disponibles :\n"
+    "/bank - Voir votre solde\n"
+    "/daily - Réclamer votre bonus quotidien\n"
+    "/stats - Voir vos statistiques"
+)
+
+# --- Rangs ---
+
+def get_player_rank(balance: int) -> tuple[str, str, float, Optional[str]]:
+    """
+    Retourne le rang du joueur basé sur son solde
+    Returns: (emoji, titre, progression, prochain_rang)
+    """
+    index = max(bisect.bisect_right(RANK_THRESHOLDS, balance) - 1, 0)
+    emoji, title = RANK_LABELS[index]
+
+    if index + 1 < len(RANK_TIERS):
+        current_threshold = RANK_THRESHOLDS[index]
+        next_threshold = RANK_THRESHOLDS[index + 1]
+        progress = ((balance - current_threshold) / (next_threshold - current_threshold)) * 100
+        progress = min(100, max(0, progress))  # Garde entre 0 et 100
+        return emoji, title, progress, RANK_TIERS[index + 1][1]
+
+    return emoji, title, 100, None
+
+@lru_cache(maxsize=None)
+def _render_progress_bar(filled_length: int, length: int) -> str:
+    return "█" * filled_length + "░" * (length - filled_length)
+
+def progress_bar(progress: float, length: int = 10) -> str:
+    """Barre de progression (le rendu de chaque remplissage possible est mis en cache)"""
+    filled_length = min(length, max(0, int(length * progress / 100)))
+    return _render_progress_bar(filled_length, length)
+
+def get_status_emoji(status: str) -> str:
+    return f"{STATUS_EMOJIS.get(status, '❓')} {status.upper()}"
+
+# --- Partie ---
+
+def _hand_result(status: str, bet: int) -> str:
+    if status == 'blackjack':
+        return f"+{int(bet * 2.5)}"
+    if status == 'win':
+        return f"+{bet * 2}"
+    if status in ('lose', 'bust'):
+        return f"-{bet}"
+    if status == 'push':
+        return "±0"
+    return ""
+
+@lru_cache(maxsize=256)
+def render_dealer(cards: tuple, hidden: bool) -> str:
+    """Bloc du croupier ; pendant la partie seule la première carte est visible"""
+    if hidden:
+        return DEALER_TEMPLATE.format(cards=f"{cards[0]} 🎴", total="?")
+    return DEALER_TEMPLATE.format(cards=' '.join(str(card) for card in cards), total=Hand(cards).total)
+
+@lru_cache(maxsize=4096)
+def render_hand(name: str, cards: tuple, status: str, bet: int, second: bool, finished: bool) -> str:
+    """Bloc d'une main de joueur, reconstruit seulement quand ses cartes, son statut ou sa mise changent"""
+    result = _hand_result(status, bet) if finished else ""
+    return HAND_TEMPLATE.format(
+        status=get_status_emoji(status),
+        name=name,
+        cards=' '.join(str(card) for card in cards),
+        total=Hand(cards).total,
+        bet=bet,
+        second=" (Seconde main)" if second else "",
+        result=f" │ {result}" if result else "",
+    )
+
+@lru_cache(maxsize=1024)
+def render_result(name: str, first_status: str, second_status: Optional[str], bet: int) -> str:
+    """Ligne du résultat total d'un joueur en fin de partie"""
+    total_result = 0
+
+    # Résultat de la première main
+    if first_status == 'blackjack':
+        total_result += int(bet * 2.5)
+    elif first_status == 'win':
+        total_result += bet * 2
+    elif first_status in ('lose', 'bust'):
+        total_result -= bet
+
+    # Résultat de la seconde main
+    if second_status == 'win':
+        total_result += bet * 2
+    elif second_status in ('lose', 'bust'):
+        total_result -= bet
+
+    if total_result > 0:
+        return f"💰 {name}: *+{total_result}*\n"
+    if total_result < 0:
+        return f"💸 {name}: *{total_result}*\n"
+    return f"🤝 {name}: *±0*\n"
+
+def render_game(game: MultiPlayerGame, player_names: dict, current_time: str) -> str:
+    """Message complet d'une partie"""
+    finished = game.game_status == 'finished'
+    parts = [GAME_HEADER, render_dealer(tuple(game.dealer_hand), game.game_status == 'playing')]
+
+    for player_id, player_data in game.players.items():
+        name = player_names[player_id]
+        bet = player_data['bet']
+        parts.append(render_hand(
+            name, tuple(player_data['hand']), player_data.get('first_status', player_data['status']),
+            bet, False, finished
+        ))
+        if 'second_hand' in player_data:
+            parts.append(render_hand(
+                name, tuple(player_data['second_hand']), player_data.get('second_status', 'playing'),
+                bet, True, finished
+            ))
+
+    if finished:
+        parts.append(RESULTS_HEADER)
+        for player_id, player_data in game.players.items():
+            parts.append(render_result(
+                player_names[player_id], player_data.get('first_status', player_data['status']),
+                player_data.get('second_status'), player_data['bet']
+            ))
+        parts.append(REPLAY_FOOTER)
+    elif current_player_id := game.get_current_player_id():
+        parts.append(TURN_TEMPLATE.format(name=player_names[current_player_id]))
+
+    parts.append(TIME_FOOTER.format(time=current_time))
+    return ''.join(parts)
+
+# --- Classement ---
+
+@lru_cache(maxsize=1024)
+def render_ranking_entry(position: int, username: str, balance: int) -> str:
+    """Entrée du classement, avec médaille et séparateurs après le podium et le top 10"""
+    emoji, title, _, _ = get_player_rank(balance)
+    if position == 1:
+        medal = "👑"
+    elif position == 2:
+        medal = "🥈"
+    elif position == 3:
+        medal = "🥉"
+    elif position <= 10:
+        medal = "⭐"
+    else:
+        medal = "•"
+    entry = RANKING_ENTRY_TEMPLATE.format(
+        medal=medal, position=position, emoji=emoji, username=username, title=title, balance=balance
+    )
+    return entry + (SEPARATOR if position in (3, 10) else "\n")
+
+def render_ranking(rankings, start: int = 1) -> str:
+    """Lignes du classement pour des (username, balance), numérotées à partir de start"""
+    return ''.join(
+        render_ranking_entry(position, username, balance)
+        for position, (username, balance) in enumerate(rankings, start)
+    )
+
+def render_leaderboard(rankings, current_time: str) -> str:
+    return ''.join((LEADERBOARD_HEADER, render_ranking(rankings), LEADERBOARD_FOOTER.format(time=current_time)))
+
+def render_top_page(rankings, start: int, count: int) -> str:
+    return ''.join((TOP_HEADER, render_ranking(rankings, start), TOP_FOOTER.format(count=count)))
+
+# --- Statistiques et solde ---
+
+def _rank_progress(progress: float, next_rank: Optional[str]) -> str:
+    if next_rank:
+        return PROGRESS_TEMPLATE.format(next_rank=next_rank, bar=progress_bar(progress), progress=progress)
+    return MAX_RANK_LINE
+
+def render_stats(name: str, balance: int, games_played: int, wins: int) -> str:
+    emoji, title, progress, next_rank = get_player_rank(balance)
+    parts = [
+        STATS_TEMPLATE.format(name=name, balance=balance, emoji=emoji, title=title),
+        _rank_progress(progress, next_rank),
+    ]
+    if games_played:
+        parts.append(GAME_STATS_TEMPLATE.format(
+            games_played=games_played, wins=wins, win_rate=wins / games_played * 100
+        ))
+    return ''.join(parts)
+
+def render_bank(name: str, balance: int) -> str:
+    emoji, title, progress, next_rank = get_player_rank(balance)
+    parts = [BANK_TEMPLATE.format(name=name, balance=balance, emoji=emoji, title=title)]
+    if next_rank:
+        parts.append(RANK_PROGRESS_LINE.format(progress=progress, next_rank=next_rank))
+    return ''.join(parts)
+
+def render_welcome(name: str, balance: Optional[int] = None) -> str:
+    """Message de /start : bienvenue pour un nouveau joueur (balance=None), ou retour avec son rang"""
+    if balance is None:
+        return WELCOME_NEW_TEMPLATE.format(name=name) + COMMANDS_FOOTER
+    emoji, title, progress, next_rank = get_player_rank(balance)
+    parts = [WELCOME_BACK_TEMPLATE.format(name=name, balance=balance, emoji=emoji, title=title)]
+    if next_rank:
+        parts.append(RANK_PROGRESS_LINE.format(progress=progress, next_rank=next_rank) + "\n")
+    parts.append("\n")
+    parts.append(COMMANDS_FOOTER)
+    return ''.join(parts)
@@ -0,0 +1,160 @@
+"""Simulation hors ligne du moteur de blackjack (sans Telegram ni base de données)
+
+Exemple : python simulation.py --rounds 100000 --players 7 --strategy basique
+"""
+import argparse
+import random
+import time
+from collections import Counter
+from typing import Callable, Dict, List
+
+from blackjack import (
+    MAX_PLAYERS, PAYOUT_MULTIPLIERS, SHOE_DECKS, SHOE_PENETRATION, Card, Hand, MultiPlayerGame, Shoe,
+)
+
+class InMemoryLedger:
+    """Registre de soldes en mémoire, réglé comme DatabaseManager.settle_game"""
+
+    def __init__(self, initial_balance: int = 1500):
+        self.initial_balance = initial_balance
+        self.balances: Dict[int, int] = {}
+        self.wagered = 0
+        self.results = Counter()
+
+    def get_balance(self, user_id: int) -> int:
+        return self.balances.setdefault(user_id, self.initial_balance)
+
+    def set_balance(self, user_id: int, new_balance: int) -> bool:
+        self.balances[user_id] = new_balance
+        return True
+
+    def settle_game(self, results: List[tuple]) -> bool:
+        """Applique les résultats (user_id, mise, résultat) d'une partie"""
+        for user_id, bet_amount, result in results:
+            winnings = int(bet_amount * PAYOUT_MULTIPLIERS.get(result, 0))
+            self.balances[user_id] = self.get_balance(user_id) + winnings - bet_amount
+            self.wagered += bet_amount
+            self.results[result] += 1
+        return True
+
+    def net(self) -> int:
+        """Gain net cumulé de tous les joueurs"""
+        return sum(self.balances.values()) - self.initial_balance * len(self.balances)
+
+# Une stratégie reçoit la main en cours, la carte visible du croupier et
+# la possibilité de splitter, et renvoie 'hit', 'stand' ou 'split'
+def strategy_dealer(hand: Hand, upcard: Card, can_split: bool) -> str:
+    """Joue comme le croupier : tire jusqu'à 17"""
+    return 'hit' if hand.total < 17 else 'stand'
+
+def strategy_cautious(hand: Hand, upcard: Card, can_split: bool) -> str:
+    """Ne prend jamais le risque de dépasser 21"""
+    return 'hit' if hand.total < 12 else 'stand'
+
+def strategy_basic(hand: Hand, upcard: Card, can_split: bool) -> str:
+    """Stratégie de base simplifiée (sans double), splitte les as et les 8"""
+    if can_split and hand[0].rank in ('A', '8'):
+        return 'split'
+    total = hand.total
+    dealer_value = 11 if upcard.is_ace else upcard.value
+    if total <= 11:
+        return 'hit'
+    if total >= 17:
+        return 'stand'
+    if total == 12:
+        return 'stand' if 4 <= dealer_value <= 6 else 'hit'
+    return 'stand' if dealer_value <= 6 else 'hit'
+
+STRATEGIES: Dict[str, Callable] = {
+    'croupier': strategy_dealer,
+    'prudent': strategy_cautious,
+    'basique': strategy_basic,
+}
+
+def play_round(game: MultiPlayerGame, ledger: InMemoryLedger, strategy: Callable, allow_split: bool) -> None:
+    """Joue une manche complète jusqu'au règlement"""
+    game.start_game()
+    upcard = game.dealer_hand[0]
+
+    while game.game_status == 'playing':
+        player_id = game.get_current_player_id()
+        if player_id is None:
+            break
+        player_data = game.players[player_id]
+        hand = player_data[player_data.get('current_hand', 'hand')]
+        can_split = (
+            allow_split and 'second_hand' not in player_data
+            and game.can_split(player_id, ledger.get_balance(player_id))
+        )
+        action = strategy(hand, upcard, can_split)
+
+        if action == 'split' and can_split:
+            # Comme dans le bot, split_hand vérifie le solde réel et la mise
+            # supplémentaire n'est prélevée que si le split a eu lieu
+            if game.split_hand(player_id, ledger.get_balance(player_id)):
+                ledger.set_balance(player_id, ledger.get_balance(player_id) - player_data['bet'])
+        elif action == 'hit':
+            game.hit(player_id)
+        else:
+            game.stand(player_id)
+
+    ledger.settle_game(game.settlement)
+
+def run_simulation(rounds: int, players: int, strategy: Callable, bet: int = 10,
+                   allow_split: bool = True, decks: int = SHOE_DECKS,
+                   penetration: float = SHOE_PENETRATION) -> dict:
+    """Enchaîne les manches sur un même sabot et mesure le débit"""
+    ledger = InMemoryLedger()
+    shoe = Shoe(decks, penetration)
+    player_ids = range(1, players + 1)
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        game = MultiPlayerGame(1, shoe=shoe)
+        for player_id in player_ids:
+            game.add_player(player_id, bet)
+        play_round(game, ledger, strategy, allow_split)
+    elapsed = time.perf_counter() - start
+
+    hands = sum(ledger.results.values())
+    return {
+        'rounds': rounds,
+        'hands': hands,
+        'elapsed': elapsed,
+        'hands_per_sec': hands / elapsed if elapsed else 0.0,
+        'rounds_per_sec': rounds / elapsed if elapsed else 0.0,
+        'return': ledger.net() / ledger.wagered if ledger.wagered else 0.0,
+        'results': dict(ledger.results),
+    }
+
+def print_report(report: dict) -> None:
+    print(f"🎲 {report['rounds']} manches, {report['hands']} mains en {report['elapsed']:.2f}s")
+    print(f"├ {report['hands_per_sec']:,.0f} mains/s")
+    print(f"├ {report['rounds_per_sec']:,.0f} manches/s")
+    print(f"└ Rendement joueurs : {report['return'] * 100:+.2f}%")
+    for result, count in sorted(report['results'].items()):
+        print(f"   • {result}: {count} ({count / report['hands'] * 100:.1f}%)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulation hors ligne du blackjack multijoueur")
+    parser.add_argument('--rounds', type=int, default=100000)
+    parser.add_argument('--players', type=int, default=7, choices=range(1, MAX_PLAYERS + 1), metavar=f"1-{MAX_PLAYERS}")
+    parser.add_argument('--strategy', choices=sorted(STRATEGIES), default='basique')
+    parser.add_argument('--bet', type=int, default=10)
+    parser.add_argument('--no-split', action='store_true', help="Désactive les splits")
+    parser.add_argument('--decks', type=int, default=SHOE_DECKS)
+    parser.add_argument('--penetration', type=float, default=SHOE_PENETRATION)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    report = run_simulation(
+        args.rounds, args.players, STRATEGIES[args.strategy], bet=args.bet,
+        allow_split=not args.no_split, decks=args.decks, penetration=args.penetration,
+    )
+    print_report(report)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def main(tmp_path_factory):
+    """Module main du bot ; ignoré si ses dépendances (telegram, pytz...) manquent"""
+    pytest.importorskip("telegram")
+    # L'import ouvre la base par défaut (blackjack.db) dans le répertoire courant
+    with pytest.MonkeyPatch.context() as mp:
+        mp.chdir(tmp_path_factory.mktemp("main"))
+        return pytest.importorskip("main")
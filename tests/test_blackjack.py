@@ -0,0 +1,38 @@
+from blackjack import CARDS, RANKS, Hand, MultiPlayerGame
+
+
+def card(rank):
+    return CARDS[RANKS.index(rank) * 4]
+
+
+def hand(*ranks):
+    return Hand(card(rank) for rank in ranks)
+
+
+def test_hand_totals_count_one_ace_as_eleven_when_possible():
+    assert hand('A', 'K').total == 21
+    assert hand('A', '6').total == 17
+    assert hand('A', '6', '9').total == 16
+    assert hand('A', 'A', '9').total == 21
+    assert hand('K', 'Q', '5').total == 25
+
+
+def test_hand_totals_follow_append_and_pop():
+    cards = hand('A', '5')
+    cards.append(card('K'))
+    assert cards.total == 16
+    assert cards.pop().rank == 'K'
+    assert cards.total == 16
+
+
+def test_split_requires_a_pair_and_enough_balance_for_both_bets():
+    game = MultiPlayerGame(1)
+    game.add_player(1, 100)
+    game.players[1]['hand'] = hand('8', '8')
+    assert not game.split_hand(1, 199)
+    assert game.split_hand(1, 200)
+    assert game.players[1]['hand'][0].rank == '8'
+    assert game.players[1]['second_hand'][0].rank == '8'
+
+    game.players[1]['hand'] = hand('8', '9')
+    assert not game.can_split(1, 1000)
@@ -0,0 +1,39 @@
+import pytest
+
+
+@pytest.fixture
+def database(main, tmp_path):
+    manager = main.DatabaseManager(str(tmp_path / "test.db"), write_behind=True)
+    manager.register_user(1, "alice")
+    yield manager
+    manager.close()
+
+
+def test_reads_see_queued_settlements(main, database):
+    start = database.get_balance(1)
+    database.settle_game([(1, 100, 'win')])
+    assert database.has_pending_results()
+    assert database.get_balance(1) == start + int(100 * main.PAYOUT_MULTIPLIERS['win']) - 100
+    assert not database.has_pending_results()
+
+
+def test_set_balance_is_not_overwritten_by_a_queued_settlement(database):
+    database.settle_game([(1, 100, 'lose')])
+    database.set_balance(1, 5000)
+    database.flush_results()
+    assert database.get_balance(1) == 5000
+
+
+def test_claim_daily_applies_queued_settlements_first(database):
+    start = database.get_balance(1)
+    database.settle_game([(1, 100, 'lose')])
+    database.claim_daily(1, 1000)
+    assert database.get_balance(1) == start - 100 + 1000
+
+
+def test_adjust_balance_is_relative_and_refuses_negative_balances(database):
+    start = database.get_balance(1)
+    database.settle_game([(1, 100, 'lose')])
+    assert database.adjust_balance(1, 250) == start - 100 + 250
+    assert database.adjust_balance(1, -(start + 1000)) is None
+    assert database.get_balance(1) == start + 150
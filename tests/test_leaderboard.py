@@ -0,0 +1,42 @@
+import pytest
+
+
+@pytest.fixture
+def leaderboard(main):
+    board = main.Leaderboard()
+    board.load([(user_id, f"user{user_id}", 1000 + 100 * user_id) for user_id in range(1, 26)])
+    return board
+
+
+def test_pages_follow_the_key_in_both_directions(leaderboard):
+    start, first = leaderboard.page(limit=10)
+    assert start == 1
+    assert [user_id for user_id, _, _ in first] == list(range(25, 15, -1))
+
+    last_id, _, last_balance = first[-1]
+    start, second = leaderboard.page((last_balance, last_id), limit=10)
+    assert start == 11
+    assert second[0][0] == 15
+
+    first_id, _, first_balance = second[0]
+    start, previous = leaderboard.page((first_balance, first_id), limit=10, backward=True)
+    assert (start, previous) == (1, first)
+
+
+def test_update_moves_a_player_and_keeps_positions_consistent(leaderboard):
+    leaderboard.update(1, "user1", 10000)
+    assert leaderboard.position(1) == 1
+    assert leaderboard.at(1) == (1, "user1", 10000)
+    assert leaderboard.position(25) == 2
+    assert len(leaderboard) == 25
+
+    leaderboard.update(26, "newcomer", 0)
+    assert leaderboard.position(26) == 26
+    assert leaderboard.top(1) == [("user1", 10000)]
+
+
+def test_equal_balances_are_ordered_by_user_id(main):
+    board = main.Leaderboard()
+    board.load([(3, "c", 500), (1, "a", 500), (2, "b", 500)])
+    assert [board.at(position)[0] for position in (1, 2, 3)] == [1, 2, 3]
+    assert board.position(4) is None